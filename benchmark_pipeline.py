@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tracemalloc
+
+import data_loading
+import stage2source
+import source2curated
+import curated2model
+import sales_rollups
+from generate_sales_data import generate
+from pipeline_backend import PIPELINE_BACKEND, MODEL_VERSION_TABLE, get_snowpark_session, create_local_session, \
+    truncate_table
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+BENCHMARK_SCALES = [0.1, 1.0]
+BENCHMARK_WORKDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench-data')
+# A stage is flagged when its rows/second drops more than this fraction below the baseline
+REGRESSION_TOLERANCE = 0.2
+
+# Tables the pipeline appends to; emptied between scales on Snowflake so every scale starts from the same state
+PIPELINE_TABLES = [
+    "sales_dwh.source.in_sales_order", "sales_dwh.source.us_sales_order", "sales_dwh.source.fr_sales_order",
+    "sales_dwh.curated.in_sales_order", "sales_dwh.curated.us_sales_order", "sales_dwh.curated.fr_sales_order",
+    "sales_dwh.consumption.region_dim", "sales_dwh.consumption.product_dim", "sales_dwh.consumption.promo_code_dim",
+    "sales_dwh.consumption.customer_dim", "sales_dwh.consumption.payment_dim", "sales_dwh.consumption.date_dim",
+    "sales_dwh.consumption.sales_fact"
+]
+# Run state the stages create on first use; left in place, a scale would curate or load incrementally on top of
+# the previous one's watermarks, model version and rollup
+PIPELINE_STATE_TABLES = [
+    source2curated.WATERMARK_TABLE, curated2model.FACT_WATERMARK_TABLE, MODEL_VERSION_TABLE,
+    sales_rollups.ROLLUP_TABLE, sales_rollups.ROLLUP_PENDING_TABLE
+]
+# Stage path the sales files are PUT under; cleared so a scale's COPYs never see the previous scale's files
+SALES_STAGE_PATH = '@sales_dwh.source.my_internal_stg/sales'
+
+def timed_stage(name, input_rows, run) -> dict:
+    """Run one stage, returning wall time, rows/second and peak client memory"""
+    logging.info(f"[bench] {name}...")
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    metrics = run()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    written = sum((metrics or {}).get("rows", {}).values())
+    result = {
+        "stage": name,
+        "seconds": round(seconds, 3),
+        "input_rows": input_rows,
+        "rows_written": written,
+        "rows_per_second": round(input_rows / seconds, 1) if seconds else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 1)
+    }
+    logging.info(f"[bench] ✓ {name}: {result['seconds']}s, {result['rows_per_second']} rows/s, "
+                 f"{result['peak_memory_mb']} MB peak")
+    return result
+
+def reset_tables(session) -> None:
+    """Empty the pipeline tables, run state and staged files so a scale does not measure the previous scale's leftovers"""
+    for table in PIPELINE_TABLES:
+        truncate_table(session, table)
+    for table in PIPELINE_STATE_TABLES:
+        session.sql(f"TRUNCATE TABLE IF EXISTS {table}").collect()
+    session.sql(f"REMOVE {SALES_STAGE_PATH}").collect()
+
+def run_scale(scale, workdir, backend, parquet=False, generator_args=None) -> dict:
+    """Generate one scale's data and time every pipeline stage on it"""
+    data_dir = os.path.join(workdir, f"scale-{scale}")
+    sales_dir = os.path.join(data_dir, 'sales')
+    generator_args = generator_args or {}
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    rows = generate(data_dir, scale, **generator_args)
+    input_rows = sum(rows.values())
+    stages = [{"stage": "generate", "seconds": round(time.perf_counter() - start, 3), "input_rows": input_rows,
+               "rows_written": input_rows, "rows_per_second": None, "peak_memory_mb": None}]
+
+    if backend == 'local':
+        session = create_local_session(data_dir)
+        if parquet:
+            def convert():
+                scanned = data_loading.scan_sales_directory(sales_dir)
+                for ext in ('.csv', '.json'):
+                    data_loading.convert_sales_to_parquet(*scanned[ext], data_loading.default_parquet_directory(sales_dir))
+            stages.append(timed_stage("data_loading", input_rows, convert))
+    else:
+        session = get_snowpark_session()
+        reset_tables(session)
+        manifest_path = os.path.join(data_dir, '.sales_upload_manifest.json')
+        stages.append(timed_stage("data_loading", input_rows, lambda: data_loading.main(
+            sales_dir, manifest_path, force=True, to_parquet=parquet)))
+
+    try:
+        stages.append(timed_stage("stage2source", input_rows, lambda: stage2source.main(parquet=parquet, session=session)))
+        stages.append(timed_stage("source2curated", input_rows, lambda: source2curated.main(session=session)))
+        stages.append(timed_stage("curated2model", input_rows, lambda: curated2model.main(session=session)))
+    finally:
+        session.close()
+
+    return {"scale": scale, "backend": backend, "input_rows": input_rows, "stages": stages}
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE) -> list:
+    """Stages whose rows/second fell more than `tolerance` below the baseline at the same scale"""
+    baseline_rates = {(run["scale"], stage["stage"]): stage["rows_per_second"]
+                      for run in baseline.get("runs", []) for stage in run["stages"]}
+    regressions = []
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            before = baseline_rates.get((run["scale"], stage["stage"]))
+            after = stage["rows_per_second"]
+            if before and after and after < before * (1 - tolerance):
+                regressions.append(f"scale {run['scale']} {stage['stage']}: {before} → {after} rows/s")
+    return regressions
+
+def log_results(results) -> None:
+    """Log one line per scale and stage"""
+    logging.info("=" * 60)
+    logging.info(f"Benchmark results ({results['backend']} backend, peak RSS {results['max_rss_mb']} MB):")
+    for run in results["runs"]:
+        logging.info(f"  scale {run['scale']} ({run['input_rows']} rows)")
+        for stage in run["stages"]:
+            rate = f"{stage['rows_per_second']} rows/s" if stage["rows_per_second"] else "-"
+            memory = f"{stage['peak_memory_mb']} MB" if stage["peak_memory_mb"] is not None else "-"
+            logging.info(f"    {stage['stage']:<15} {stage['seconds']:>9.2f}s  {rate:>18}  {memory:>10}")
+    logging.info("=" * 60)
+
+def main(scales=BENCHMARK_SCALES, workdir=BENCHMARK_WORKDIR, backend=None, parquet=False, output=None,
+         baseline=None, tolerance=REGRESSION_TOLERANCE, generator_args=None):
+    backend = backend or PIPELINE_BACKEND
+    # Peak memory is the client side only: on Snowflake the warehouse does the heavy lifting
+    tracemalloc.start()
+    try:
+        runs = [run_scale(scale, workdir, backend, parquet, generator_args) for scale in scales]
+    finally:
+        tracemalloc.stop()
+
+    # ru_maxrss is KB on Linux
+    results = {"backend": backend, "parquet": parquet, "runs": runs,
+               "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    log_results(results)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1)
+        logging.info(f"✓ Results written to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        for regression in regressions:
+            logging.warning(f"⚠ Regression: {regression}")
+        if not regressions:
+            logging.info(f"✓ No stage more than {tolerance:.0%} slower than {baseline}")
+        results["regressions"] = regressions
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on generated data at several scale factors")
+    parser.add_argument("--scales", default=",".join(str(s) for s in BENCHMARK_SCALES),
+                        help="comma-separated scale factors (1.0 = sample data volume)")
+    parser.add_argument("--workdir", default=BENCHMARK_WORKDIR, help="directory the generated data is written to")
+    parser.add_argument("--backend", choices=["local", "snowflake"], default=None,
+                        help="execution backend (default: PIPELINE_BACKEND)")
+    parser.add_argument("--parquet", action="store_true", help="convert India/France to Parquet and load that instead")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="earlier --output file to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="allowed rows/second drop against the baseline before a stage is flagged")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.02, help="generator duplicate ORDER_ID ratio")
+    parser.add_argument("--skew", type=float, default=1.0, help="generator customer/product skew")
+    parser.add_argument("--seed", type=int, default=42, help="generator random seed")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = main([float(s) for s in args.scales.split(",")], args.workdir, args.backend, args.parquet, args.output,
+                   args.baseline, args.tolerance,
+                   {"duplicate_ratio": args.duplicate_ratio, "skew": args.skew, "seed": args.seed})
+    sys.exit(1 if results.get("regressions") else 0)
@@ -1,23 +1,10 @@
-from snowflake.snowpark import Session
+from pipeline_backend import get_snowpark_session
 import sys
 import logging
 
 # initiate logging at info level
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
 
-# snowpark session
-def get_snowpark_session() -> Session:
-    connection_parameters = {
-       "ACCOUNT": "QNNERMQ-RZ07987",
-       "USER": "snowpark_user",
-       "PASSWORD": os.getenv("SNOWFLAKE_PASSWORD", "YOUR_PASSWORD_HERE"),
-       "ROLE": "SYSADMIN",
-       "DATABASE": "sales_dwh",
-       "WAREHOUSE": "SNOWPARK_ETL_WH"
-    }
-    # creating snowflake session object
-    return Session.builder.configs(connection_parameters).create()   
-
 def main():
     session = get_snowpark_session()
 
@@ -1,47 +1,135 @@
+import os
 import sys
+import time
 import logging
+import argparse
 import pandas as pd
+from datetime import datetime, timedelta
+from functools import partial
 
-from snowflake.snowpark import Session, DataFrame, CaseExpr
-from snowflake.snowpark.functions import col, lit, row_number, rank, split, cast, when, expr, min, max
+from snowflake.snowpark import DataFrame, CaseExpr
+from snowflake.snowpark.functions import col, lit, row_number, rank, split, cast, when, coalesce, min, max, count, count_distinct, \
+    when_matched, when_not_matched
 from snowflake.snowpark.types import StructType, StringType, StructField, LongType, DecimalType, DateType, TimestampType, IntegerType
 from snowflake.snowpark import Window
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from pipeline_metrics import stage_metrics, record_rows, insert_into, submit_insert, collect_insert, query_step
+from pipeline_backend import get_snowpark_session, is_local, ensure_sequence, with_sequence_key, with_hash_key, hash_key, \
+    merge_into, read_watermarks, save_watermarks, ensure_table, truncate_table, ensure_clustering_keys, bump_model_version, \
+    read_model_key_strategy
+from sales_rollups import mark_touched_dates, refresh_rollup
 
 # Initiate logging at info level
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
 
-# Snowpark session
-def get_snowpark_session() -> Session:
-    connection_parameters = {
-        "ACCOUNT": "QNNERMQ-RZ07987",
-        "USER": "snowpark_user",
-        "PASSWORD": os.getenv("SNOWFLAKE_PASSWORD", "YOUR_PASSWORD_HERE"),
-        "ROLE": "SYSADMIN",
-        "DATABASE": "sales_dwh",
-        "WAREHOUSE": "SNOWPARK_ETL_WH"
-    }
-    return Session.builder.configs(connection_parameters).create()   
+# Curated columns the dimension and fact builds read
+CURATED_MODEL_COLUMNS = [
+    "SALES_ORDER_KEY", "ORDER_ID", "ORDER_DT", "CUSTOMER_NAME", "MOBILE_KEY", "COUNTRY", "REGION", "ORDER_QUANTITY",
+    "PROMOTION_CODE", "LOCAL_TOTAL_ORDER_AMT", "LOCAL_TAX_AMT", "EXCHANGE_RATE", "USD_TOTAL_ORDER_AMT",
+    "USD_TAX_AMT", "PAYMENT_METHOD", "PAYMENT_PROVIDER", "CONTACT_NO", "SHIPPING_ADDRESS"
+]
+
+def curated_sales_df(session) -> DataFrame:
+    """Union the three curated tables once, NA-fill promotion_code and materialize the result for the run"""
+    in_sales_df = session.table("sales_dwh.curated.in_sales_order")
+    us_sales_df = session.table("sales_dwh.curated.us_sales_order")
+    fr_sales_df = session.table("sales_dwh.curated.fr_sales_order")
+    all_sales_df = in_sales_df.union_all(us_sales_df).union_all(fr_sales_df)
+
+    all_sales_df = all_sales_df.select(
+        *[coalesce(col(c), lit('NA')).as_(c) if c == "PROMOTION_CODE" else col(c) for c in CURATED_MODEL_COLUMNS]
+    )
+    # A session-scoped temp table: the six dimensions and the fact build scan it instead of re-running the union
+    return all_sales_df.cache_result()
+
+# Surrogate key column and natural key of each dimension; the hash key strategy derives the key
+# from the natural key, so the fact table can compute its foreign keys without joining the dimensions
+DIMENSION_KEYS = {
+    "date_dim": ("date_id_pk", ["order_dt"]),
+    "region_dim": ("region_id_pk", ["country", "region"]),
+    "product_dim": ("product_id_pk", ["mobile_key"]),
+    "promo_code_dim": ("promo_code_id_pk", ["promotion_code", "country", "region"]),
+    "customer_dim": ("customer_id_pk", ["customer_name", "contact_no", "shipping_address", "country", "region"]),
+    "payment_dim": ("payment_id_pk", ["payment_method", "payment_provider", "country", "region"])
+}
+KEY_STRATEGIES = ["sequence", "hash"]
+
+# Incremental fact loads: curated rows keep their source SALES_ORDER_KEY, which only grows
+FACT_WATERMARK_TABLE = "sales_dwh.consumption.sales_fact_watermark"
+FACT_WATERMARK_COLUMN = "SALES_ORDER_KEY"
+
+# Dimension join fan-out: abort the fact load, or set the orders hitting a duplicated natural key aside
+FAN_OUT_ACTIONS = ["abort", "quarantine"]
+FACT_QUARANTINE_TABLE = "sales_dwh.consumption.sales_fact_quarantine"
+FACT_QUARANTINE_SCHEMA = StructType([
+    StructField("ORDER_CODE", StringType()),
+    StructField("DIMENSION", StringType()),
+    StructField("QUARANTINED_AT", TimestampType())
+])
+
+# Dimensions in sales_fact foreign key column order (the INSERT is positional)
+FACT_DIMENSIONS = ["date_dim", "region_dim", "customer_dim", "payment_dim", "product_dim", "promo_code_dim"]
+# Fact measures carried over from the curated set as-is
+FACT_MEASURES = ["order_quantity", "local_total_order_amt", "local_tax_amt", "exchange_rate", "usd_total_order_amt", "usd_tax_amt"]
+
+def dimensions_have_rows(session) -> bool:
+    """True when any fact dimension table exists and holds rows"""
+    for dimension in FACT_DIMENSIONS:
+        try:
+            if session.table(f"sales_dwh.consumption.{dimension}").limit(1).collect():
+                return True
+        except SnowparkSQLException:
+            continue
+    return False
+
+def check_key_strategy(session, key_strategy, full_refresh=False) -> None:
+    """Refuse to mix surrogate key strategies in one model; --full-refresh empties the model to rebuild it instead"""
+    built_with = read_model_key_strategy(session)
+    if built_with is None:
+        # A model loaded before the strategy was recorded was built from the sequences, the only strategy back then
+        if not dimensions_have_rows(session):
+            return
+        built_with = "sequence"
+    if built_with == key_strategy:
+        return
+    if not full_refresh:
+        raise RuntimeError(f"The consumption model was loaded with {built_with} keys; rerun with --key-strategy {built_with}, "
+                           f"or with --full-refresh to rebuild it with {key_strategy} keys")
+    logging.warning(f"⚠ Rebuilding the consumption model with {key_strategy} keys (was {built_with}): "
+                    f"emptying the dimensions and sales_fact")
+    for table in FACT_DIMENSIONS + ["sales_fact"]:
+        truncate_table(session, f"sales_dwh.consumption.{table}")
+
+def with_dimension_key(session, df, dimension, key_strategy="sequence") -> DataFrame:
+    """Prepend a dimension's surrogate key from its sequence or as a hash of its natural key"""
+    key_column, natural_key = DIMENSION_KEYS[dimension]
+    if key_strategy == "hash":
+        return with_hash_key(df, key_column, natural_key)
+    return with_sequence_key(session, df, f"sales_dwh.consumption.{dimension}_seq", key_column)
 
 # Region Dimension
-def create_region_dim(all_sales_df, session) -> None:
+def create_region_dim(all_sales_df, session, block=True, key_strategy="sequence"):
     logging.info("Creating Region Dimension...")
     
     region_dim_df = all_sales_df.groupBy(col("Country"), col("Region")).count()
     region_dim_df = region_dim_df.with_column("isActive", lit('Y'))
-    region_dim_df = region_dim_df.selectExpr("sales_dwh.consumption.region_dim_seq.nextval as region_id_pk", "Country", "Region", "isActive") 
+    region_dim_df = region_dim_df.select("Country", "Region", "isActive")
     
-    existing_region_dim_df = session.sql("select Country, Region from sales_dwh.consumption.region_dim")
-    region_dim_df = region_dim_df.join(existing_region_dim_df, ["Country", "Region"], join_type='leftanti')
+    existing_region_dim_df = session.table("sales_dwh.consumption.region_dim").select("Country", "Region")
+    region_dim_df = without_matches(region_dim_df, existing_region_dim_df, ["Country", "Region"])
+    region_dim_df = with_dimension_key(session, region_dim_df, "region_dim", key_strategy)
     
-    insert_cnt = int(region_dim_df.count())
+    if not block:
+        return submit_insert(session, region_dim_df, "sales_dwh.consumption.region_dim")
+    insert_cnt = insert_into(session, region_dim_df, "sales_dwh.consumption.region_dim")
     if insert_cnt > 0:
-        region_dim_df.write.save_as_table("sales_dwh.consumption.region_dim", mode="append")
         logging.info(f"✓ Region Dimension: {insert_cnt} rows inserted")
     else:
         logging.info("✓ Region Dimension: No new records to insert")
+    return insert_cnt
 
 # Product Dimension
-def create_product_dim(all_sales_df, session) -> None:
+def create_product_dim(all_sales_df, session, block=True, key_strategy="sequence"):
     logging.info("Creating Product Dimension...")
     
     product_dim_df = all_sales_df.with_column("Brand", split(col('MOBILE_KEY'), lit('/'))[0]) \
@@ -61,20 +149,23 @@ def create_product_dim(all_sales_df, session) -> None:
     product_dim_df = product_dim_df.groupBy(col('mobile_key'), col("Brand"), col("Model"), col("Color"), col("Memory")).count()
     product_dim_df = product_dim_df.with_column("isActive", lit('Y'))
     
-    existing_product_dim_df = session.sql("select mobile_key, Brand, Model, Color, Memory from sales_dwh.consumption.product_dim")
-    product_dim_df = product_dim_df.join(existing_product_dim_df, ["mobile_key", "Brand", "Model", "Color", "Memory"], join_type='leftanti')
+    existing_product_dim_df = session.table("sales_dwh.consumption.product_dim").select("mobile_key", "Brand", "Model", "Color", "Memory")
+    product_dim_df = without_matches(product_dim_df, existing_product_dim_df, ["mobile_key", "Brand", "Model", "Color", "Memory"])
     
-    product_dim_df = product_dim_df.selectExpr("sales_dwh.consumption.product_dim_seq.nextval as product_id_pk", "mobile_key", "Brand", "Model", "Color", "Memory", "isActive") 
+    product_dim_df = product_dim_df.select("mobile_key", "Brand", "Model", "Color", "Memory", "isActive")
+    product_dim_df = with_dimension_key(session, product_dim_df, "product_dim", key_strategy)
     
-    insert_cnt = int(product_dim_df.count())
+    if not block:
+        return submit_insert(session, product_dim_df, "sales_dwh.consumption.product_dim")
+    insert_cnt = insert_into(session, product_dim_df, "sales_dwh.consumption.product_dim")
     if insert_cnt > 0:
-        product_dim_df.write.save_as_table("sales_dwh.consumption.product_dim", mode="append")
         logging.info(f"✓ Product Dimension: {insert_cnt} rows inserted")
     else:
         logging.info("✓ Product Dimension: No new records to insert")
+    return insert_cnt
 
 # Promo Code Dimension
-def create_promocode_dim(all_sales_df, session) -> None:
+def create_promocode_dim(all_sales_df, session, block=True, key_strategy="sequence"):
     logging.info("Creating Promo Code Dimension...")
     
     # Check if promotion_code exists in source
@@ -85,16 +176,14 @@ def create_promocode_dim(all_sales_df, session) -> None:
     
     if country_src is None or region_src is None:
         logging.error("❌ Error in create_promocode_dim: country or region column not found in source")
-        return
+        return 0
     
     # If promotion_code doesn't exist, create with 'NA'
     if promo_src is None:
         logging.warning("⚠ promotion_code column not found in source, using 'NA' as default")
         promo_code_df = all_sales_df.with_column("promotion_code", lit('NA'))
     else:
-        promo_code_df = all_sales_df.with_column("promotion_code",
-                                                 when(col(promo_src).isNull(), lit('NA'))
-                                                 .otherwise(col(promo_src)))
+        promo_code_df = all_sales_df.with_column("promotion_code", coalesce(col(promo_src), lit('NA')))
     
     # Normalize columns
     promo_code_df = promo_code_df.select(
@@ -107,7 +196,7 @@ def create_promocode_dim(all_sales_df, session) -> None:
     promo_code_dim_df = promo_code_dim_df.with_column("isActive", lit('Y'))
     
     # Read existing and compare
-    existing_promo_df = session.sql("select * from sales_dwh.consumption.promo_code_dim")
+    existing_promo_df = session.table("sales_dwh.consumption.promo_code_dim")
     existing_map = {c.lower(): c for c in existing_promo_df.columns}
     existing_promo_col = existing_map.get("promotion_code") or existing_map.get("promo_code")
     existing_country_col = existing_map.get("country")
@@ -116,35 +205,32 @@ def create_promocode_dim(all_sales_df, session) -> None:
     if existing_promo_col is None or existing_country_col is None or existing_region_col is None:
         logging.warning("⚠ promo_code_dim table missing expected columns. Recreating table...")
         
-        promo_code_dim_df = promo_code_dim_df.with_column("promo_code_id_pk", expr("sales_dwh.consumption.promo_code_dim_seq.nextval"))
-        promo_code_dim_df = promo_code_dim_df.select("promo_code_id_pk", "promotion_code", "country", "region", "isActive")
+        promo_code_dim_df = promo_code_dim_df.select("promotion_code", "country", "region", "isActive")
+        promo_code_dim_df = with_dimension_key(session, promo_code_dim_df, "promo_code_dim", key_strategy)
         
         promo_code_dim_df.write.save_as_table("sales_dwh.consumption.promo_code_dim", mode="overwrite")
-        logging.info(f"✓ Promo Code Dimension: Recreated table with {promo_code_dim_df.count()} rows")
-        return
+        # Table-level count is answered from metadata instead of re-running the plan
+        insert_cnt = session.table("sales_dwh.consumption.promo_code_dim").count()
+        logging.info(f"✓ Promo Code Dimension: Recreated table with {insert_cnt} rows")
+        return insert_cnt
     
-    # Explicit join condition
-    join_cond = (
-        promo_code_dim_df.col("promotion_code") == existing_promo_df.col(existing_promo_col)
-    ) & (
-        promo_code_dim_df.col("country") == existing_promo_df.col(existing_country_col)
-    ) & (
-        promo_code_dim_df.col("region") == existing_promo_df.col(existing_region_col)
-    )
-    promo_code_dim_df = promo_code_dim_df.join(existing_promo_df, join_cond, join_type='leftanti')
+    # get_col resolves the legacy promo_code column name
+    promo_code_dim_df = without_matches(promo_code_dim_df, existing_promo_df, ["promotion_code", "country", "region"])
     
-    promo_code_dim_df = promo_code_dim_df.with_column("promo_code_id_pk", expr("sales_dwh.consumption.promo_code_dim_seq.nextval"))
-    promo_code_dim_df = promo_code_dim_df.select("promo_code_id_pk", "promotion_code", "country", "region", "isActive")
+    promo_code_dim_df = promo_code_dim_df.select("promotion_code", "country", "region", "isActive")
+    promo_code_dim_df = with_dimension_key(session, promo_code_dim_df, "promo_code_dim", key_strategy)
     
-    insert_cnt = int(promo_code_dim_df.count())
+    if not block:
+        return submit_insert(session, promo_code_dim_df, "sales_dwh.consumption.promo_code_dim")
+    insert_cnt = insert_into(session, promo_code_dim_df, "sales_dwh.consumption.promo_code_dim")
     if insert_cnt > 0:
-        promo_code_dim_df.write.save_as_table("sales_dwh.consumption.promo_code_dim", mode="append")
         logging.info(f"✓ Promo Code Dimension: {insert_cnt} rows inserted")
     else:
         logging.info("✓ Promo Code Dimension: No new records to insert")
+    return insert_cnt
     
 # Customer Dimension
-def create_customer_dim(all_sales_df, session) -> None:
+def create_customer_dim(all_sales_df, session, block=True, key_strategy="sequence"):
     logging.info("Creating Customer Dimension...")
     
     # Map source columns to handle case sensitivity
@@ -157,7 +243,7 @@ def create_customer_dim(all_sales_df, session) -> None:
     
     if not all([country_src, region_src, customer_name_src, contact_no_src, shipping_address_src]):
         logging.error("❌ Error in create_customer_dim: one or more required columns not found in source")
-        return
+        return 0
     
     # Group by actual source column names
     customer_dim_df = all_sales_df.groupBy(
@@ -180,7 +266,7 @@ def create_customer_dim(all_sales_df, session) -> None:
         col("isActive")
     )
     
-    existing_customer_dim_df = session.sql("select * from sales_dwh.consumption.customer_dim")
+    existing_customer_dim_df = session.table("sales_dwh.consumption.customer_dim")
     existing_cols_map = {c.lower(): c for c in existing_customer_dim_df.columns}
     
     target_customer_name = existing_cols_map.get("customer_name")
@@ -191,48 +277,152 @@ def create_customer_dim(all_sales_df, session) -> None:
     
     if not all([target_customer_name, target_contact_no, target_shipping_address, target_country, target_region]):
         logging.error("❌ Error in create_customer_dim: Target table missing required columns")
-        return
+        return 0
 
-    join_cond = (
-        (customer_dim_df.col("customer_name") == existing_customer_dim_df.col(target_customer_name)) &
-        (customer_dim_df.col("contact_no") == existing_customer_dim_df.col(target_contact_no)) &
-        (customer_dim_df.col("shipping_address") == existing_customer_dim_df.col(target_shipping_address)) &
-        (customer_dim_df.col("country") == existing_customer_dim_df.col(target_country)) &
-        (customer_dim_df.col("region") == existing_customer_dim_df.col(target_region))
-    )
-    customer_dim_df = customer_dim_df.join(existing_customer_dim_df, join_cond, join_type='leftanti')
+    # A customer with no contact number matches its existing row instead of being inserted again
+    customer_dim_df = without_matches(customer_dim_df, existing_customer_dim_df,
+                                      ["customer_name", "contact_no", "shipping_address", "country", "region"])
     
-    customer_dim_df = customer_dim_df.selectExpr("sales_dwh.consumption.customer_dim_seq.nextval as customer_id_pk", "customer_name", "contact_no", "shipping_address", "country", "region", "isActive") 
+    customer_dim_df = customer_dim_df.select("customer_name", "contact_no", "shipping_address", "country", "region", "isActive")
+    customer_dim_df = with_dimension_key(session, customer_dim_df, "customer_dim", key_strategy)
     
-    insert_cnt = int(customer_dim_df.count())
+    if not block:
+        return submit_insert(session, customer_dim_df, "sales_dwh.consumption.customer_dim")
+    insert_cnt = insert_into(session, customer_dim_df, "sales_dwh.consumption.customer_dim")
     if insert_cnt > 0:
-        customer_dim_df.write.save_as_table("sales_dwh.consumption.customer_dim", mode="append")
         logging.info(f"✓ Customer Dimension: {insert_cnt} rows inserted")
     else:
         logging.info("✓ Customer Dimension: No new records to insert")
+    return insert_cnt
 
 # Payment Dimension
 
-def create_payment_dim(all_sales_df, session) -> None:
+def create_payment_dim(all_sales_df, session, block=True, key_strategy="sequence"):
     logging.info("Creating Payment Dimension...")
     
     payment_dim_df = all_sales_df.groupBy(col("COUNTRY"), col("REGION"), col("payment_method"), col("payment_provider")).count()
     payment_dim_df = payment_dim_df.with_column("isActive", lit('Y'))
     
-    existing_payment_dim_df = session.sql("select payment_method, payment_provider, country, region from sales_dwh.consumption.payment_dim")
-    payment_dim_df = payment_dim_df.join(existing_payment_dim_df, ["payment_method", "payment_provider", "country", "region"], join_type='leftanti')
+    existing_payment_dim_df = session.table("sales_dwh.consumption.payment_dim").select("payment_method", "payment_provider", "country", "region")
+    payment_dim_df = without_matches(payment_dim_df, existing_payment_dim_df, ["payment_method", "payment_provider", "country", "region"])
     
-    payment_dim_df = payment_dim_df.selectExpr("sales_dwh.consumption.payment_dim_seq.nextval as payment_id_pk", "payment_method", "payment_provider", "country", "region", "isActive") 
+    payment_dim_df = payment_dim_df.select("payment_method", "payment_provider", "country", "region", "isActive")
+    payment_dim_df = with_dimension_key(session, payment_dim_df, "payment_dim", key_strategy)
     
-    insert_cnt = int(payment_dim_df.count())
+    if not block:
+        return submit_insert(session, payment_dim_df, "sales_dwh.consumption.payment_dim")
+    insert_cnt = insert_into(session, payment_dim_df, "sales_dwh.consumption.payment_dim")
     if insert_cnt > 0:
-        payment_dim_df.write.save_as_table("sales_dwh.consumption.payment_dim", mode="append")
         logging.info(f"✓ Payment Dimension: {insert_cnt} rows inserted")
     else:
         logging.info("✓ Payment Dimension: No new records to insert")
+    return insert_cnt
 
 # Date Dimension
-def create_date_dim(all_sales_df, session) -> None:
+# date_dim columns in table order; the fiscal columns are added to older tables on first use
+DATE_DIM_COLUMNS = [
+    "date_id_pk", "order_dt", "day_counter", "order_year", "order_month", "order_quarter", "order_dayofweek",
+    "order_dayname", "order_dayofmonth", "order_weekday", "fiscal_year", "fiscal_quarter", "fiscal_month"
+]
+# Days the calendar is extended past the latest order, so later runs usually find their dates already there
+CALENDAR_HORIZON_DAYS = 0
+# First month of the fiscal year; fiscal years are named after the calendar year they end in
+FISCAL_YEAR_START_MONTH = 1
+
+def calendar_range(session) -> tuple:
+    """First date, last date, distinct date count and highest day_counter of date_dim, from one aggregate"""
+    row = session.table("sales_dwh.consumption.date_dim").select(
+        min("order_dt").alias("first_date"),
+        max("order_dt").alias("last_date"),
+        count_distinct("order_dt").alias("days"),
+        max("day_counter").alias("last_counter")
+    ).collect()[0]
+    days = int(row['DAYS'] or 0)
+    return row['FIRST_DATE'], row['LAST_DATE'], days, int(row['LAST_COUNTER']) if days else 0
+
+def missing_date_ranges(first_date, last_date, existing, needed_start, needed_end, horizon_days=0) -> list:
+    """(start, num_days) ranges that extend a contiguous calendar to cover the needed dates"""
+    if not existing:
+        return [(needed_start, (needed_end - needed_start).days + 1 + horizon_days)]
+    ranges = []
+    if needed_start < first_date:
+        ranges.append((needed_start, (first_date - needed_start).days))
+    if needed_end > last_date:
+        # Only a run that outgrows the calendar extends it, and then by the whole horizon
+        ranges.append((last_date + timedelta(days=1), (needed_end - last_date).days + horizon_days))
+    return ranges
+
+def fiscal_column_sql(fiscal_start_month=FISCAL_YEAR_START_MONTH) -> dict:
+    """SQL for the fiscal attributes of order_dt, shared by the date spine and the backfill of older rows"""
+    fiscal_month = f"MOD(MONTH(order_dt) - {fiscal_start_month} + 12, 12) + 1"
+    return {
+        "fiscal_year": f"YEAR(order_dt) + IFF({fiscal_start_month} > 1 AND MONTH(order_dt) >= {fiscal_start_month}, 1, 0)",
+        "fiscal_quarter": f"FLOOR(({fiscal_month} - 1) / 3) + 1",
+        "fiscal_month": fiscal_month
+    }
+
+def date_spine_df(session, start_dt, num_days, fiscal_start_month=FISCAL_YEAR_START_MONTH, anchor_dt=None) -> DataFrame:
+    """Calendar and fiscal attributes of num_days dates from start_dt; day_counter counts from anchor_dt (day 1)"""
+    anchor_dt = anchor_dt or start_dt
+    # The local backend has no GENERATOR table function, so it builds the same rows client-side
+    if is_local(session):
+        return local_date_spine_df(session, start_dt, num_days, fiscal_start_month, anchor_dt)
+
+    fiscal_columns = ",\n            ".join(f"{expr} AS {name}" for name, expr in fiscal_column_sql(fiscal_start_month).items())
+    return session.sql(f"""
+        WITH date_spine AS (
+            SELECT 
+                DATEADD(day, SEQ4(), '{start_dt}'::DATE) AS order_dt
+            FROM TABLE(GENERATOR(ROWCOUNT => {num_days}))
+        )
+        SELECT 
+            order_dt,
+            DATEDIFF('day', '{anchor_dt}'::DATE, order_dt) + 1 AS day_counter,
+            YEAR(order_dt) AS order_year,
+            MONTH(order_dt) AS order_month,
+            QUARTER(order_dt) AS order_quarter,
+            DAYOFWEEK(order_dt) AS order_dayofweek,
+            DAYNAME(order_dt) AS order_dayname,
+            DAY(order_dt) AS order_dayofmonth,
+            CASE 
+                WHEN DAYOFWEEK(order_dt) IN (0, 6) THEN 'Weekend'
+                ELSE 'Weekday'
+            END AS order_weekday,
+            {fiscal_columns}
+        FROM date_spine
+    """)
+
+def ensure_fiscal_columns(session, fiscal_start_month=FISCAL_YEAR_START_MONTH) -> None:
+    """Add the fiscal attributes to a date_dim created before they existed and fill them in for its older rows"""
+    if is_local(session):
+        return
+    session.sql("""
+        ALTER TABLE sales_dwh.consumption.date_dim ADD COLUMN IF NOT EXISTS
+            fiscal_year NUMBER, fiscal_quarter NUMBER, fiscal_month NUMBER
+    """).collect()
+    # Rows from before the columns existed would otherwise drop out of every fiscal_year filter
+    assignments = ", ".join(f"{name} = {expr}" for name, expr in fiscal_column_sql(fiscal_start_month).items())
+    session.sql(f"""
+        UPDATE sales_dwh.consumption.date_dim SET {assignments}
+        WHERE fiscal_year IS NULL
+    """).collect()
+
+def renumber_day_counter(session, anchor_dt) -> None:
+    """Re-anchor day_counter of the existing calendar on its (new) first date"""
+    if not is_local(session):
+        session.sql(f"""
+            UPDATE sales_dwh.consumption.date_dim
+            SET day_counter = DATEDIFF('day', '{anchor_dt}'::DATE, order_dt) + 1
+        """).collect()
+        return
+    # The local engine has no DATEDIFF in an UPDATE, so the small table is rewritten
+    date_dim = session.table("sales_dwh.consumption.date_dim")
+    dates_pdf = date_dim.to_pandas()
+    dates_pdf["DAY_COUNTER"] = [(order_dt - anchor_dt).days + 1 for order_dt in dates_pdf["ORDER_DT"]]
+    session.create_dataframe(dates_pdf, schema=date_dim.schema).write.save_as_table("sales_dwh.consumption.date_dim", mode="overwrite")
+
+def create_date_dim(all_sales_df, session, block=True, key_strategy="sequence",
+                    horizon_days=CALENDAR_HORIZON_DAYS, fiscal_start_month=FISCAL_YEAR_START_MONTH):
     logging.info("Creating Date Dimension...")
     
     try:
@@ -244,187 +434,419 @@ def create_date_dim(all_sales_df, session) -> None:
         
         start_date = min_max_df['MIN_DATE']
         end_date = min_max_df['MAX_DATE']
+        if start_date is None:
+            logging.info("✓ Date Dimension: No curated orders, nothing to insert")
+            return 0
         
         logging.info(f"Date range: {start_date} to {end_date}")
         
-        # Calculate the number of days (Python calculation)
-        from datetime import datetime
-        start_dt = datetime.strptime(str(start_date), '%Y-%m-%d')
-        end_dt = datetime.strptime(str(end_date), '%Y-%m-%d')
-        num_days = (end_dt - start_dt).days + 1
+        # Only the head and tail missing from the existing calendar are generated
+        start_dt = datetime.strptime(str(start_date), '%Y-%m-%d').date()
+        end_dt = datetime.strptime(str(end_date), '%Y-%m-%d').date()
+        first_date, last_date, existing, last_counter = calendar_range(session)
+        # Before the up-to-date check, so a calendar that no longer grows still gets its older rows filled in
+        ensure_fiscal_columns(session, fiscal_start_month)
+        has_gaps = existing and existing != (last_date - first_date).days + 1
+        if has_gaps:
+            # A calendar with holes is regenerated over its whole span, keeping only the dates it lacks
+            logging.warning(f"⚠ date_dim has gaps between {first_date} and {last_date}, filling them")
+            span_start = start_dt if start_dt < first_date else first_date
+            span_end = end_dt if end_dt > last_date else last_date
+            ranges = [(span_start, (span_end - span_start).days + 1)]
+        else:
+            ranges = missing_date_ranges(first_date, last_date, existing, start_dt, end_dt, horizon_days)
         
-        logging.info(f"Generating {num_days} dates...")
+        if not ranges:
+            logging.info(f"✓ Date Dimension: calendar already covers {first_date} to {last_date}")
+            return 0
         
-        # Use SQL to generate date dimension with CONSTANT rowcount
-        date_gen_sql = f"""
-        WITH date_spine AS (
-            SELECT 
-                DATEADD(day, SEQ4(), '{start_date}'::DATE) AS order_dt
-            FROM TABLE(GENERATOR(ROWCOUNT => {num_days}))
-        ),
-        date_attributes AS (
-            SELECT 
-                order_dt,
-                ROW_NUMBER() OVER (ORDER BY order_dt) AS day_counter,
-                YEAR(order_dt) AS order_year,
-                MONTH(order_dt) AS order_month,
-                QUARTER(order_dt) AS order_quarter,
-                DAY(order_dt) AS order_day,
-                DAYOFWEEK(order_dt) AS order_dayofweek,
-                DAYNAME(order_dt) AS order_dayname,
-                DAY(order_dt) AS order_dayofmonth,
-                CASE 
-                    WHEN DAYOFWEEK(order_dt) IN (0, 6) THEN 'Weekend'
-                    ELSE 'Weekday'
-                END AS order_weekday
-            FROM date_spine
-        )
-        SELECT * FROM date_attributes
-        WHERE order_dt NOT IN (SELECT DISTINCT order_dt FROM sales_dwh.consumption.date_dim)
-        """
+        # day_counter is a running day index from the calendar's first date, so it survives head and tail extensions
+        if existing and ranges[0][0] < first_date:
+            # Only a new first date moves day 1, and then every existing row is renumbered once
+            anchor_dt = ranges[0][0]
+            renumber_day_counter(session, anchor_dt)
+        elif existing:
+            # Later dates carry on from the highest counter, leaving the existing rows untouched
+            anchor_dt = last_date - timedelta(days=last_counter - 1)
+        else:
+            anchor_dt = ranges[0][0]
+        new_dates_df = None
+        for range_start, num_days in ranges:
+            logging.info(f"Generating {num_days} dates from {range_start}...")
+            range_df = date_spine_df(session, range_start, num_days, fiscal_start_month, anchor_dt)
+            new_dates_df = range_df if new_dates_df is None else new_dates_df.union_all(range_df)
+        if has_gaps:
+            existing_dates_df = session.table("sales_dwh.consumption.date_dim").select("order_dt")
+            new_dates_df = new_dates_df.join(existing_dates_df, ["order_dt"], join_type='leftanti')
         
-        # Get new dates to insert
-        new_dates_df = session.sql(date_gen_sql)
-        insert_cnt = new_dates_df.count()
+        # Insert new dates, including date_id_pk generated from sequence
+        new_dates_df = new_dates_df.select(*DATE_DIM_COLUMNS[1:])
+        new_dates_df = with_dimension_key(session, new_dates_df, "date_dim", key_strategy)
+        if not block:
+            return submit_insert(session, new_dates_df, "sales_dwh.consumption.date_dim", DATE_DIM_COLUMNS)
+        insert_cnt = insert_into(session, new_dates_df, "sales_dwh.consumption.date_dim", DATE_DIM_COLUMNS)
         
         if insert_cnt > 0:
-            # Include date_id_pk generated from sequence
-            new_dates_df = new_dates_df.selectExpr(
-                "sales_dwh.consumption.date_dim_seq.nextval as date_id_pk",
-                "order_dt",
-                "day_counter",
-                "order_year",
-                "order_month",
-                "order_quarter",
-                "order_dayofweek",
-                "order_dayname",
-                "order_dayofmonth",
-                "order_weekday"
-            )
-            
-            new_dates_df.write.save_as_table("sales_dwh.consumption.date_dim", mode="append")
             logging.info(f"✓ Date Dimension: {insert_cnt} rows inserted")
         else:
             logging.info("✓ Date Dimension: No new dates to insert")
+        return insert_cnt
             
     except Exception as e:
         logging.error(f"❌ Error in create_date_dim: {str(e)}")
         raise
 
-def main():
+def local_date_spine_df(session, start_dt, num_days, fiscal_start_month=FISCAL_YEAR_START_MONTH, anchor_dt=None) -> DataFrame:
+    """date_spine_df's attributes computed in Python"""
+    anchor_dt = anchor_dt or start_dt
+    rows = []
+    for offset in range(num_days):
+        day = start_dt + timedelta(days=offset)
+        # Snowflake DAYOFWEEK with the default WEEK_START: Sunday = 0 ... Saturday = 6
+        dayofweek = day.isoweekday() % 7
+        fiscal_month = (day.month - fiscal_start_month) % 12 + 1
+        fiscal_year = day.year + (1 if fiscal_start_month > 1 and day.month >= fiscal_start_month else 0)
+        rows.append([
+            day, (day - anchor_dt).days + 1, day.year, day.month, (day.month - 1) // 3 + 1,
+            dayofweek, day.strftime('%a'), day.day, 'Weekend' if dayofweek in (0, 6) else 'Weekday',
+            fiscal_year, (fiscal_month - 1) // 3 + 1, fiscal_month
+        ])
+    return session.create_dataframe(rows, schema=DATE_DIM_COLUMNS[1:])
+
+# Dimension builders in build order; with block=False each submits its INSERT and returns
+# (AsyncJob, post actions), or a row count when it had nothing to submit (create_sales_fact works the same way)
+DIMENSION_BUILDERS = {
+    "date_dim": create_date_dim,
+    "region_dim": create_region_dim,
+    "product_dim": create_product_dim,
+    "promo_code_dim": create_promocode_dim,
+    "customer_dim": create_customer_dim,
+    "payment_dim": create_payment_dim
+}
+
+# seconds between status checks on async dimension INSERTs
+DIM_POLL_SECONDS = 0.5
+
+def build_tables(all_sales_df, session, builders, key_strategy="sequence") -> dict:
+    """Run builders one after another, returning rows inserted per table"""
+    counts = {}
+    for name, build in builders.items():
+        with query_step(session, name):
+            counts[name] = build(all_sales_df, session, key_strategy=key_strategy)
+    return counts
+
+def build_tables_concurrently(all_sales_df, session, builders, key_strategy="sequence", poll_interval=DIM_POLL_SECONDS) -> dict:
+    """Submit every builder's INSERT as an async query and wait on them together"""
+    pending = {}
+    counts = {}
+    errors = {}
+    for name, build in builders.items():
+        started = time.perf_counter()
+        try:
+            # Async queries carry the tag in effect when they are submitted
+            with query_step(session, name):
+                submitted = build(all_sales_df, session, block=False, key_strategy=key_strategy)
+        except Exception as e:
+            errors[name] = e
+            continue
+        if isinstance(submitted, int):
+            counts[name] = submitted
+        else:
+            pending[name] = (submitted, started)
+            logging.info(f"Submitted {name} INSERT (query id {submitted[0].query_id})")
+
+    # The tables are independent, so one failing does not stop the others
+    while pending:
+        for name in list(pending):
+            (job, post_actions), started = pending[name]
+            if not job.is_done():
+                continue
+            del pending[name]
+            try:
+                counts[name] = collect_insert(session, job, post_actions)
+            except Exception as e:
+                errors[name] = e
+                continue
+            logging.info(f"✓ {name}: {counts[name]} rows inserted in {time.perf_counter() - started:.2f}s")
+        if pending:
+            time.sleep(poll_interval)
+
+    for name, e in errors.items():
+        logging.error(f"❌ {name} failed: {str(e)}")
+    if errors:
+        raise RuntimeError(f"Build failed for: {', '.join(errors)}")
+    return {name: counts[name] for name in builders}
+
+def get_col(df, col_name):
+    """Resolve a dimension column case-insensitively"""
+    col_map = {c.lower(): c for c in df.columns}
+    resolved_col = col_map.get(col_name.lower())
+    
+    # Handle potential column name mismatches
+    if not resolved_col and col_name.lower() == 'promotion_code':
+        resolved_col = col_map.get('promo_code')
+    if not resolved_col and col_name.lower() == 'contact_no':
+        resolved_col = col_map.get('conctact_no')
+    
+    if not resolved_col:
+        raise ValueError(f"Column '{col_name}' not found. Available: {list(col_map.values())}")
+    return df.col(resolved_col)
+
+def natural_key_condition(left_df, right_df, natural_key):
+    """NULL-safe equality on a natural key: NULL matches NULL, as in the dimension GROUP BYs and the hash keys"""
+    condition = None
+    for c in natural_key:
+        matches = get_col(left_df, c).equal_null(get_col(right_df, c))
+        condition = matches if condition is None else condition & matches
+    return condition
+
+def without_matches(df, other_df, natural_key) -> DataFrame:
+    """Rows of df whose natural key is not in other_df, NULL matching NULL"""
+    # A left join on a marker column rather than leftanti: the local engine's anti join drops NULL-keyed rows
+    other_df = other_df.select(*[get_col(other_df, c).as_(f"OTHER_{c.upper()}") for c in natural_key],
+                               lit(1).as_("OTHER_MATCHED"))
+    condition = None
+    for c in natural_key:
+        matches = get_col(df, c).equal_null(other_df.col(f"OTHER_{c.upper()}"))
+        condition = matches if condition is None else condition & matches
+    return df.join(other_df, condition, join_type='left').filter(col("OTHER_MATCHED").is_null()) \
+        .select(*[df.col(c) for c in df.columns])
+
+def duplicate_dimension_keys(session, dimension) -> DataFrame:
+    """Natural keys that occur more than once in a dimension: each would multiply the fact rows joined to it"""
+    dim_df = session.table(f"sales_dwh.consumption.{dimension}")
+    natural_key = DIMENSION_KEYS[dimension][1]
+    probe_df = dim_df.select(*[get_col(dim_df, c).as_(c) for c in natural_key]) \
+        .group_by(*natural_key).agg(count(lit(1)).alias("ROWS"))
+    # One grouped query per dimension; the duplicates themselves are few, so they come back as a small DataFrame
+    duplicates = probe_df.filter(col("ROWS") > 1).collect()
+    if not duplicates:
+        return None
+    schema = StructType([field for field in probe_df.schema.fields if field.name.lower() != "rows"])
+    return session.create_dataframe([[row[c.upper()] for c in natural_key] for row in duplicates], schema=schema)
+
+def ensure_quarantine_table(session) -> str:
+    """Create the fact quarantine table on first use"""
+    ensure_table(session, FACT_QUARANTINE_TABLE, FACT_QUARANTINE_SCHEMA)
+    return FACT_QUARANTINE_TABLE
+
+def guard_dimension_joins(session, sales_df, on_fan_out="abort") -> DataFrame:
+    """Probe every fact dimension for duplicated natural keys before joining; abort, or quarantine the affected orders"""
+    fanned_out = []
+    for dimension in FACT_DIMENSIONS:
+        duplicates_df = duplicate_dimension_keys(session, dimension)
+        if duplicates_df is None:
+            continue
+        natural_key = DIMENSION_KEYS[dimension][1]
+        keys = duplicates_df.collect()
+        logging.error(f"❌ {dimension} has {len(keys)} duplicated natural keys ({', '.join(natural_key)}), "
+                      f"e.g. {[tuple(k) for k in keys[:3]]}")
+        fanned_out.append(dimension)
+        if on_fan_out != "quarantine":
+            continue
+
+        condition = natural_key_condition(sales_df, duplicates_df, natural_key)
+        # The duplicated keys are distinct, so an inner join picks each affected order once
+        affected_df = sales_df.join(duplicates_df, condition, join_type='inner', rsuffix="_dup")
+        quarantined = insert_into(session, affected_df.select(
+            col("ORDER_ID").as_("ORDER_CODE"), lit(dimension).as_("DIMENSION"), lit(datetime.now()).as_("QUARANTINED_AT")
+        ), ensure_quarantine_table(session))
+        logging.warning(f"⚠ {quarantined} orders quarantined to {FACT_QUARANTINE_TABLE} ({dimension} fan-out)")
+        sales_df = without_matches(sales_df, duplicates_df, natural_key)
+
+    if fanned_out and on_fan_out != "quarantine":
+        raise RuntimeError(f"Dimension join fan-out in: {', '.join(fanned_out)}; sales_fact was not loaded")
+    return sales_df
+
+def check_fact_cardinality(input_rows, fact_rows) -> None:
+    """Compare the curated rows going into the dimension joins with the fact rows coming out"""
+    if fact_rows > input_rows:
+        raise RuntimeError(f"Dimension joins fanned {input_rows} curated rows out to {fact_rows} fact rows; "
+                           f"sales_fact was not loaded")
+    if fact_rows < input_rows:
+        raise RuntimeError(f"{input_rows - fact_rows} of {input_rows} curated rows have no matching dimension row; "
+                           f"sales_fact was not loaded")
+
+# Sales Fact
+def create_sales_fact_df(all_sales_df, session, key_strategy="sequence") -> DataFrame:
+    """Resolve dimension keys for the curated sales and project the fact columns"""
+    ensure_sequence(session, "sales_dwh.consumption.sales_fact_seq")
+    if key_strategy == "hash":
+        # Foreign keys are hashed from the fact's own columns, exactly as the dimensions hashed them: no joins
+        sales_fact_df = all_sales_df.select(
+            col("order_id").as_("order_code"),
+            *[hash_key(DIMENSION_KEYS[dim][1]).as_(DIMENSION_KEYS[dim][0].replace("_pk", "_fk")) for dim in FACT_DIMENSIONS],
+            *[col(c) for c in FACT_MEASURES]
+        )
+        return with_sequence_key(session, sales_fact_df, "sales_dwh.consumption.sales_fact_seq", "order_id_pk")
+
+    # Join sales with each dimension on its natural key (promotion_code is already NA-filled by curated_sales_df);
+    # NULL-safe, so an order with e.g. no contact number still finds its customer
+    for dimension in FACT_DIMENSIONS:
+        dim_df = session.table(f"sales_dwh.consumption.{dimension}")
+        condition = natural_key_condition(all_sales_df, dim_df, DIMENSION_KEYS[dimension][1])
+        all_sales_df = all_sales_df.join(dim_df, condition, join_type='inner', rsuffix=f"_{dimension}")
+
+    all_sales_df = all_sales_df.select(
+        col("order_id").as_("order_code"),
+        *[col(DIMENSION_KEYS[dim][0]).as_(DIMENSION_KEYS[dim][0].replace("_pk", "_fk")) for dim in FACT_DIMENSIONS],
+        *[col(c) for c in FACT_MEASURES]
+    )
+    return with_sequence_key(session, all_sales_df, "sales_dwh.consumption.sales_fact_seq", "order_id_pk")
+
+def curated_high_water_marks(all_sales_df) -> dict:
+    """Max SALES_ORDER_KEY per country in the materialized curated set"""
+    rows = all_sales_df.group_by(col("COUNTRY")).agg(max(col(FACT_WATERMARK_COLUMN)).alias("HWM")).collect()
+    return {row["COUNTRY"]: int(row["HWM"]) for row in rows if row["HWM"] is not None}
+
+def new_curated_sales_df(all_sales_df, watermarks) -> DataFrame:
+    """Curated rows past their country's fact watermark; countries without one are taken whole"""
+    if not watermarks:
+        return all_sales_df
+    condition = ~col("COUNTRY").in_(list(watermarks))
+    for country, watermark in watermarks.items():
+        condition = condition | ((col("COUNTRY") == country) & (col(FACT_WATERMARK_COLUMN) > watermark))
+    return all_sales_df.filter(condition)
+
+def create_sales_fact(all_sales_df, session, block=True, key_strategy="sequence", full_refresh=False,
+                      on_fan_out="abort") -> int:
+    """MERGE new and changed curated orders into sales_fact on order_code and region, returning rows inserted + updated"""
+    # The MERGE always blocks: the watermark may only move once it has succeeded. Under --concurrent it is
+    # the last build submitted, so it still overlaps the dimension INSERTs
+    logging.info("Merging Sales Fact on order_code...")
+    high_water_marks = curated_high_water_marks(all_sales_df)
+    target = session.table("sales_dwh.consumption.sales_fact")
+    watermarks = {} if full_refresh else read_watermarks(session, FACT_WATERMARK_TABLE)
+    if watermarks and target.count() == 0:
+        logging.info("sales_fact is empty, ignoring its watermarks")
+        watermarks = {}
+    if watermarks and all(hwm <= watermarks.get(country, -1) for country, hwm in high_water_marks.items()):
+        logging.info(f"✓ Sales Fact is up to date (watermarks {watermarks})")
+        return 0
+
+    # Only orders curated since the last run need their dimension keys resolved
+    new_sales_df = new_curated_sales_df(all_sales_df, watermarks)
+    if key_strategy == "hash":
+        # Materialized so marking the touched days and the MERGE read the same rows and draw order_id_pk once
+        sales_fact_df = create_sales_fact_df(new_sales_df, session, key_strategy).cache_result()
+    else:
+        # A duplicated natural key multiplies every order joined to it, so check before anything is written
+        new_sales_df = guard_dimension_joins(session, new_sales_df, on_fan_out)
+        # Materialized so the row count check and the MERGE read the same joined rows
+        sales_fact_df = create_sales_fact_df(new_sales_df, session, key_strategy).cache_result()
+        check_fact_cardinality(new_sales_df.count(), sales_fact_df.count())
+    # A re-merged order keeps its order_id_pk; everything else is refreshed
+    updates = {c: sales_fact_df[c] for c in sales_fact_df.columns if c.lower() != "order_id_pk"}
+    inserts = {c: sales_fact_df[c] for c in sales_fact_df.columns}
+    # Queued before the MERGE so a failure after it still leaves the days for the rollup refresh
+    mark_touched_dates(session, sales_fact_df, target)
+    merge_result = merge_into(
+        session,
+        target,
+        sales_fact_df,
+        # Order ids are only unique within a country (the curated dedup key), so the region is part of the match
+        (target["ORDER_CODE"] == sales_fact_df["ORDER_CODE"]) & (target["REGION_ID_FK"] == sales_fact_df["REGION_ID_FK"]),
+        [when_matched().update(updates), when_not_matched().insert(inserts)]
+    )
+    # Reruns after a failure redo the same MERGE: the watermark only moves once it has committed
+    save_watermarks(session, FACT_WATERMARK_TABLE, high_water_marks)
+    logging.info(f"✓ Sales Fact: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated")
+    return merge_result.rows_inserted + merge_result.rows_updated
+
+def main(strict_metrics=False, concurrent=False, key_strategy="sequence", full_refresh=False,
+         horizon_days=CALENDAR_HORIZON_DAYS, fiscal_start_month=FISCAL_YEAR_START_MONTH, on_fan_out="abort",
+         session=None):
+    # A session passed in (e.g. the local pipeline runner's) is left open for the caller
+    owns_session = session is None
     try:
-        session = get_snowpark_session()
+        session = session or get_snowpark_session()
+        if concurrent and is_local(session):
+            logging.warning("⚠ Async queries are not available on the local backend, building dimensions one by one")
+            concurrent = False
         logging.info("=" * 60)
         logging.info("Starting Curated → Consumption transformation...")
         logging.info("=" * 60)
         
-        # Load curated data
-        logging.info("Loading curated sales data...")
-        in_sales_df = session.sql("select * from sales_dwh.curated.in_sales_order")
-        us_sales_df = session.sql("select * from sales_dwh.curated.us_sales_order")
-        fr_sales_df = session.sql("select * from sales_dwh.curated.fr_sales_order")
-        
-        all_sales_df = in_sales_df.union(us_sales_df).union(fr_sales_df)
-        total_rows = all_sales_df.count()
-        logging.info(f"Total curated records loaded: {total_rows}")
-        logging.info("=" * 60)
-        
-        # Create all dimension tables
-        create_date_dim(all_sales_df, session)
-        create_region_dim(all_sales_df, session)
-        create_product_dim(all_sales_df, session)
-        create_promocode_dim(all_sales_df, session)
-        create_customer_dim(all_sales_df, session)
-        create_payment_dim(all_sales_df, session)
-        
-        logging.info("=" * 60)
-        logging.info("Creating Sales Fact table...")
-        
-        # Load dimension tables
-        date_dim_df = session.sql("select * from sales_dwh.consumption.date_dim")
-        customer_dim_df = session.sql("select * from sales_dwh.consumption.customer_dim")
-        payment_dim_df = session.sql("select * from sales_dwh.consumption.payment_dim")
-        product_dim_df = session.sql("select * from sales_dwh.consumption.product_dim")
-        promo_code_dim_df = session.sql("select * from sales_dwh.consumption.promo_code_dim")
-        region_dim_df = session.sql("select * from sales_dwh.consumption.region_dim")
-        
-        def get_col(df, col_name):
-            col_map = {c.lower(): c for c in df.columns}
-            resolved_col = col_map.get(col_name.lower())
+        with stage_metrics(session, "curated2model", strict_metrics) as metrics:
+            # Load curated data
+            logging.info("Loading curated sales data...")
+            with query_step(session, "curated set"):
+                all_sales_df = curated_sales_df(session)
+            logging.info(f"Curated sales materialized: {all_sales_df.count()} rows")
+            # Dimension keys and the fact's foreign keys must come from the same strategy
+            check_key_strategy(session, key_strategy, full_refresh)
+            # MERGE cannot order what it writes; the declared key lets automatic clustering settle the new rows
+            ensure_clustering_keys(session, ["sales_dwh.consumption.sales_fact"])
+            logging.info("=" * 60)
             
-            # Handle potential column name mismatches
-            if not resolved_col and col_name.lower() == 'promotion_code':
-                resolved_col = col_map.get('promo_code')
+            # Create all dimension tables; they are independent, so --concurrent runs them side by side
+            load_sales_fact = partial(create_sales_fact, full_refresh=full_refresh, on_fan_out=on_fan_out)
+            builders = dict(DIMENSION_BUILDERS)
+            builders["date_dim"] = partial(create_date_dim, horizon_days=horizon_days, fiscal_start_month=fiscal_start_month)
+            if key_strategy == "hash":
+                # Hashed foreign keys need no dimension lookups, so the fact load is one more independent build
+                builders["sales_fact"] = load_sales_fact
+            started = time.perf_counter()
+            if concurrent:
+                counts = build_tables_concurrently(all_sales_df, session, builders, key_strategy)
+            else:
+                counts = build_tables(all_sales_df, session, builders, key_strategy)
+            logging.info(f"{', '.join(builders)} built in {time.perf_counter() - started:.2f}s")
+            for name, cnt in counts.items():
+                if name != "sales_fact":
+                    record_rows(metrics, name, cnt)
             
-            if not resolved_col:
-                raise ValueError(f"Column '{col_name}' not found. Available: {list(col_map.values())}")
-            return df.col(resolved_col)
-        
-        # Join sales with dimensions
-        all_sales_df = all_sales_df.with_column("promotion_code", expr("case when promotion_code is null then 'NA' else promotion_code end"))
-        
-        all_sales_df = all_sales_df.join(date_dim_df, all_sales_df.col("order_dt") == get_col(date_dim_df, "order_dt"), join_type='inner', rsuffix='_date')
-        
-        all_sales_df = all_sales_df.join(customer_dim_df, 
-                                         (all_sales_df.col("customer_name") == get_col(customer_dim_df, "customer_name")) &
-                                         (all_sales_df.col("region") == get_col(customer_dim_df, "region")) &
-                                         (all_sales_df.col("country") == get_col(customer_dim_df, "country")), 
-                                         join_type='inner', rsuffix='_cust')
-                                         
-        all_sales_df = all_sales_df.join(payment_dim_df, 
-                                         (all_sales_df.col("payment_method") == get_col(payment_dim_df, "payment_method")) &
-                                         (all_sales_df.col("payment_provider") == get_col(payment_dim_df, "payment_provider")) &
-                                         (all_sales_df.col("country") == get_col(payment_dim_df, "country")) &
-                                         (all_sales_df.col("region") == get_col(payment_dim_df, "region")), 
-                                         join_type='inner', rsuffix='_pay')
-                                         
-        all_sales_df = all_sales_df.join(product_dim_df, all_sales_df.col("mobile_key") == get_col(product_dim_df, "mobile_key"), join_type='inner', rsuffix='_prod')
-        
-        all_sales_df = all_sales_df.join(promo_code_dim_df, 
-                                         (all_sales_df.col("promotion_code") == get_col(promo_code_dim_df, "promotion_code")) &
-                                         (all_sales_df.col("country") == get_col(promo_code_dim_df, "country")) &
-                                         (all_sales_df.col("region") == get_col(promo_code_dim_df, "region")), 
-                                         join_type='inner', rsuffix='_promo')
-                                         
-        all_sales_df = all_sales_df.join(region_dim_df, 
-                                         (all_sales_df.col("country") == get_col(region_dim_df, "country")) &
-                                         (all_sales_df.col("region") == get_col(region_dim_df, "region")), 
-                                         join_type='inner', rsuffix='_reg')
-        
-        session.sql("CREATE SEQUENCE IF NOT EXISTS sales_dwh.consumption.sales_fact_seq").collect()
-        
-        all_sales_df = all_sales_df.selectExpr(
-            "sales_dwh.consumption.sales_fact_seq.nextval as order_id_pk",
-            "order_id as order_code",
-            "date_id_pk as date_id_fk",
-            "region_id_pk as region_id_fk",
-            "customer_id_pk as customer_id_fk",
-            "payment_id_pk as payment_id_fk",
-            "product_id_pk as product_id_fk",
-            "promo_code_id_pk as promo_code_id_fk",
-            "order_quantity",
-            "local_total_order_amt",
-            "local_tax_amt",
-            "exchange_rate",
-            "usd_total_order_amt",
-            "usd_tax_amt"
-        )
-        
-        fact_count = all_sales_df.count()
-        all_sales_df.write.save_as_table("sales_dwh.consumption.sales_fact", mode="append")
+            logging.info("=" * 60)
+            if "sales_fact" not in counts:
+                with query_step(session, "sales_fact"):
+                    counts["sales_fact"] = load_sales_fact(all_sales_df, session, key_strategy=key_strategy)
+            fact_count = record_rows(metrics, "sales_fact", counts["sales_fact"])
+
+            # Only the days the fact load touched are re-aggregated; --full-refresh rebuilds the whole rollup
+            with query_step(session, "sales_daily_rollup"):
+                rollup_count = record_rows(metrics, "sales_daily_rollup", refresh_rollup(session, rebuild=full_refresh))
+            if fact_count or rollup_count:
+                # KPI readers drop their cached results when the version moves
+                version = bump_model_version(session, metrics["run_id"], key_strategy)
+                logging.info(f"✓ Consumption model version {version}")
         
-        logging.info(f"✓ Sales Fact: {fact_count} rows inserted")
+        logging.info(f"✓ Sales Fact: {fact_count} rows merged")
         logging.info("=" * 60)
         logging.info("✓ Transformation complete! Consumption layer summary:")
-        logging.info(f"  Total fact records: {fact_count}")
+        logging.info(f"  Fact records inserted or updated: {fact_count}")
         logging.info("=" * 60)
+        return metrics
         
     except Exception as e:
         logging.error(f"❌ Error: {str(e)}")
         raise
     finally:
-        session.close()
-        logging.info("Session closed")
+        if owns_session and session is not None:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the CONSUMPTION star schema from CURATED sales")
+    parser.add_argument("--strict-metrics", action="store_true",
+                        help="record how many queries the stage issued")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="submit the six dimension INSERTs as async queries and wait on them together")
+    parser.add_argument("--key-strategy", choices=KEY_STRATEGIES, default="sequence",
+                        help="surrogate keys from sequences (fact joins the dimensions) or hashed from natural keys "
+                             "(fact computes its foreign keys); switching an existing model needs --full-refresh")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="ignore the sales_fact watermarks and MERGE the whole curated set; with a changed "
+                             "--key-strategy, empty and rebuild the consumption tables")
+    parser.add_argument("--calendar-horizon-days", type=int, default=CALENDAR_HORIZON_DAYS,
+                        help="extend date_dim this many days past the latest order whenever it has to grow")
+    parser.add_argument("--fiscal-year-start-month", type=int, choices=range(1, 13), default=FISCAL_YEAR_START_MONTH,
+                        help="first month of the fiscal year used for the fiscal date attributes")
+    parser.add_argument("--on-fan-out", choices=FAN_OUT_ACTIONS, default="abort",
+                        help="when a dimension has duplicated natural keys, fail the fact load or quarantine "
+                             "the affected orders and load the rest")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.strict_metrics, args.concurrent, args.key_strategy, args.full_refresh,
+         args.calendar_horizon_days, args.fiscal_year_start_month, args.on_fan_out)
@@ -1,5 +1,16 @@
 import os
-from snowflake.snowpark import Session
+import glob
+import json
+import time
+import csv
+import hashlib
+import argparse
+import re
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pipeline_backend import get_snowpark_session
 import sys
 import logging
 
@@ -8,98 +19,811 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s', 
                    datefmt='%I:%M:%S')
 
-# snowpark session
-def get_snowpark_session() -> Session:
-    connection_parameters = {
-        "ACCOUNT": "QNNERMQ-RZ07987",
-        "USER": "snowpark_user",
-        "PASSWORD": os.getenv("SNOWFLAKE_PASSWORD", "YOUR_PASSWORD_HERE"),
-        "ROLE": "SYSADMIN",
-        "DATABASE": "sales_dwh",
-        "WAREHOUSE": "SNOWPARK_ETL_WH"
-    }
-    return Session.builder.configs(connection_parameters).create()
+# upload scheduler settings
+UPLOAD_MAX_WORKERS = 8
+UPLOAD_MAX_RETRIES = 3
+UPLOAD_BACKOFF_SECONDS = 1.0
+UPLOAD_OK_STATUSES = ("UPLOADED", "SKIPPED")
 
-def traverse_directory(directory, file_extension) -> list:
-    local_file_path = []
-    file_name = []
-    partition_dir = []
-    
-    logging.info(f"Scanning directory: {directory} for {file_extension} files")
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(file_extension):
-                file_path = os.path.join(root, file)
-                file_name.append(file)
-                # Get relative path
-                rel_path = os.path.relpath(root, directory)
+# local sales tree and upload manifest
+SALES_DATA_DIR = '/Users/kshitijkharche/Desktop/snowpark-e2e/end2end-sample-data/sales'
+SALES_FILE_EXTENSIONS = ('.csv', '.parquet', '.json')
+MANIFEST_HASH_CHUNK_BYTES = 1024 * 1024
+
+# Whitespace, commas and the outer array brackets between JSON records
+JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+# local Parquet conversion: column order and casts mirror the COPY statements in stage2source
+CSV_HAS_HEADER = True
+PARQUET_CHUNK_ROWS = 100000
+SALES_PARQUET_COLUMNS = [
+    ("Order ID", "string"),
+    ("Customer Name", "string"),
+    ("Mobile Model", "string"),
+    ("Quantity", "int"),
+    ("Price per Unit", "float"),
+    ("Total Price", "float"),
+    ("Promotion Code", "string"),
+    ("Order Amount", "decimal"),
+    ("Tax", "decimal"),
+    ("Order Date", "date"),
+    ("Payment Status", "string"),
+    ("Shipping Status", "string"),
+    ("Payment Method", "string"),
+    ("Payment Provider", "string"),
+    ("Phone", "string"),
+    ("Delivery Address", "string")
+]
+SALES_PARQUET_TYPES = {
+    "string": pa.string(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "decimal": pa.decimal128(10, 2),
+    "date": pa.date32()
+}
+SALES_PARQUET_SCHEMA = pa.schema([(name, SALES_PARQUET_TYPES[kind]) for name, kind in SALES_PARQUET_COLUMNS])
+DECIMAL_LIMIT = 10 ** 8
+
+# pre-flight validation: files are rejected before upload when they break what the COPY statements expect
+PARTITION_FORMATS = {"IN": ("csv", "parquet"), "US": ("parquet",), "FR": ("json", "parquet")}
+REQUIRED_SALES_FIELDS = ["Order ID", "Customer Name", "Mobile Model", "Quantity", "Order Amount", "Order Date"]
+VALIDATION_CHUNK_ROWS = 50000
+# share of rows a file may have that COPY (ON_ERROR = 'CONTINUE') would drop; 0 rejects any such file
+VALIDATION_MAX_BAD_RATIO = 0.0
+VALIDATION_MAX_EXAMPLES = 5
+
+def scan_sales_directory(directory, extensions=SALES_FILE_EXTENSIONS, verbose=True) -> dict:
+    """Walk the sales tree once with os.scandir and classify files by extension"""
+    scanned = {ext: ([], [], []) for ext in extensions}
+    if verbose:
+        logging.info(f"Scanning directory: {directory} for {', '.join(extensions)} files")
+
+    pending_dirs = [directory]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        with os.scandir(current_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                    continue
+                extension = os.path.splitext(entry.name)[1].lower()
+                if extension not in scanned:
+                    continue
+                rel_path = os.path.relpath(current_dir, directory)
+                file_name, partition_dir, local_file_path = scanned[extension]
+                file_name.append(entry.name)
                 partition_dir.append(rel_path if rel_path != '.' else '')
-                local_file_path.append(file_path)
-                logging.info(f"Found: {file} in {rel_path}")
-    
-    logging.info(f"Total {file_extension} files found: {len(file_name)}")
-    return file_name, partition_dir, local_file_path
+                local_file_path.append(entry.path)
+
+    if verbose:
+        for ext, (file_name, _, _) in scanned.items():
+            logging.info(f"Total {ext} files found: {len(file_name)}")
+    return scanned
+
+def traverse_directory(directory, file_extension) -> list:
+    """Single-extension view of scan_sales_directory"""
+    return scan_sales_directory(directory, (file_extension,))[file_extension]
+
+def file_content_hash(local_path) -> str:
+    """Stream a file through sha256 without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MANIFEST_HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_upload_manifest(manifest_path) -> dict:
+    """Read the upload manifest; a missing or unreadable manifest means everything is new"""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f).get("entries", {})
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠ Ignoring unreadable upload manifest {manifest_path}: {str(e)}")
+        return {}
+
+def save_upload_manifest(manifest_path, entries) -> None:
+    """Write the manifest atomically so an interrupted run never leaves it half written"""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": 1, "entries": entries}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def manifest_key(stage_location, partition_dir, file_name) -> str:
+    """Manifest entries are keyed by the staged file path"""
+    return f"{stage_target(stage_location, partition_dir)}/{file_name}"
+
+def file_fingerprint(local_path, stat=None) -> dict:
+    """Path, size, mtime and content hash recorded for an uploaded file"""
+    stat = stat or os.stat(local_path)
+    return {"path": local_path, "size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_content_hash(local_path)}
+
+def select_changed_files(manifest, file_names, partition_dirs, local_paths, stage_location, verbose=True) -> tuple:
+    """Keep only files whose stage target has no manifest entry or whose content changed"""
+    changed = ([], [], [])
+    for idx, local_path in enumerate(local_paths):
+        entry = manifest.get(manifest_key(stage_location, partition_dirs[idx], file_names[idx]))
+        stat = os.stat(local_path)
+        if entry and entry["size"] == stat.st_size:
+            # size and mtime unchanged: trust the manifest without hashing
+            if entry["mtime"] == stat.st_mtime:
+                continue
+            # touched but identical content: refresh mtime and skip the PUT
+            if entry["sha256"] == file_content_hash(local_path):
+                entry["mtime"] = stat.st_mtime
+                entry["path"] = local_path
+                continue
+        changed[0].append(file_names[idx])
+        changed[1].append(partition_dirs[idx])
+        changed[2].append(local_path)
+
+    if verbose:
+        logging.info(f"Manifest check: {len(changed[0])} new or changed, {len(file_names) - len(changed[0])} unchanged")
+    return changed
+
+def record_uploads(manifest, uploaded_paths, file_names, partition_dirs, local_paths, stage_location) -> None:
+    """Record successfully uploaded files against their stage target"""
+    uploaded = set(uploaded_paths)
+    for idx, local_path in enumerate(local_paths):
+        if local_path in uploaded:
+            manifest[manifest_key(stage_location, partition_dirs[idx], file_names[idx])] = file_fingerprint(local_path)
+
+def stage_target(stage_location, partition_dir) -> str:
+    """Resolve the stage path for a sales partition directory"""
+    return f"{stage_location}/sales/{partition_dir}" if partition_dir else f"{stage_location}/sales"
+
+def build_upload_batches(file_names, partition_dirs, local_paths, stage_location) -> list:
+    """Group files by stage target, using one wildcard PUT when a batch covers its whole directory"""
+    groups = {}
+    for idx, local_path in enumerate(local_paths):
+        local_dir = os.path.dirname(local_path)
+        extension = os.path.splitext(file_names[idx])[1]
+        target = stage_target(stage_location, partition_dirs[idx])
+        groups.setdefault((local_dir, extension, target), []).append(local_path)
 
-def upload_files(session, file_names, partition_dirs, local_paths, stage_location, file_type):
-    """Upload files to Snowflake stage"""
+    batches = []
+    for (local_dir, extension, target), paths in groups.items():
+        pattern = os.path.join(local_dir, f"*{extension}")
+        # A wildcard is only safe when it matches exactly the files we were asked to upload
+        use_wildcard = len(paths) > 1 and set(glob.glob(pattern)) == set(paths)
+        batches.append({"target": target, "paths": paths, "pattern": pattern if use_wildcard else None})
+    return batches
+
+def put_with_retry(session, local_path, target, max_retries=UPLOAD_MAX_RETRIES, backoff=UPLOAD_BACKOFF_SECONDS):
+    """PUT a single file, retrying with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            put_result = session.file.put(local_path, target, auto_compress=False, overwrite=True, parallel=4)
+            if put_result and put_result[0].status in UPLOAD_OK_STATUSES:
+                return put_result[0]
+            message = put_result[0].message if put_result else "empty PUT result"
+        except Exception as e:
+            message = str(e)
+
+        if attempt < max_retries:
+            delay = backoff * (2 ** attempt)
+            logging.warning(f"⚠ Retry {attempt + 1}/{max_retries} for {os.path.basename(local_path)} in {delay:.1f}s: {message}")
+            time.sleep(delay)
+
+    raise RuntimeError(f"Upload failed after {max_retries + 1} attempts: {local_path} ({message})")
+
+def upload_batch(session, batch) -> dict:
+    """Upload one partition batch; files the wildcard PUT could not load are retried one by one"""
+    target = batch["target"]
+    paths_by_name = {os.path.basename(p): p for p in batch["paths"]}
+    pending = list(batch["paths"])
+    uploaded = []
+    failed = []
+
+    if batch["pattern"]:
+        try:
+            put_result = session.file.put(batch["pattern"], target, auto_compress=False, overwrite=True, parallel=4)
+            ok_names = {r.source for r in put_result if r.status in UPLOAD_OK_STATUSES}
+            uploaded = [paths_by_name[name] for name in ok_names if name in paths_by_name]
+            pending = [p for p in batch["paths"] if os.path.basename(p) not in ok_names]
+            logging.info(f"✓ {target} => {len(uploaded)} files in one PUT")
+        except Exception as e:
+            logging.warning(f"⚠ Wildcard PUT to {target} failed, falling back to per-file uploads: {str(e)}")
+
+    for local_path in pending:
+        try:
+            put_with_retry(session, local_path, target)
+            uploaded.append(local_path)
+            logging.info(f"✓ {os.path.basename(local_path)} => {target}")
+        except Exception as e:
+            logging.error(f"❌ Failed to upload {os.path.basename(local_path)}: {str(e)}")
+            failed.append(local_path)
+
+    return {
+        "target": target,
+        "uploaded": uploaded,
+        "failed": failed,
+        "bytes": sum(os.path.getsize(p) for p in uploaded)
+    }
+
+def upload_files(session, file_names, partition_dirs, local_paths, stage_location, file_type, max_workers=UPLOAD_MAX_WORKERS) -> dict:
+    """Upload files to Snowflake stage, one PUT per partition directory across a bounded thread pool"""
+    summary = {"files": 0, "uploaded": [], "failed": [], "bytes": 0, "seconds": 0.0, "bytes_per_sec": 0.0, "files_per_sec": 0.0}
     if not file_names:
         logging.warning(f"No {file_type} files to upload")
+        return summary
+
+    batches = build_upload_batches(file_names, partition_dirs, local_paths, stage_location)
+    logging.info(f"Uploading {len(file_names)} {file_type} files in {len(batches)} batches ({max_workers} workers)")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(upload_batch, session, batch) for batch in batches]
+        for future in as_completed(futures):
+            result = future.result()
+            summary["files"] += len(result["uploaded"])
+            summary["uploaded"].extend(result["uploaded"])
+            summary["bytes"] += result["bytes"]
+            summary["failed"].extend(result["failed"])
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = elapsed
+    if elapsed > 0:
+        summary["bytes_per_sec"] = summary["bytes"] / elapsed
+        summary["files_per_sec"] = summary["files"] / elapsed
+
+    logging.info(
+        f"✓ {file_type}: {summary['files']} files, {summary['bytes'] / 1024 / 1024:.2f} MB in {elapsed:.2f}s "
+        f"({summary['bytes_per_sec'] / 1024 / 1024:.2f} MB/s, {summary['files_per_sec']:.1f} files/s)"
+    )
+    if summary["failed"]:
+        logging.error(f"❌ {len(summary['failed'])} {file_type} files failed to upload")
+    return summary
+
+def parquet_partition_dir(partition_dir) -> str:
+    """source=XX/format=csv -> source=XX/format=parquet"""
+    parts = [p for p in partition_dir.split(os.sep) if p and not p.startswith('format=')]
+    return os.path.join(*parts, 'format=parquet') if parts else 'format=parquet'
+
+def iter_json_records(local_path, read_bytes=1024 * 1024, with_text=False):
+    """Yield objects from a JSON array or newline-delimited JSON file one at a time; with_text yields (object, source
+    text) pairs instead, each text running from the end of the previous object, separators included"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    start = 0
+    pos = 0
+    # characters trimmed off the front of buffer so far, for error positions
+    offset = 0
+    eof = False
+    with open(local_path, encoding='utf-8') as f:
+        while True:
+            # skip separators between records, including the outer array brackets
+            pos = JSON_SEPARATORS.match(buffer, pos).end()
+            if pos < len(buffer):
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    end = None
+                # A value running to the end of the buffer may continue in the next block (e.g. a split number)
+                if end is not None and (end < len(buffer) or eof):
+                    yield (record, buffer[start:end]) if with_text else record
+                    start = pos = end
+                    continue
+                if eof:
+                    raise ValueError(f"Truncated or invalid JSON in {local_path} at character {offset + pos}")
+            elif eof:
+                return
+            # Consumed text is trimmed once per block read, not once per record
+            chunk = f.read(read_bytes)
+            eof = not chunk
+            buffer = buffer[start:] + chunk
+            offset += start
+            pos -= start
+            start = 0
+
+def iter_sales_frames(local_path, source_format, chunk_rows):
+    """Stream a CSV/JSON/Parquet sales file as DataFrames of at most chunk_rows rows, columns in COPY order"""
+    column_names = [name for name, _ in SALES_PARQUET_COLUMNS]
+    if source_format == 'parquet':
+        for batch in pq.ParquetFile(local_path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas().reindex(columns=column_names)
         return
-    
-    for idx, file_name in enumerate(file_names):
+
+    if source_format == 'csv':
+        # Only empty fields are NULL, as in the COPY's CSV format; pandas' defaults would also null out 'NA' provider values
+        for frame in pd.read_csv(local_path, header=0 if CSV_HAS_HEADER else None, names=column_names,
+                                 dtype=str, keep_default_na=False, na_values=[''], chunksize=chunk_rows):
+            yield frame
+        return
+
+    records = []
+    for record in iter_json_records(local_path):
+        records.append(record)
+        if len(records) >= chunk_rows:
+            yield pd.DataFrame.from_records(records).reindex(columns=column_names)
+            records = []
+    if records:
+        yield pd.DataFrame.from_records(records).reindex(columns=column_names)
+
+def parse_sales_columns(frame) -> tuple:
+    """Apply the stage2source casts locally: typed columns, and per column the values that would fail their cast"""
+    typed = {}
+    failures = {}
+    for name, kind in SALES_PARQUET_COLUMNS:
+        values = frame[name]
+        if kind == 'string':
+            typed[name] = values.where(values.isna(), values.astype(str))
+            continue
+        if kind == 'date':
+            parsed = pd.to_datetime(values, errors='coerce')
+        else:
+            parsed = pd.to_numeric(values, errors='coerce')
+        failures[name] = values.notna() & parsed.isna()
+        if kind == 'decimal':
+            # NUMBER(10,2) holds at most 8 integer digits
+            failures[name] |= parsed.abs() >= DECIMAL_LIMIT
+        typed[name] = parsed
+    return typed, failures
+
+def to_sales_table(frame) -> tuple:
+    """Apply the stage2source casts locally; rows that would fail them are dropped like ON_ERROR = 'CONTINUE'"""
+    typed, failures = parse_sales_columns(frame)
+    invalid = pd.Series(False, index=frame.index)
+    for failed in failures.values():
+        invalid |= failed
+
+    kept = ~invalid
+    arrays = []
+    for name, kind in SALES_PARQUET_COLUMNS:
+        values = typed[name][kept]
+        if kind == 'int':
+            arrays.append(pa.array(values.round(), from_pandas=True).cast(pa.int64()))
+        elif kind == 'decimal':
+            arrays.append(pa.array(values, type=pa.float64(), from_pandas=True).cast(pa.decimal128(10, 2), safe=False))
+        elif kind == 'date':
+            arrays.append(pa.array(values.dt.date, type=pa.date32(), from_pandas=True))
+        else:
+            arrays.append(pa.array(values, type=SALES_PARQUET_TYPES[kind], from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=SALES_PARQUET_SCHEMA), int(invalid.sum())
+
+def convert_file_to_parquet(local_path, output_path, source_format, chunk_rows=PARQUET_CHUNK_ROWS) -> dict:
+    """Convert one CSV/JSON file to typed Parquet in bounded memory (runs in a worker process)"""
+    rows = 0
+    dropped = 0
+    tmp_path = f"{output_path}.tmp"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with pq.ParquetWriter(tmp_path, SALES_PARQUET_SCHEMA, compression='snappy') as writer:
+        for frame in iter_sales_frames(local_path, source_format, chunk_rows):
+            table, invalid = to_sales_table(frame)
+            writer.write_table(table)
+            rows += table.num_rows
+            dropped += invalid
+    os.replace(tmp_path, output_path)
+    return {"source": local_path, "output": output_path, "rows": rows, "dropped": dropped}
+
+def convert_sales_to_parquet(file_names, partition_dirs, local_paths, output_directory, max_workers=None) -> tuple:
+    """Replace CSV/JSON entries with Parquet conversions under format=parquet partitions"""
+    out_names, out_dirs, out_paths = [], [], []
+    jobs = []
+    for idx, local_path in enumerate(local_paths):
+        extension = os.path.splitext(file_names[idx])[1].lower()
+        if extension not in ('.csv', '.json'):
+            out_names.append(file_names[idx])
+            out_dirs.append(partition_dirs[idx])
+            out_paths.append(local_path)
+            continue
+
+        target_dir = parquet_partition_dir(partition_dirs[idx])
+        target_name = f"{os.path.splitext(file_names[idx])[0]}.parquet"
+        output_path = os.path.join(output_directory, target_dir, target_name)
+        out_names.append(target_name)
+        out_dirs.append(target_dir)
+        out_paths.append(output_path)
+
+        # Reconvert only when the source is newer than its existing Parquet output
+        if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(local_path):
+            continue
+        jobs.append((local_path, output_path, extension[1:]))
+
+    if not jobs:
+        logging.info("Parquet conversion: all outputs up to date")
+        return out_names, out_dirs, out_paths
+
+    logging.info(f"Converting {len(jobs)} CSV/JSON files to Parquet under {output_directory}")
+    start = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(convert_file_to_parquet, *job): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            total_rows += result["rows"]
+            if result["dropped"]:
+                logging.warning(f"⚠ {os.path.basename(result['source'])}: {result['dropped']} rows failed type conversion and were dropped")
+    logging.info(f"✓ Converted {len(jobs)} files ({total_rows} rows) in {time.perf_counter() - start:.2f}s")
+    return out_names, out_dirs, out_paths
+
+# Optional splitting: COPY hands whole files to its threads, so one multi-GB file loads on a single thread. CSV/JSON
+# files above SPLIT_CHUNK_BYTES are cut into near-equal chunks no larger than it (one row can overshoot)
+SPLIT_CHUNK_BYTES = 200 * 1024 * 1024
+SPLIT_INDEX_SUFFIX = '.chunks.json'
+
+def chunk_file_name(file_name, index) -> str:
+    """orders.csv -> orders.part0001.csv; the same source and chunk size always yield the same names"""
+    stem, extension = os.path.splitext(file_name)
+    return f"{stem}.part{index:04d}{extension}"
+
+def iter_csv_records(local_path):
+    """Yield raw CSV records as bytes; a quoted field's newlines stay inside its record"""
+    record = b''
+    quotes = 0
+    with open(local_path, 'rb') as f:
+        for line in f:
+            quotes += line.count(b'"')
+            record += line
+            # Inside a quoted field until the quotes pair up ("" escapes count twice)
+            if quotes % 2 == 0:
+                yield record
+                record = b''
+                quotes = 0
+    if record:
+        yield record
+
+def iter_split_records(local_path, source_format):
+    """(header, records) of a CSV/JSON file, each record as (bytes to write, source bytes it used); JSON arrays come
+    out as newline-delimited records"""
+    if source_format == 'csv':
+        records = iter_csv_records(local_path)
+        header = next(records, b'') if CSV_HAS_HEADER else b''
+        if header and not header.endswith(b'\n'):
+            header += b'\n'
+        return header, ((record, len(record)) for record in records)
+    # A re-serialized record is not the size of its source text, so each one carries its share of the source too
+    return b'', (((json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'),
+                  len(text.encode('utf-8'))) for record, text in iter_json_records(local_path, with_text=True))
+
+def split_file(local_path, output_dir, file_name, source_format, chunk_bytes=SPLIT_CHUNK_BYTES) -> dict:
+    """Cut one CSV/JSON file into header-carrying chunks of about equal size (runs in a worker process)"""
+    size = os.path.getsize(local_path)
+    # Equal shares avoid a tiny last chunk: a 450 MB file becomes three 150 MB chunks, not 200 + 200 + 50
+    target = size / -(-size // chunk_bytes)
+    header, records = iter_split_records(local_path, source_format)
+    os.makedirs(output_dir, exist_ok=True)
+
+    chunks = []
+    out = None
+    written = 0
+    consumed = 0
+    try:
+        for record, source_bytes in records:
+            # Cuts fall where the source read so far passes the next multiple of target, so neither the headers
+            # repeated in every chunk nor re-serialized JSON push a last sliver into a chunk of its own
+            if out is not None and (consumed >= len(chunks) * target or written + len(record) > chunk_bytes):
+                out.close()
+                os.replace(out.name, out.name[:-len('.tmp')])
+                out = None
+            if out is None:
+                chunks.append(chunk_file_name(file_name, len(chunks) + 1))
+                out = open(os.path.join(output_dir, f"{chunks[-1]}.tmp"), 'wb')
+                out.write(header)
+                written = len(header)
+            out.write(record)
+            written += len(record)
+            consumed += source_bytes
+    finally:
+        if out is not None:
+            out.close()
+            os.replace(out.name, out.name[:-len('.tmp')])
+
+    # The index is written last, so a split interrupted part-way is redone on the next run
+    index_path = os.path.join(output_dir, f"{file_name}{SPLIT_INDEX_SUFFIX}")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            stale = set(json.load(f)["chunks"]) - set(chunks)
+        for name in stale:
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+    stat = os.stat(local_path)
+    with open(f"{index_path}.tmp", 'w') as f:
+        json.dump({"source": local_path, "size": stat.st_size, "mtime": stat.st_mtime, "chunk_bytes": chunk_bytes,
+                   "chunks": chunks}, f, indent=1)
+    os.replace(f"{index_path}.tmp", index_path)
+    return {"source": local_path, "chunks": chunks, "bytes": size}
+
+def load_chunk_index(index_path, local_path, chunk_bytes):
+    """The chunk names of an up-to-date split, or None when the source or chunk size changed since"""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        index = json.load(f)
+    stat = os.stat(local_path)
+    if index["size"] != stat.st_size or index["mtime"] != stat.st_mtime or index["chunk_bytes"] != chunk_bytes:
+        return None
+    return index["chunks"]
+
+def split_large_files(file_names, partition_dirs, local_paths, output_directory, chunk_bytes=SPLIT_CHUNK_BYTES,
+                      max_workers=None) -> tuple:
+    """Replace CSV/JSON files larger than chunk_bytes with their chunks, in the same partitions"""
+    jobs = []
+    for idx, local_path in enumerate(local_paths):
+        extension = os.path.splitext(file_names[idx])[1].lower()
+        if extension not in ('.csv', '.json') or os.path.getsize(local_path) <= chunk_bytes:
+            continue
+        output_dir = os.path.join(output_directory, partition_dirs[idx])
+        index_path = os.path.join(output_dir, f"{file_names[idx]}{SPLIT_INDEX_SUFFIX}")
+        if load_chunk_index(index_path, local_path, chunk_bytes) is None:
+            jobs.append((local_path, output_dir, file_names[idx], extension[1:], chunk_bytes))
+
+    if jobs:
+        logging.info(f"Splitting {len(jobs)} large CSV/JSON files into chunks of up to {chunk_bytes / 1024 / 1024:.0f} MB "
+                     f"under {output_directory}")
+        start = time.perf_counter()
+        total_chunks = 0
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(split_file, *zip(*jobs)):
+                total_chunks += len(result["chunks"])
+                logging.info(f"  {os.path.basename(result['source'])}: {result['bytes'] / 1024 / 1024:.1f} MB → "
+                             f"{len(result['chunks'])} chunks")
+        logging.info(f"✓ Split {len(jobs)} files into {total_chunks} chunks in {time.perf_counter() - start:.2f}s")
+
+    out_names, out_dirs, out_paths = [], [], []
+    for idx, local_path in enumerate(local_paths):
+        extension = os.path.splitext(file_names[idx])[1].lower()
+        chunks = None
+        if extension in ('.csv', '.json') and os.path.getsize(local_path) > chunk_bytes:
+            output_dir = os.path.join(output_directory, partition_dirs[idx])
+            chunks = load_chunk_index(os.path.join(output_dir, f"{file_names[idx]}{SPLIT_INDEX_SUFFIX}"), local_path, chunk_bytes)
+        if chunks is None:
+            out_names.append(file_names[idx])
+            out_dirs.append(partition_dirs[idx])
+            out_paths.append(local_path)
+            continue
+        for name in chunks:
+            out_names.append(name)
+            out_dirs.append(partition_dirs[idx])
+            out_paths.append(os.path.join(output_dir, name))
+    return out_names, out_dirs, out_paths
+
+def partition_problem(partition_dir, source_format):
+    """Why a file's partition path breaks the source=XX/format=YY convention the COPYs read, or None"""
+    parts = [p for p in partition_dir.replace(os.sep, '/').split('/') if p]
+    fields = dict(p.split('=', 1) for p in parts if '=' in p)
+    if len(parts) != 2 or set(fields) != {"source", "format"}:
+        return f"partition '{partition_dir}' is not source=XX/format=YY"
+    if fields["source"] not in PARTITION_FORMATS:
+        return f"unknown source '{fields['source']}'"
+    if fields["format"] != source_format:
+        return f"a .{source_format} file under format={fields['format']}"
+    if source_format not in PARTITION_FORMATS[fields["source"]]:
+        return f"no COPY reads {source_format} for source={fields['source']}"
+    return None
+
+def iter_validation_frames(local_path, source_format, chunk_rows, verdict):
+    """Stream a file for validation; structural problems go on the verdict, rows come out as (DataFrame, positions)
+    with each row's physical line (CSV), record (JSON) or row (Parquet) number in the file"""
+    column_names = [name for name, _ in SALES_PARQUET_COLUMNS]
+    if source_format == 'parquet':
+        present = pq.ParquetFile(local_path).schema_arrow.names
+        missing = [c for c in column_names if c not in present]
+        if missing:
+            # Parquet is read by column name: a missing column would load as NULL
+            verdict["errors"].append(f"missing columns {missing}")
+            return
+
+    if source_format != 'csv':
+        seen = 0
+        for frame in iter_sales_frames(local_path, source_format, chunk_rows):
+            yield frame, range(seen + 1, seen + len(frame) + 1)
+            seen += len(frame)
+        return
+
+    # CSV is read by position, so every row needs exactly the COPY's column count, in its order
+    with open(local_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        if CSV_HAS_HEADER:
+            header = [h.strip() for h in next(reader, [])]
+            if sorted(header) == sorted(column_names) and header != column_names:
+                verdict["errors"].append(f"columns out of order: {header}")
+                return
+            if len(header) != len(column_names):
+                verdict["errors"].append(f"header has {len(header)} columns, expected {len(column_names)}")
+                return
+        rows = []
+        lines = []
+        # A record starts on the line after the previous one ended; quoted line breaks make it span several
+        line_number = reader.line_num + 1
+        for row in reader:
+            if len(row) != len(column_names):
+                verdict["bad_rows"] += 1
+                verdict["rows"] += 1
+                note_row_problem(verdict, f"line {line_number}: {len(row)} fields, expected {len(column_names)}")
+            else:
+                rows.append([value if value != '' else None for value in row])
+                lines.append(line_number)
+            line_number = reader.line_num + 1
+            if len(rows) >= chunk_rows:
+                yield pd.DataFrame(rows, columns=column_names), lines
+                rows = []
+                lines = []
+        if rows:
+            yield pd.DataFrame(rows, columns=column_names), lines
+
+def note_row_problem(verdict, message) -> None:
+    """Keep the first few row-level problems of a file as examples"""
+    if len(verdict["examples"]) < VALIDATION_MAX_EXAMPLES:
+        verdict["examples"].append(message)
+
+def validate_sales_file(local_path, partition_dir, chunk_rows=VALIDATION_CHUNK_ROWS,
+                        max_bad_ratio=VALIDATION_MAX_BAD_RATIO) -> dict:
+    """Stream one sales file and judge it against the COPY that will read it (runs in a worker process)"""
+    source_format = os.path.splitext(local_path)[1][1:].lower()
+    unit = {"csv": "line", "json": "record"}.get(source_format, "row")
+    verdict = {"path": local_path, "rows": 0, "bad_rows": 0, "errors": [], "examples": []}
+    problem = partition_problem(partition_dir, source_format)
+    if problem:
+        verdict["errors"].append(problem)
+    else:
         try:
-            target = f"{stage_location}/sales/{partition_dirs[idx]}" if partition_dirs[idx] else f"{stage_location}/sales"
-            
-            logging.info(f"Uploading {file_type}: {file_name} to {target}")
-            
-            put_result = session.file.put(
-                local_paths[idx], 
-                target, 
-                auto_compress=False, 
-                overwrite=True, 
-                parallel=4
-            )
-            
-            logging.info(f"✓ {file_name} => {put_result[0].status}")
-            
+            for frame, positions in iter_validation_frames(local_path, source_format, chunk_rows, verdict):
+                bad = pd.Series(False, index=frame.index)
+                for name in REQUIRED_SALES_FIELDS:
+                    missing = frame[name].isna() | (frame[name].astype(str).str.strip() == '')
+                    if missing.any():
+                        note_row_problem(verdict, f"{unit} {positions[int(missing.values.argmax())]}: {name} is empty")
+                    bad |= missing
+                _, failures = parse_sales_columns(frame)
+                for name, failed in failures.items():
+                    if failed.any():
+                        row = int(failed.values.argmax())
+                        note_row_problem(verdict, f"{unit} {positions[row]}: {name} '{frame[name].iloc[row]}' does not cast")
+                    bad |= failed
+                verdict["rows"] += len(frame)
+                verdict["bad_rows"] += int(bad.sum())
         except Exception as e:
-            logging.error(f"❌ Failed to upload {file_name}: {str(e)}")
+            verdict["errors"].append(f"unreadable: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
 
-def main():
-    directory_path = '/Users/kshitijkharche/Desktop/snowpark-e2e/end2end-sample-data/sales'
-    
+    if not verdict["errors"] and verdict["rows"] == 0:
+        verdict["errors"].append("no rows")
+    verdict["valid"] = not verdict["errors"] and verdict["bad_rows"] <= max_bad_ratio * verdict["rows"]
+    return verdict
+
+def validate_sales_files(file_names, partition_dirs, local_paths, max_bad_ratio=VALIDATION_MAX_BAD_RATIO,
+                         max_workers=None) -> tuple:
+    """Validate files across a process pool; returns the valid files' lists and every file's verdict"""
+    if not local_paths:
+        return (file_names, partition_dirs, local_paths), []
+    logging.info(f"Validating {len(local_paths)} files before upload...")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        verdicts = list(executor.map(validate_sales_file, local_paths, partition_dirs,
+                                     [VALIDATION_CHUNK_ROWS] * len(local_paths), [max_bad_ratio] * len(local_paths)))
+
+    valid = ([], [], [])
+    for idx, verdict in enumerate(verdicts):
+        if verdict["valid"]:
+            valid[0].append(file_names[idx])
+            valid[1].append(partition_dirs[idx])
+            valid[2].append(local_paths[idx])
+            continue
+        reasons = verdict["errors"] or [f"{verdict['bad_rows']} of {verdict['rows']} rows would be rejected"]
+        logging.error(f"❌ {local_paths[idx]}: {'; '.join(reasons + verdict['examples'])}")
+    rejected = len(verdicts) - len(valid[0])
+    logging.info(f"✓ Validated {len(verdicts)} files in {time.perf_counter() - start:.2f}s: "
+                 f"{len(valid[0])} valid, {rejected} rejected")
+    return valid, verdicts
+
+def save_validation_report(report_path, verdicts) -> None:
+    """Write every file's verdict as JSON"""
+    with open(report_path, 'w') as f:
+        json.dump(verdicts, f, indent=1)
+    logging.info(f"✓ Validation report written to {report_path}")
+
+def default_parquet_directory(directory) -> str:
+    """Converted files live beside the sales tree so they are never rescanned as sources"""
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), 'sales-parquet')
+
+def default_split_directory(directory) -> str:
+    """Chunks live beside the sales tree, like the Parquet conversions"""
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), 'sales-chunks')
+
+def default_manifest_path(directory) -> str:
+    """Keep the manifest beside (not inside) the sales tree so it is never scanned or uploaded"""
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), '.sales_upload_manifest.json')
+
+def main(directory_path=SALES_DATA_DIR, manifest_path=None, force=False, to_parquet=False, parquet_directory=None,
+         session=None, validate=True, max_bad_ratio=VALIDATION_MAX_BAD_RATIO, validation_report=None, split=False,
+         split_bytes=SPLIT_CHUNK_BYTES, split_directory=None):
     # Check if directory exists
     if not os.path.exists(directory_path):
         logging.error(f"Directory not found: {directory_path}")
-        return
+        return None
+    
+    # Get file lists in a single pass over the tree
+    scanned = scan_sales_directory(directory_path)
+    file_names, partition_dirs, local_paths = [], [], []
+    for ext in SALES_FILE_EXTENSIONS:
+        file_names += scanned[ext][0]
+        partition_dirs += scanned[ext][1]
+        local_paths += scanned[ext][2]
+    
+    # Optionally pay the CSV/JSON parse cost locally instead of in every COPY
+    if to_parquet:
+        parquet_directory = parquet_directory or default_parquet_directory(directory_path)
+        file_names, partition_dirs, local_paths = convert_sales_to_parquet(file_names, partition_dirs, local_paths, parquet_directory)
     
-    # Get file lists
-    csv_file_name, csv_partition_dir, csv_local_file_path = traverse_directory(directory_path, '.csv')
-    parquet_file_name, parquet_partition_dir, parquet_local_file_path = traverse_directory(directory_path, '.parquet')
-    json_file_name, json_partition_dir, json_local_file_path = traverse_directory(directory_path, '.json')
+    # Optionally cut big CSV/JSON files into chunks so the COPYs can spread them over the warehouse's threads
+    if split:
+        split_directory = split_directory or default_split_directory(directory_path)
+        file_names, partition_dirs, local_paths = split_large_files(file_names, partition_dirs, local_paths, split_directory, split_bytes)
     
     stage_location = '@sales_dwh.source.my_internal_stg'
+    manifest_path = manifest_path or default_manifest_path(directory_path)
+    manifest = {} if force else load_upload_manifest(manifest_path)
     
-    # Create session ONCE and reuse it
-    logging.info("Creating Snowflake session...")
-    session = get_snowpark_session()
+    # Only new or changed files need a PUT
+    upload_names, upload_dirs, upload_paths = select_changed_files(manifest, file_names, partition_dirs, local_paths, stage_location)
+    
+    # Reject files the COPYs would choke on before spending a PUT on them; rejected files stay out of the
+    # manifest, so they are checked again once fixed
+    rejected = []
+    if validate:
+        (upload_names, upload_dirs, upload_paths), verdicts = validate_sales_files(upload_names, upload_dirs, upload_paths, max_bad_ratio)
+        rejected = [verdict["path"] for verdict in verdicts if not verdict["valid"]]
+        if validation_report:
+            save_validation_report(validation_report, verdicts)
+    
+    if not upload_names:
+        # Persist any refreshed mtimes so the next run skips hashing
+        save_upload_manifest(manifest_path, manifest)
+        logging.info("✓ Stage is up to date, nothing to upload")
+        return {"files": 0, "uploaded": [], "failed": [], "rejected": rejected}
+    
+    # Create session ONCE and reuse it; a session passed in (e.g. the orchestrator's) is left open
+    owns_session = session is None
+    if owns_session:
+        logging.info("Creating Snowflake session...")
+        session = get_snowpark_session()
     
     try:
-        # Upload all file types
-        upload_files(session, csv_file_name, csv_partition_dir, csv_local_file_path, stage_location, "CSV")
-        upload_files(session, parquet_file_name, parquet_partition_dir, parquet_local_file_path, stage_location, "PARQUET")
-        upload_files(session, json_file_name, json_partition_dir, json_local_file_path, stage_location, "JSON")
+        # Upload all file types through one scheduler so partitions of every format overlap
+        summary = upload_files(session, upload_names, upload_dirs, upload_paths, stage_location, "sales")
+        summary["rejected"] = rejected
+        
+        record_uploads(manifest, summary["uploaded"], upload_names, upload_dirs, upload_paths, stage_location)
+        save_upload_manifest(manifest_path, manifest)
         
         logging.info("=" * 60)
-        logging.info("✓ All files uploaded successfully!")
+        if summary["failed"]:
+            logging.error(f"❌ {len(summary['failed'])} files failed to upload")
+        else:
+            logging.info("✓ All files uploaded successfully!")
         logging.info("=" * 60)
+        return summary
         
     except Exception as e:
         logging.error(f"Error during upload: {str(e)}")
+        raise
     finally:
-        session.close()
-        logging.info("Session closed")
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload local sales files to the Snowflake internal stage")
+    parser.add_argument("--directory", default=SALES_DATA_DIR, help="local sales tree (source=XX/format=YY partitions)")
+    parser.add_argument("--manifest", default=None, help="upload manifest path (default: beside the sales tree)")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and re-upload every file")
+    parser.add_argument("--to-parquet", action="store_true", help="convert CSV/JSON files to typed Parquet before upload")
+    parser.add_argument("--parquet-directory", default=None, help="where converted files are written (default: beside the sales tree)")
+    parser.add_argument("--split", action="store_true", help="cut large CSV/JSON files into chunks before upload")
+    parser.add_argument("--split-mb", type=float, default=SPLIT_CHUNK_BYTES / 1024 / 1024,
+                        help="largest chunk in MB; smaller files are uploaded whole")
+    parser.add_argument("--split-directory", default=None, help="where chunks are written (default: beside the sales tree)")
+    parser.add_argument("--skip-validation", action="store_true", help="upload without the pre-flight file validation")
+    parser.add_argument("--max-bad-ratio", type=float, default=VALIDATION_MAX_BAD_RATIO,
+                        help="share of rows a file may have that COPY would reject before the file is held back")
+    parser.add_argument("--validation-report", default=None, help="write every file's verdict as JSON to this path")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.directory, args.manifest, args.force, args.to_parquet, args.parquet_directory,
+         validate=not args.skip_validation, max_bad_ratio=args.max_bad_ratio, validation_report=args.validation_report,
+         split=args.split, split_bytes=int(args.split_mb * 1024 * 1024), split_directory=args.split_directory)
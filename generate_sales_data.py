@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from data_loading import SALES_PARQUET_COLUMNS, to_sales_table
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+# Scale factor 1.0 reproduces the sample data set (data_documentation/README.md): source -> (format, files, rows)
+SAMPLE_VOLUMES = {
+    "IN": ("csv", 31, 33911),
+    "US": ("parquet", 30, 22575),
+    "FR": ("json", 30, 18763)
+}
+GENERATOR_MANIFEST = 'generator.json'
+
+# Reference data; every generated value is a deterministic function of (seed, source, file)
+PRODUCTS = {
+    "Apple": ["iPhone 12", "iPhone 13", "iPhone 14", "iPhone SE"],
+    "Samsung": ["Galaxy S21", "Galaxy S22", "Galaxy A52", "Galaxy Z Flip"],
+    "OnePlus": ["9 Pro", "10T", "Nord 2"],
+    "Xiaomi": ["Redmi Note 11", "Mi 11X", "Poco F3"],
+    "Google": ["Pixel 6", "Pixel 6a", "Pixel 7"]
+}
+COLORS = ["Black", "White", "Blue", "Green", "Red", "Silver"]
+MEMORY_PRICE = {"64GB": 0, "128GB": 80, "256GB": 190, "512GB": 380}
+FIRST_NAMES = ["Aarav", "Maya", "Liam", "Chloe", "Noah", "Emma", "Arjun", "Lucas", "Olivia", "Ravi",
+               "Sophia", "Hugo", "Ananya", "Mason", "Ines", "Ethan", "Priya", "Louis", "Ava", "Kabir"]
+LAST_NAMES = ["Sharma", "Smith", "Martin", "Patel", "Johnson", "Bernard", "Gupta", "Brown", "Dubois",
+              "Iyer", "Miller", "Laurent", "Khan", "Davis", "Moreau", "Singh", "Wilson", "Lefevre"]
+STREETS = ["Main St", "Park Ave", "Station Rd", "Rue de Rivoli", "MG Road", "Oak Lane", "Lake View", "Hill Rd"]
+CITIES = {
+    "IN": ["Mumbai", "Delhi", "Bengaluru", "Pune", "Chennai"],
+    "US": ["New York", "Austin", "Seattle", "Chicago", "Denver"],
+    "FR": ["Paris", "Lyon", "Marseille", "Toulouse", "Nantes"]
+}
+PHONE_PREFIX = {"IN": "+91", "US": "+1", "FR": "+33"}
+TAX_RATE = {"IN": 0.18, "US": 0.08, "FR": 0.20}
+UNIT_PRICE_MULTIPLIER = {"IN": 75, "US": 1, "FR": 0.9}
+PROMOTIONS = {"PROMO5": 0.05, "PROMO10": 0.10, "SAVE15": 0.15, "FESTIVE20": 0.20}
+PROMOTION_RATE = 0.3
+PAYMENT_METHODS = {
+    "Credit Card": ["Visa", "Mastercard", "Amex"],
+    "Debit Card": ["Visa", "Mastercard"],
+    "Wallet": ["PayPal", "Apple Pay", "Google Pay"],
+    "Cash On Delivery": ["NA"]
+}
+PAYMENT_STATUSES = (["Paid", "Pending", "Failed"], [0.45, 0.30, 0.25])
+SHIPPING_STATUSES = (["Delivered", "Shipped", "Returned"], [0.42, 0.33, 0.25])
+
+# Exchange-rate file: rate column -> (start value, daily volatility); USD2EU/USD2INR are the ones curation joins
+EXCHANGE_RATES = {
+    "USD2USD": (1.0, 0.0),
+    "USD2EU": (0.9, 0.003),
+    "USD2CAD": (1.32, 0.003),
+    "USD2UK": (0.78, 0.003),
+    "USD2INR": (74.5, 0.002),
+    "USD2JP": (108.0, 0.003)
+}
+
+def product_catalogue() -> list:
+    """Every Brand/Model/Color/Memory mobile key with its USD unit price"""
+    catalogue = []
+    for brand_idx, (brand, models) in enumerate(PRODUCTS.items()):
+        for model_idx, model in enumerate(models):
+            base_price = 299 + 100 * ((brand_idx * 7 + model_idx * 3) % 9)
+            for color in COLORS:
+                for memory, extra in MEMORY_PRICE.items():
+                    catalogue.append((f"{brand}/{model}/{color}/{memory}", base_price + extra))
+    return catalogue
+
+def skewed_weights(size, skew) -> np.ndarray:
+    """Zipf-like popularity: weight ~ 1 / rank^skew (skew 0 is uniform)"""
+    weights = 1.0 / np.power(np.arange(1, size + 1, dtype=float), skew)
+    return weights / weights.sum()
+
+def customer_attributes(source, customer_idx) -> tuple:
+    """Name, phone and address derived from a customer number, so no customer table has to be shared"""
+    first = np.array(FIRST_NAMES)[customer_idx % len(FIRST_NAMES)]
+    last = np.array(LAST_NAMES)[(customer_idx // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    # Past the name combinations, a generation suffix keeps customers distinct
+    generation = customer_idx // (len(FIRST_NAMES) * len(LAST_NAMES))
+    suffix = pd.Series(generation).map(lambda g: f" {g}" if g else "")
+    names = pd.Series(first) + " " + pd.Series(last) + suffix
+    phones = PHONE_PREFIX[source] + " " + pd.Series((1000000000 + (customer_idx * 7919) % 8999999999).astype(str))
+    streets = np.array(STREETS)[customer_idx % len(STREETS)]
+    cities = np.array(CITIES[source])[(customer_idx // len(STREETS)) % len(CITIES[source])]
+    addresses = pd.Series(((customer_idx * 31) % 998 + 1).astype(str)) + " " + pd.Series(streets) + ", " + pd.Series(cities)
+    return names, phones, addresses
+
+def generate_frame(source, first_slot, rows, customers, settings) -> pd.DataFrame:
+    """One file's orders; slot numbers make order ids unique per source across files"""
+    rng = np.random.default_rng([settings["seed"], list(SAMPLE_VOLUMES).index(source), first_slot])
+    slots = np.arange(first_slot, first_slot + rows)
+
+    # A duplicate re-sends an order from an earlier slot (this file or a previous one) with fresh attributes
+    duplicate = (rng.random(rows) < settings["duplicate_ratio"]) & (slots > 0)
+    order_numbers = np.where(duplicate, (rng.random(rows) * slots).astype(np.int64), slots)
+
+    catalogue = product_catalogue()
+    product_idx = rng.choice(len(catalogue), size=rows, p=skewed_weights(len(catalogue), settings["skew"]))
+    customer_idx = rng.choice(customers, size=rows, p=skewed_weights(customers, settings["skew"]))
+    names, phones, addresses = customer_attributes(source, customer_idx)
+
+    quantity = rng.integers(1, 6, size=rows)
+    unit_price = np.round(np.array([catalogue[i][1] for i in product_idx]) * UNIT_PRICE_MULTIPLIER[source], 0)
+    total_price = quantity * unit_price
+    codes = np.array(list(PROMOTIONS))
+    has_promo = rng.random(rows) < PROMOTION_RATE
+    promo = np.where(has_promo, codes[rng.integers(0, len(codes), size=rows)], None)
+    discount = np.array([PROMOTIONS.get(code, 0.0) for code in promo])
+    order_amount = np.round(total_price * (1 - discount), 2)
+    tax = np.round(order_amount * TAX_RATE[source], 2)
+
+    start = datetime.date.fromisoformat(settings["start_date"])
+    order_dates = [(start + datetime.timedelta(days=int(d))).isoformat() for d in rng.integers(0, settings["days"], size=rows)]
+    methods = np.array(list(PAYMENT_METHODS))[rng.integers(0, len(PAYMENT_METHODS), size=rows)]
+    providers = [PAYMENT_METHODS[m][i % len(PAYMENT_METHODS[m])] for m, i in zip(methods, rng.integers(0, 3, size=rows))]
+
+    values = [
+        pd.Series([f"{source}-{n:010d}" for n in order_numbers]),
+        names,
+        pd.Series([catalogue[i][0] for i in product_idx]),
+        quantity,
+        unit_price,
+        total_price,
+        promo,
+        order_amount,
+        tax,
+        order_dates,
+        rng.choice(PAYMENT_STATUSES[0], size=rows, p=PAYMENT_STATUSES[1]),
+        rng.choice(SHIPPING_STATUSES[0], size=rows, p=SHIPPING_STATUSES[1]),
+        methods,
+        providers,
+        phones,
+        addresses
+    ]
+    # Column names and order are the staged-file layout the COPY statements read
+    return pd.DataFrame({name: list(value) for (name, _), value in zip(SALES_PARQUET_COLUMNS, values)})
+
+def write_sales_file(task) -> dict:
+    """Generate and write one sales file (runs in a worker process)"""
+    source, source_format, output_path, first_slot, rows, customers, settings = task
+    frame = generate_frame(source, first_slot, rows, customers, settings)
+    tmp_path = f"{output_path}.tmp"
+    if source_format == 'csv':
+        frame.to_csv(tmp_path, index=False)
+    elif source_format == 'parquet':
+        table, _ = to_sales_table(frame)
+        pq.write_table(table, tmp_path, compression='snappy')
+    else:
+        frame.to_json(tmp_path, orient='records')
+    os.replace(tmp_path, output_path)
+    return {"source": source, "rows": rows, "bytes": os.path.getsize(output_path)}
+
+def write_exchange_rates(output_directory, settings) -> int:
+    """Daily USD exchange rates covering every generated order date"""
+    rng = np.random.default_rng([settings["seed"], len(SAMPLE_VOLUMES)])
+    start = datetime.date.fromisoformat(settings["start_date"])
+    rates = pd.DataFrame({"DATE": [(start + datetime.timedelta(days=d)).isoformat() for d in range(settings["days"])]})
+    for column, (initial, volatility) in EXCHANGE_RATES.items():
+        walk = np.cumprod(1 + rng.normal(0, volatility, size=settings["days"]))
+        rates[column] = np.round(initial * walk, 7)
+    rates.to_csv(os.path.join(output_directory, 'exchange-rate-data.csv'), index=False)
+    return len(rates)
+
+def plan_files(output_directory, scale, rows_per_file, settings) -> list:
+    """One write task per file, with per-source slot ranges fixed up front"""
+    tasks = []
+    for source, (source_format, sample_files, sample_rows) in SAMPLE_VOLUMES.items():
+        total_rows = max(1, round(sample_rows * scale))
+        per_file = rows_per_file or math.ceil(sample_rows / sample_files)
+        files = math.ceil(total_rows / per_file)
+        # Roughly 20 orders per customer, at least a few hundred customers
+        customers = max(500, total_rows // 20)
+        partition = os.path.join(output_directory, 'sales', f"source={source}", f"format={source_format}")
+        os.makedirs(partition, exist_ok=True)
+        for file_idx in range(files):
+            first_slot = file_idx * per_file
+            rows = min(per_file, total_rows - first_slot)
+            output_path = os.path.join(partition, f"order-{source.lower()}-{file_idx:05d}.{source_format}")
+            tasks.append((source, source_format, output_path, first_slot, rows, customers, settings))
+    return tasks
+
+def generate(output_directory, scale=1.0, duplicate_ratio=0.02, skew=1.0, seed=42,
+             start_date='2020-01-01', days=365, rows_per_file=None, max_workers=None) -> dict:
+    """Write the IN CSV / US Parquet / FR JSON partitions and the exchange-rate file; returns rows per source"""
+    settings = {"seed": seed, "duplicate_ratio": duplicate_ratio, "skew": skew, "start_date": start_date, "days": days}
+    tasks = plan_files(output_directory, scale, rows_per_file, settings)
+    logging.info(f"Generating {len(tasks)} files at scale {scale} into {output_directory}")
+
+    start = time.perf_counter()
+    rows = {source: 0 for source in SAMPLE_VOLUMES}
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_sales_file, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            rows[result["source"]] += result["rows"]
+            total_bytes += result["bytes"]
+    rate_rows = write_exchange_rates(output_directory, settings)
+
+    # Parameters and volumes beside the data, so a benchmark can tell what it is reading
+    with open(os.path.join(output_directory, GENERATOR_MANIFEST), 'w') as f:
+        json.dump({"scale": scale, "rows_per_file": rows_per_file, **settings, "rows": rows, "files": len(tasks)}, f, indent=1)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"✓ Generated {sum(rows.values())} rows ({total_bytes / 1024 / 1024:.1f} MB) "
+                 f"and {rate_rows} exchange-rate days in {elapsed:.2f}s")
+    for source, cnt in rows.items():
+        logging.info(f"  {source}: {cnt} rows")
+    return rows
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic sales files in the staged-file layout")
+    parser.add_argument("--output", required=True, help="directory to write sales/ and exchange-rate-data.csv into")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiple of the sample data volume (1.0 = ~75k rows)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.02, help="fraction of rows re-sending an earlier ORDER_ID")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent for customer and product popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same arguments always produce the same files")
+    parser.add_argument("--start-date", default='2020-01-01', help="first order date")
+    parser.add_argument("--days", type=int, default=365, help="number of days order dates are spread over")
+    parser.add_argument("--rows-per-file", type=int, default=None, help="rows per file (default: the sample's average per source)")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    generate(args.output, args.scale, args.duplicate_ratio, args.skew, args.seed,
+             args.start_date, args.days, args.rows_per_file)
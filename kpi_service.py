@@ -0,0 +1,177 @@
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+
+from snowflake.snowpark.functions import col, lit, sum, count
+from pipeline_backend import get_snowpark_session, read_model_version
+from sales_rollups import ROLLUP_TABLE
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+# Results kept per server, least recently used evicted first
+KPI_CACHE_ENTRIES = 256
+# The model version is re-read at most this often; a fact load shows up in cached answers within this window
+VERSION_CHECK_SECONDS = 30.0
+TOP_BRANDS_LIMIT = 10
+
+def rollup_between(session, start_date, end_date, country=None):
+    """Rollup rows in [start_date, end_date], optionally for one country"""
+    rollup_df = session.table(ROLLUP_TABLE).filter((col("ORDER_DT") >= lit(start_date)) & (col("ORDER_DT") <= lit(end_date)))
+    return rollup_df.filter(col("COUNTRY") == country) if country else rollup_df
+
+def query_revenue_by_country(session, start_date, end_date) -> list:
+    """USD revenue and orders per country"""
+    rows = rollup_between(session, start_date, end_date).group_by(col("COUNTRY")).agg(
+        sum(col("USD_TOTAL_ORDER_AMT")).alias("REVENUE_USD"), sum(col("ORDER_COUNT")).alias("ORDERS")
+    ).sort(col("REVENUE_USD").desc()).collect()
+    return [{"country": row["COUNTRY"], "revenue_usd": row["REVENUE_USD"], "orders": int(row["ORDERS"])} for row in rows]
+
+def query_revenue_by_date(session, start_date, end_date, country=None) -> list:
+    """USD revenue and orders per day"""
+    rows = rollup_between(session, start_date, end_date, country).group_by(col("ORDER_DT")).agg(
+        sum(col("USD_TOTAL_ORDER_AMT")).alias("REVENUE_USD"), sum(col("ORDER_COUNT")).alias("ORDERS")
+    ).sort(col("ORDER_DT")).collect()
+    return [{"order_dt": row["ORDER_DT"], "revenue_usd": row["REVENUE_USD"], "orders": int(row["ORDERS"])} for row in rows]
+
+def query_promo_effectiveness(session, start_date, end_date, country=None) -> list:
+    """Orders, USD revenue and average order value per promotion code"""
+    rows = rollup_between(session, start_date, end_date, country).group_by(col("PROMOTION_CODE")).agg(
+        sum(col("ORDER_COUNT")).alias("ORDERS"), sum(col("USD_TOTAL_ORDER_AMT")).alias("REVENUE_USD")
+    ).sort(col("REVENUE_USD").desc()).collect()
+    return [{"promotion_code": row["PROMOTION_CODE"], "orders": int(row["ORDERS"]), "revenue_usd": row["REVENUE_USD"],
+             "avg_order_usd": row["REVENUE_USD"] / row["ORDERS"] if row["ORDERS"] else None} for row in rows]
+
+def query_top_brands(session, start_date, end_date, limit=TOP_BRANDS_LIMIT, country=None) -> list:
+    """Brands by USD revenue; the rollup has no product grain, so this one reads sales_fact"""
+    fact_df = session.table("sales_dwh.consumption.sales_fact")
+    dates_df = session.table("sales_dwh.consumption.date_dim") \
+        .filter((col("ORDER_DT") >= lit(start_date)) & (col("ORDER_DT") <= lit(end_date))) \
+        .select(col("DATE_ID_PK").alias("K_DATE_ID"))
+    products_df = session.table("sales_dwh.consumption.product_dim") \
+        .select(col("PRODUCT_ID_PK").alias("K_PRODUCT_ID"), col("BRAND"))
+    brand_df = fact_df.join(dates_df, col("DATE_ID_FK") == col("K_DATE_ID")) \
+        .join(products_df, col("PRODUCT_ID_FK") == col("K_PRODUCT_ID"))
+    if country:
+        regions_df = session.table("sales_dwh.consumption.region_dim").filter(col("COUNTRY") == country) \
+            .select(col("REGION_ID_PK").alias("K_REGION_ID"))
+        brand_df = brand_df.join(regions_df, col("REGION_ID_FK") == col("K_REGION_ID"))
+    rows = brand_df.select(col("BRAND"), col("ORDER_QUANTITY"), col("USD_TOTAL_ORDER_AMT")).group_by(col("BRAND")).agg(
+        sum(col("USD_TOTAL_ORDER_AMT")).alias("REVENUE_USD"), sum(col("ORDER_QUANTITY")).alias("UNITS"),
+        count(lit(1)).alias("ORDERS")
+    ).sort(col("REVENUE_USD").desc()).limit(limit).collect()
+    return [{"brand": row["BRAND"], "revenue_usd": row["REVENUE_USD"], "units": int(row["UNITS"]),
+             "orders": int(row["ORDERS"])} for row in rows]
+
+KPI_QUERIES = {
+    "revenue_by_country": query_revenue_by_country,
+    "revenue_by_date": query_revenue_by_date,
+    "promo_effectiveness": query_promo_effectiveness,
+    "top_brands": query_top_brands
+}
+
+def create_kpi_server(session, max_entries=KPI_CACHE_ENTRIES, version_check_seconds=VERSION_CHECK_SECONDS) -> dict:
+    """KPI answers cached in memory for the current consumption model version"""
+    return {"session": session, "cache": OrderedDict(), "max_entries": max_entries, "version": None,
+            "version_checked": None, "version_check_seconds": version_check_seconds, "lock": threading.Lock(),
+            "stats": {"hits": 0, "misses": 0, "invalidations": 0}}
+
+def current_model_version(server) -> int:
+    """The model version, re-read once the last check is older than version_check_seconds"""
+    now = time.monotonic()
+    with server["lock"]:
+        if server["version"] is not None and now - server["version_checked"] < server["version_check_seconds"]:
+            return server["version"]
+        # Claimed before the read, so concurrent callers keep using the current version meanwhile
+        server["version_checked"] = now
+    version = read_model_version(server["session"])
+    with server["lock"]:
+        if version != server["version"]:
+            if server["version"] is not None:
+                server["cache"].clear()
+                server["stats"]["invalidations"] += 1
+                logging.info(f"Consumption model version {server['version']} → {version}, KPI cache cleared")
+            server["version"] = version
+    return version
+
+def serve_kpi(server, kpi, **params) -> list:
+    """A KPI's rows from the cache, or from the warehouse on a miss"""
+    version = current_model_version(server)
+    key = (version, kpi, tuple(sorted(params.items())))
+    with server["lock"]:
+        if key in server["cache"]:
+            server["cache"].move_to_end(key)
+            server["stats"]["hits"] += 1
+            return [dict(row) for row in server["cache"][key]]
+        server["stats"]["misses"] += 1
+
+    rows = KPI_QUERIES[kpi](server["session"], **params)
+    with server["lock"]:
+        # A result computed while the version moved on is stale; it is returned but not kept
+        if version == server["version"]:
+            server["cache"][key] = rows
+            while len(server["cache"]) > server["max_entries"]:
+                server["cache"].popitem(last=False)
+    return [dict(row) for row in rows]
+
+def revenue_by_country(server, start_date: date, end_date: date) -> list:
+    """USD revenue and orders per country between two dates (inclusive)"""
+    return serve_kpi(server, "revenue_by_country", start_date=start_date, end_date=end_date)
+
+def revenue_by_date(server, start_date: date, end_date: date, country: Optional[str] = None) -> list:
+    """Daily USD revenue and orders between two dates, optionally for one country"""
+    return serve_kpi(server, "revenue_by_date", start_date=start_date, end_date=end_date, country=country)
+
+def promo_effectiveness(server, start_date: date, end_date: date, country: Optional[str] = None) -> list:
+    """Orders, revenue and average order value per promotion code between two dates"""
+    return serve_kpi(server, "promo_effectiveness", start_date=start_date, end_date=end_date, country=country)
+
+def top_brands(server, start_date: date, end_date: date, limit: int = TOP_BRANDS_LIMIT,
+               country: Optional[str] = None) -> list:
+    """The product_dim brands with the most USD revenue between two dates"""
+    return serve_kpi(server, "top_brands", start_date=start_date, end_date=end_date, limit=limit, country=country)
+
+def main(kpi, start_date, end_date, country=None, limit=TOP_BRANDS_LIMIT, repeat=1, session=None):
+    """Serve one KPI, repeat times, and log its rows and the cache statistics"""
+    params = {"start_date": start_date, "end_date": end_date}
+    if kpi != "revenue_by_country":
+        params["country"] = country
+    if kpi == "top_brands":
+        params["limit"] = limit
+
+    owns_session = session is None
+    session = session or get_snowpark_session()
+    try:
+        server = create_kpi_server(session)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = serve_kpi(server, kpi, **params)
+            logging.info(f"{kpi}: {len(rows)} rows in {(time.perf_counter() - started) * 1000:.1f}ms")
+        for row in rows:
+            logging.info(f"  {row}")
+        logging.info(f"✓ Cache: {server['stats']['hits']} hits, {server['stats']['misses']} misses "
+                     f"(model version {server['version']})")
+        return rows
+    finally:
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a consumption-layer KPI through the in-process result cache")
+    parser.add_argument("kpi", choices=list(KPI_QUERIES), help="KPI to serve")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first order date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="last order date (YYYY-MM-DD)")
+    parser.add_argument("--country", default=None, help="restrict to one country (not for revenue_by_country)")
+    parser.add_argument("--limit", type=int, default=TOP_BRANDS_LIMIT, help="brands returned by top_brands")
+    parser.add_argument("--repeat", type=int, default=1, help="serve the KPI this many times (repeats hit the cache)")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.kpi, args.start, args.end, args.country, args.limit, args.repeat)
@@ -0,0 +1,37 @@
+import sys
+import logging
+import argparse
+
+import stage2source
+import source2curated
+import curated2model
+from pipeline_backend import create_local_session, LOCAL_DATA_DIR
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+def main(data_dir=LOCAL_DATA_DIR, parquet=False, incremental=False):
+    """Run stage2source → source2curated → curated2model in one process on a local session"""
+    # Local tables live in the session, so every stage has to share it
+    session = create_local_session(data_dir)
+    try:
+        stage2source.main(parquet=parquet, session=session)
+        source2curated.main(incremental=incremental, session=session)
+        curated2model.main(session=session)
+    finally:
+        session.close()
+        logging.info("Local session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the whole pipeline offline on Snowpark's local testing engine")
+    parser.add_argument("--data-dir", default=LOCAL_DATA_DIR,
+                        help="sample data tree with sales/source=XX/format=YY partitions and exchange-rate-data.csv")
+    parser.add_argument("--parquet", action="store_true",
+                        help="load India and France from the sales-parquet tree written by data_loading.py --to-parquet")
+    parser.add_argument("--incremental", action="store_true",
+                        help="run source2curated in incremental (watermark + MERGE) mode")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.data_dir, args.parquet, args.incremental)
@@ -0,0 +1,511 @@
+import os
+import json
+import hashlib
+import logging
+import weakref
+import datetime
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+from snowflake.snowpark import Session, DataFrame, Column, Window
+from snowflake.snowpark.functions import col, lit, row_number, sql_expr, hash, when_matched, when_not_matched
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.mock import patch, ColumnEmulator, ColumnType
+from snowflake.snowpark.table import MergeResult
+from snowflake.snowpark.types import StructType, StructField, StringType, LongType, FloatType, DateType, TimestampType
+
+# "snowflake" runs against the warehouse; "local" runs the same DataFrame code on Snowpark's local testing engine
+PIPELINE_BACKEND = os.getenv("PIPELINE_BACKEND", "snowflake")
+
+# Connection settings come from the environment; the defaults are the project account
+SNOWFLAKE_CONNECTION_DEFAULTS = {
+    "ACCOUNT": "QNNERMQ-RZ07987",
+    "USER": "snowpark_user",
+    "PASSWORD": "YOUR_PASSWORD_HERE",
+    "ROLE": "SYSADMIN",
+    "DATABASE": "sales_dwh",
+    "WAREHOUSE": "SNOWPARK_ETL_WH"
+}
+
+# Declared clustering keys: ensure_clustering_keys brings each table's key in line with this, and the writers sort
+# on it so freshly written micro-partitions are already clustered. Dashboards filter the curated sets by date (each
+# holds a single country), the rollup by date and country, and the fact by date and region
+CLUSTERING_KEYS = {
+    "sales_dwh.curated.in_sales_order": ["ORDER_DT"],
+    "sales_dwh.curated.us_sales_order": ["ORDER_DT"],
+    "sales_dwh.curated.fr_sales_order": ["ORDER_DT"],
+    "sales_dwh.consumption.sales_fact": ["DATE_ID_FK", "REGION_ID_FK"],
+    "sales_dwh.consumption.sales_daily_rollup": ["ORDER_DT", "COUNTRY"]
+}
+
+# Local backend: the sample data tree stands in for the internal stage
+LOCAL_DATA_DIR = os.getenv("PIPELINE_LOCAL_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'end2end-sample-data'))
+LOCAL_EXCHANGE_RATE_FILE = 'exchange-rate-data.csv'
+EXCHANGE_RATE_TABLE = "sales_dwh.common.exchange_rate"
+
+# region -> (partition source code, staged format, source table, contact column); mirrors the COPY statements
+LOCAL_SOURCE_TABLES = {
+    "India": ("IN", "csv", "sales_dwh.source.in_sales_order", "MOBILE"),
+    "USA": ("US", "parquet", "sales_dwh.source.us_sales_order", "PHONE"),
+    "France": ("FR", "json", "sales_dwh.source.fr_sales_order", "PHONE")
+}
+
+# Amounts are NUMBER(10,2) in Snowflake; the local engine casts DECIMAL operands to integers
+# before arithmetic (fails on any cents), so local tables hold them as floats
+AMOUNT_TYPE = FloatType()
+RATE_TYPE = FloatType()
+USD_AMOUNT_TYPE = FloatType()
+
+def source_table_schema(contact_column) -> StructType:
+    """Layout of a source.*_sales_order table, in COPY column order (MOBILE for India, PHONE elsewhere)"""
+    return StructType([
+        StructField("SALES_ORDER_KEY", LongType()),
+        StructField("ORDER_ID", StringType()),
+        StructField("CUSTOMER_NAME", StringType()),
+        StructField("MOBILE_KEY", StringType()),
+        StructField("ORDER_QUANTITY", LongType()),
+        StructField("UNIT_PRICE", AMOUNT_TYPE),
+        StructField("ORDER_VALUE", AMOUNT_TYPE),
+        StructField("PROMOTION_CODE", StringType()),
+        StructField("FINAL_ORDER_AMOUNT", AMOUNT_TYPE),
+        StructField("TAX_AMOUNT", AMOUNT_TYPE),
+        StructField("ORDER_DT", DateType()),
+        StructField("PAYMENT_STATUS", StringType()),
+        StructField("SHIPPING_STATUS", StringType()),
+        StructField("PAYMENT_METHOD", StringType()),
+        StructField("PAYMENT_PROVIDER", StringType()),
+        StructField(contact_column, StringType()),
+        StructField("SHIPPING_ADDRESS", StringType()),
+        StructField("_METADATA_FILE_NAME", StringType()),
+        StructField("_METADATA_ROW_NUMBER", LongType()),
+        StructField("_METADATA_LAST_MODIFIED", TimestampType())
+    ])
+
+CURATED_TABLE_SCHEMA = StructType([
+    StructField("SALES_ORDER_KEY", LongType()),
+    StructField("ORDER_ID", StringType()),
+    StructField("ORDER_DT", DateType()),
+    StructField("CUSTOMER_NAME", StringType()),
+    StructField("MOBILE_KEY", StringType()),
+    StructField("COUNTRY", StringType()),
+    StructField("REGION", StringType()),
+    StructField("ORDER_QUANTITY", LongType()),
+    StructField("LOCAL_CURRENCY", StringType()),
+    StructField("LOCAL_UNIT_PRICE", AMOUNT_TYPE),
+    StructField("PROMOTION_CODE", StringType()),
+    StructField("LOCAL_TOTAL_ORDER_AMT", AMOUNT_TYPE),
+    StructField("LOCAL_TAX_AMT", AMOUNT_TYPE),
+    StructField("EXCHANGE_RATE", RATE_TYPE),
+    StructField("USD_TOTAL_ORDER_AMT", USD_AMOUNT_TYPE),
+    StructField("USD_TAX_AMT", USD_AMOUNT_TYPE),
+    StructField("PAYMENT_STATUS", StringType()),
+    StructField("SHIPPING_STATUS", StringType()),
+    StructField("PAYMENT_METHOD", StringType()),
+    StructField("PAYMENT_PROVIDER", StringType()),
+    StructField("CONTACT_NO", StringType()),
+    StructField("SHIPPING_ADDRESS", StringType()),
+    StructField("ORDER_YEAR", LongType()),
+    StructField("ORDER_MONTH", LongType()),
+    StructField("ORDER_QUARTER", LongType())
+])
+
+def dim_schema(key_column, *columns) -> StructType:
+    """Consumption dimension layout: surrogate key, text attributes, isActive flag"""
+    return StructType(
+        [StructField(key_column, LongType())]
+        + [StructField(c, StringType()) for c in columns]
+        + [StructField("ISACTIVE", StringType())]
+    )
+
+# Empty tables the local session starts with; the warehouse has these from the project DDL
+LOCAL_TABLE_SCHEMAS = {
+    **{table: source_table_schema(contact) for _, _, table, contact in LOCAL_SOURCE_TABLES.values()},
+    "sales_dwh.curated.in_sales_order": CURATED_TABLE_SCHEMA,
+    "sales_dwh.curated.us_sales_order": CURATED_TABLE_SCHEMA,
+    "sales_dwh.curated.fr_sales_order": CURATED_TABLE_SCHEMA,
+    "sales_dwh.consumption.region_dim": dim_schema("REGION_ID_PK", "COUNTRY", "REGION"),
+    "sales_dwh.consumption.product_dim": dim_schema("PRODUCT_ID_PK", "MOBILE_KEY", "BRAND", "MODEL", "COLOR", "MEMORY"),
+    "sales_dwh.consumption.promo_code_dim": dim_schema("PROMO_CODE_ID_PK", "PROMOTION_CODE", "COUNTRY", "REGION"),
+    "sales_dwh.consumption.customer_dim": dim_schema("CUSTOMER_ID_PK", "CUSTOMER_NAME", "CONTACT_NO", "SHIPPING_ADDRESS", "COUNTRY", "REGION"),
+    "sales_dwh.consumption.payment_dim": dim_schema("PAYMENT_ID_PK", "PAYMENT_METHOD", "PAYMENT_PROVIDER", "COUNTRY", "REGION"),
+    "sales_dwh.consumption.date_dim": StructType([
+        StructField("DATE_ID_PK", LongType()),
+        StructField("ORDER_DT", DateType()),
+        StructField("DAY_COUNTER", LongType()),
+        StructField("ORDER_YEAR", LongType()),
+        StructField("ORDER_MONTH", LongType()),
+        StructField("ORDER_QUARTER", LongType()),
+        StructField("ORDER_DAYOFWEEK", LongType()),
+        StructField("ORDER_DAYNAME", StringType()),
+        StructField("ORDER_DAYOFMONTH", LongType()),
+        StructField("ORDER_WEEKDAY", StringType()),
+        StructField("FISCAL_YEAR", LongType()),
+        StructField("FISCAL_QUARTER", LongType()),
+        StructField("FISCAL_MONTH", LongType())
+    ]),
+    "sales_dwh.consumption.sales_fact": StructType([
+        StructField("ORDER_ID_PK", LongType()),
+        StructField("ORDER_CODE", StringType()),
+        StructField("DATE_ID_FK", LongType()),
+        StructField("REGION_ID_FK", LongType()),
+        StructField("CUSTOMER_ID_FK", LongType()),
+        StructField("PAYMENT_ID_FK", LongType()),
+        StructField("PRODUCT_ID_FK", LongType()),
+        StructField("PROMO_CODE_ID_FK", LongType()),
+        StructField("ORDER_QUANTITY", LongType()),
+        StructField("LOCAL_TOTAL_ORDER_AMT", AMOUNT_TYPE),
+        StructField("LOCAL_TAX_AMT", AMOUNT_TYPE),
+        StructField("EXCHANGE_RATE", RATE_TYPE),
+        StructField("USD_TOTAL_ORDER_AMT", USD_AMOUNT_TYPE),
+        StructField("USD_TAX_AMT", USD_AMOUNT_TYPE)
+    ])
+}
+
+# Per local session: data directory and sequence counters (the local engine has no sequences)
+_LOCAL_STATE = weakref.WeakKeyDictionary()
+
+def snowflake_connection_parameters(schema=None) -> dict:
+    """Connection parameters with SNOWFLAKE_<NAME> environment overrides"""
+    connection_parameters = {
+        name: os.getenv(f"SNOWFLAKE_{name}", default) for name, default in SNOWFLAKE_CONNECTION_DEFAULTS.items()
+    }
+    if schema:
+        connection_parameters["SCHEMA"] = schema
+    return connection_parameters
+
+def get_snowpark_session(schema=None, backend=None) -> Session:
+    """Create a session on the configured backend (PIPELINE_BACKEND)"""
+    backend = backend or PIPELINE_BACKEND
+    if backend == "local":
+        return create_local_session()
+    if backend != "snowflake":
+        raise ValueError(f"Unknown pipeline backend '{backend}', expected 'snowflake' or 'local'")
+    return Session.builder.configs(snowflake_connection_parameters(schema)).create()
+
+def is_local(session) -> bool:
+    """True for sessions created by create_local_session"""
+    return session in _LOCAL_STATE
+
+def set_query_tag(session, tag) -> None:
+    """Set (or with None, unset) the session query tag; the local engine runs no SQL, so it only remembers it"""
+    if is_local(session):
+        _LOCAL_STATE[session]["query_tag"] = tag
+    else:
+        session.query_tag = tag
+
+def get_query_tag(session):
+    """The session's current query tag"""
+    if is_local(session):
+        return _LOCAL_STATE[session].get("query_tag")
+    return session.query_tag
+
+def create_session_pool(backend=None, data_dir=LOCAL_DATA_DIR) -> dict:
+    """Sessions shared by the stages of one process; nothing logs in until a stage asks for a session"""
+    return {"backend": backend or PIPELINE_BACKEND, "data_dir": data_dir, "idle": [], "sessions": [],
+            "lock": threading.Lock()}
+
+@contextmanager
+def pooled_session(pool):
+    """Borrow an idle pooled session, logging in a new one only while every pooled session is busy"""
+    with pool["lock"]:
+        if pool["backend"] == "local":
+            # Local tables live in the session, so every stage has to share the one session
+            if not pool["sessions"]:
+                pool["sessions"].append(create_local_session(pool["data_dir"]))
+            session = pool["sessions"][0]
+        else:
+            session = pool["idle"].pop() if pool["idle"] else None
+    if session is None:
+        # Logged in outside the lock so parallel stages do not wait on each other's logins
+        session = get_snowpark_session(backend=pool["backend"])
+        with pool["lock"]:
+            pool["sessions"].append(session)
+    try:
+        yield session
+    finally:
+        with pool["lock"]:
+            if session not in pool["idle"]:
+                pool["idle"].append(session)
+
+def close_session_pool(pool) -> None:
+    """Close every session the pool opened"""
+    for session in pool["sessions"]:
+        session.close()
+    logging.info(f"{len(pool['sessions'])} pooled session(s) closed")
+    pool["sessions"].clear()
+    pool["idle"].clear()
+
+# Local testing implementations for the built-ins the transforms use that the local engine lacks
+def _date_part(column, part) -> ColumnEmulator:
+    values = [None if value is None else getattr(value, part) for value in column]
+    return ColumnEmulator(data=values, dtype=object, sf_type=ColumnType(LongType(), column.sf_type.nullable))
+
+@patch("year")
+def _local_year(column):
+    return _date_part(column, "year")
+
+@patch("month")
+def _local_month(column):
+    return _date_part(column, "month")
+
+@patch("quarter")
+def _local_quarter(column):
+    values = [None if value is None else (value.month - 1) // 3 + 1 for value in column]
+    return ColumnEmulator(data=values, dtype=object, sf_type=ColumnType(LongType(), column.sf_type.nullable))
+
+@patch("split")
+def _local_split(column, pattern):
+    values = [None if value is None else value.split(separator) for value, separator in zip(column, pattern)]
+    return ColumnEmulator(data=values, dtype=object, sf_type=ColumnType(StringType(), column.sf_type.nullable))
+
+@patch("count_distinct")
+def _local_count_distinct(*columns):
+    # Replaces the built-in local implementation, which miscounts once rows have been filtered out
+    distinct_rows = {values for values in zip(*columns) if all(value is not None for value in values)}
+    return ColumnEmulator(data=[len(distinct_rows)], sf_type=ColumnType(LongType(), False))
+
+@patch("hash")
+def _local_hash(*columns):
+    # Snowflake's HASH algorithm is not public: any stable signed 64-bit digest works for keys that only meet locally
+    values = []
+    for row in zip(*columns):
+        digest = hashlib.blake2b(json.dumps([None if v is None else str(v) for v in row]).encode(), digest_size=8).digest()
+        values.append(int.from_bytes(digest, 'big', signed=True))
+    return ColumnEmulator(data=values, dtype=object, sf_type=ColumnType(LongType(), False))
+
+def create_local_session(data_dir=LOCAL_DATA_DIR) -> Session:
+    """Local testing session seeded with the exchange rates and empty pipeline tables"""
+    session = Session.builder.config("local_testing", True).create()
+    _LOCAL_STATE[session] = {"data_dir": data_dir, "sequences": {}}
+
+    for table_name, schema in LOCAL_TABLE_SCHEMAS.items():
+        ensure_table(session, table_name, schema)
+
+    rate_file = os.path.join(data_dir, LOCAL_EXCHANGE_RATE_FILE)
+    if os.path.exists(rate_file):
+        rates = pd.read_csv(rate_file)
+        rates.columns = [c.strip().upper() for c in rates.columns]
+        rates["DATE"] = pd.to_datetime(rates["DATE"]).dt.date
+        rate_columns = [c for c in rates.columns if c != "DATE"]
+        schema = StructType([StructField("DATE", DateType())] + [StructField(c, RATE_TYPE) for c in rate_columns])
+        rows = [[row[0]] + [None if pd.isna(v) else round(float(v), 7) for v in row[1:]] for row in rates.itertuples(index=False)]
+        session.create_dataframe(rows, schema=schema).write.save_as_table(EXCHANGE_RATE_TABLE, mode="overwrite")
+        logging.info(f"✓ Local exchange rates loaded: {len(rows)} rows from {rate_file}")
+    else:
+        logging.warning(f"⚠ {rate_file} not found, non-USD regions will have no exchange rate")
+
+    logging.info(f"✓ Local session ready over {data_dir}")
+    return session
+
+def ensure_table(session, table_name, schema) -> None:
+    """CREATE TABLE IF NOT EXISTS through the DataFrame writer so it works on both backends"""
+    session.create_dataframe([], schema=schema).write.save_as_table(table_name, mode="ignore")
+
+def truncate_table(session, table_name) -> None:
+    """Empty a table; the local engine has no TRUNCATE"""
+    if is_local(session):
+        session.table(table_name).delete()
+    else:
+        session.sql(f"TRUNCATE TABLE {table_name}").collect()
+
+def clustering_key_sql(keys) -> str:
+    """The CLUSTER BY expression for a key, as SHOW TABLES reports it"""
+    return f"LINEAR({', '.join(keys)})"
+
+def ensure_clustering_keys(session, tables) -> list:
+    """ALTER the tables whose clustering key differs from CLUSTERING_KEYS, returning the ones changed; the local
+    engine has no micro-partitions"""
+    if is_local(session):
+        return []
+    changed = []
+    for table_name in tables:
+        database, schema, table = table_name.upper().split('.')
+        rows = session.sql(f"SHOW TABLES LIKE '{table}' IN SCHEMA {database}.{schema}").collect()
+        if not rows:
+            continue
+        current = (rows[0]["cluster_by"] or '').replace(' ', '').upper()
+        keys = CLUSTERING_KEYS.get(table_name)
+        if keys and current != clustering_key_sql(keys).replace(' ', ''):
+            session.sql(f"ALTER TABLE {table_name} CLUSTER BY ({', '.join(keys)})").collect()
+            logging.info(f"✓ {table_name} clustered by {', '.join(keys)}")
+            changed.append(table_name)
+        elif not keys and current:
+            session.sql(f"ALTER TABLE {table_name} DROP CLUSTERING KEY").collect()
+            logging.info(f"✓ {table_name} clustering key dropped")
+            changed.append(table_name)
+    return changed
+
+def clustered_order(df, table_name) -> DataFrame:
+    """Sort a DataFrame on its target table's clustering key before it is written"""
+    keys = CLUSTERING_KEYS.get(table_name)
+    return df.sort(*[col(c) for c in keys]) if keys else df
+
+def ensure_sequence(session, sequence) -> None:
+    """CREATE SEQUENCE IF NOT EXISTS; local sequences start on first use"""
+    if not is_local(session):
+        session.sql(f"CREATE SEQUENCE IF NOT EXISTS {sequence}").collect()
+
+def next_sequence_block(session, sequence, count) -> int:
+    """Reserve count values of a local sequence and return the value before the first one"""
+    sequences = _LOCAL_STATE[session]["sequences"]
+    start = sequences.get(sequence, 0)
+    sequences[sequence] = start + int(count)
+    return start
+
+def with_sequence_key(session, df, sequence, key_column) -> DataFrame:
+    """Prepend a surrogate key from a sequence (NEXTVAL in Snowflake, a numbered block locally)"""
+    columns = [col(c) for c in df.columns]
+    if not is_local(session):
+        return df.select(sql_expr(f"{sequence}.nextval").alias(key_column), *columns)
+
+    df = df.cache_result()
+    rows = df.count()
+    start = next_sequence_block(session, sequence, rows)
+    if not rows:
+        # The local engine cannot evaluate a window over an empty input
+        return df.select(lit(start).alias(key_column), *columns)
+    return df.select((row_number().over(Window.order_by(*columns)) + lit(start)).alias(key_column), *columns)
+
+def hash_key(natural_key) -> Column:
+    """Deterministic surrogate key: HASH() of the natural key columns"""
+    return hash(*[col(c) for c in natural_key])
+
+def with_hash_key(df, key_column, natural_key) -> DataFrame:
+    """Prepend a surrogate key hashed from the natural key, so any table holding those columns can derive it"""
+    return df.select(hash_key(natural_key).alias(key_column), *[col(c) for c in df.columns])
+
+def merge_into(session, target, source, join_expr, clauses) -> MergeResult:
+    """Table.merge for an update-when-matched / insert-when-not-matched upsert"""
+    if not is_local(session):
+        return target.merge(source, join_expr, clauses)
+
+    # The local engine appends MERGE inserts with repeated row labels and later updates then hit the wrong
+    # rows; rewriting the target first gives it a clean row numbering
+    session.create_dataframe(target.collect(), schema=target.schema).write.save_as_table(target.table_name, mode="overwrite")
+    target = session.table(target.table_name)
+    # The local engine leaves zero counts out of its merge result row, so derive them up front
+    matched = source.join(target, join_expr, join_type='leftsemi').count()
+    inserted = source.count() - matched
+    try:
+        return target.merge(source, join_expr, clauses)
+    except IndexError:
+        return MergeResult(rows_inserted=inserted, rows_updated=matched, rows_deleted=0)
+
+# High-water marks of incremental loads, one row per region
+WATERMARK_SCHEMA = StructType([
+    StructField("REGION", StringType()),
+    StructField("HIGH_WATER_MARK", LongType()),
+    StructField("UPDATED_AT", TimestampType())
+])
+
+def read_watermarks(session, table_name) -> dict:
+    """Last high-water mark loaded per region"""
+    ensure_table(session, table_name, WATERMARK_SCHEMA)
+    rows = session.table(table_name).select(col('REGION'), col('HIGH_WATER_MARK')).collect()
+    return {row['REGION']: int(row['HIGH_WATER_MARK']) for row in rows}
+
+def save_watermarks(session, table_name, high_water_marks) -> None:
+    """Upsert the per-region watermarks after a successful load"""
+    if not high_water_marks:
+        return
+    ensure_table(session, table_name, WATERMARK_SCHEMA)
+    updated_at = datetime.datetime.now()
+    marks_df = session.create_dataframe(
+        [[region, hwm, updated_at] for region, hwm in high_water_marks.items()], schema=WATERMARK_SCHEMA
+    )
+    target = session.table(table_name)
+    assignments = {c: marks_df[c] for c in marks_df.columns}
+    merge_into(
+        session,
+        target,
+        marks_df,
+        target['REGION'] == marks_df['REGION'],
+        [when_matched().update(assignments), when_not_matched().insert(assignments)]
+    )
+
+# Consumption model version: one row per fact load that changed sales_fact; readers cache results per version
+MODEL_VERSION_TABLE = "sales_dwh.consumption.model_version"
+MODEL_VERSION_SCHEMA = StructType([
+    StructField("VERSION", LongType()),
+    StructField("RUN_ID", StringType()),
+    StructField("KEY_STRATEGY", StringType()),
+    StructField("UPDATED_AT", TimestampType())
+])
+
+def latest_model_version(session):
+    """The newest model_version row, None before the first fact load"""
+    # Read-only: KPI servers poll this, so the table is only created by bump_model_version
+    try:
+        rows = session.table(MODEL_VERSION_TABLE).sort(col("VERSION").desc()).limit(1).collect()
+    except SnowparkSQLException:
+        return None
+    return rows[0] if rows else None
+
+def read_model_version(session) -> int:
+    """Current consumption model version, 0 before the first fact load"""
+    row = latest_model_version(session)
+    return int(row["VERSION"]) if row else 0
+
+def read_model_key_strategy(session):
+    """Surrogate key strategy the consumption model was last loaded with, None if never recorded"""
+    row = latest_model_version(session)
+    return row["KEY_STRATEGY"] if row else None
+
+def bump_model_version(session, run_id, key_strategy) -> int:
+    """Record a new model version, and the key strategy it was loaded with, for a run that changed the consumption layer"""
+    ensure_table(session, MODEL_VERSION_TABLE, MODEL_VERSION_SCHEMA)
+    version = read_model_version(session) + 1
+    session.create_dataframe([[version, run_id, key_strategy, datetime.datetime.now()]], schema=MODEL_VERSION_SCHEMA) \
+        .write.save_as_table(MODEL_VERSION_TABLE, mode="append")
+    return version
+
+def load_local_source_tables(session, parquet=False) -> dict:
+    """Local stand-in for PUT + COPY: parse the sales tree into the source tables, returning rows loaded per region"""
+    # Imported here because data_loading creates its session through this module
+    from data_loading import traverse_directory, iter_sales_frames, to_sales_table, default_parquet_directory, PARQUET_CHUNK_ROWS, SALES_PARQUET_COLUMNS
+
+    sales_dir = os.path.join(_LOCAL_STATE[session]["data_dir"], 'sales')
+    loaded = {}
+    for region, (source, source_format, table_name, contact_column) in LOCAL_SOURCE_TABLES.items():
+        # --parquet reads India/France from the data_loading.py --to-parquet output, like the COPY does
+        if parquet and source_format != 'parquet':
+            partition = os.path.join(default_parquet_directory(sales_dir), f"source={source}", "format=parquet")
+            source_format = 'parquet'
+        else:
+            partition = os.path.join(sales_dir, f"source={source}", f"format={source_format}")
+        if not os.path.isdir(partition):
+            logging.warning(f"⚠ {region}: no local partition at {partition}")
+            loaded[region] = 0
+            continue
+
+        file_names, _, local_paths = traverse_directory(partition, f".{source_format}")
+        rows = []
+        dropped = 0
+        for file_name, local_path in sorted(zip(file_names, local_paths)):
+            last_modified = datetime.datetime.fromtimestamp(os.path.getmtime(local_path))
+            row_number_in_file = 0
+            for frame in iter_sales_frames(local_path, source_format, PARQUET_CHUNK_ROWS):
+                table, invalid = to_sales_table(frame)
+                dropped += invalid
+                for record in table.to_pylist():
+                    row_number_in_file += 1
+                    rows.append(
+                        [None]
+                        + [float(record[name]) if kind == 'decimal' and record[name] is not None else record[name]
+                           for name, kind in SALES_PARQUET_COLUMNS]
+                        + [file_name, row_number_in_file, last_modified]
+                    )
+
+        # SALES_ORDER_KEY comes from the region's sequence, in load order
+        start = next_sequence_block(session, f"{table_name}_seq", len(rows))
+        for offset, row in enumerate(rows, start=1):
+            row[0] = start + offset
+
+        if rows:
+            session.create_dataframe(rows, schema=source_table_schema(contact_column)).write.save_as_table(table_name, mode="append")
+        if dropped:
+            logging.warning(f"⚠ {region}: {dropped} rows failed type conversion and were skipped")
+        logging.info(f"✓ {region} sales loaded locally: {len(rows)} rows from {len(file_names)} files")
+        loaded[region] = len(rows)
+    return loaded
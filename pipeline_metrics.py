@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import logging
+import weakref
+from datetime import datetime
+from contextlib import contextmanager
+from pipeline_backend import is_local, set_query_tag, get_query_tag
+
+# Every query a stage issues is tagged with this run id, the stage and the step; one process is one run
+# unless PIPELINE_RUN_ID is set, e.g. to tie separately launched stages together
+PIPELINE_RUN_ID = os.getenv("PIPELINE_RUN_ID") or f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+# Per session: run id and stage of the stage_metrics block it is in
+_QUERY_TAG_CONTEXT = weakref.WeakKeyDictionary()
+
+# Row counts come from DML results instead of re-running a DataFrame plan with count()
+
+def insert_into(session, df, table_name, columns=None) -> int:
+    """INSERT a DataFrame's plan into a table and return the rows inserted from the DML result"""
+    if is_local(session):
+        return append_local(session, df, table_name, columns)
+    return collect_insert(session, *submit_insert(session, df, table_name, columns))
+
+def submit_insert(session, df, table_name, columns=None) -> tuple:
+    """Submit a DataFrame's INSERT as an async query; returns the AsyncJob and the plan's post actions"""
+    plan = df.queries
+    # Plans built from local data stage a temp table first; run those before the INSERT
+    for query in plan['queries'][:-1]:
+        session.sql(query).collect()
+
+    column_list = f" ({', '.join(columns)})" if columns else ''
+    try:
+        job = session.sql(f"INSERT INTO {table_name}{column_list} {plan['queries'][-1]}").collect_nowait()
+    except Exception:
+        run_post_actions(session, plan['post_actions'])
+        raise
+    return job, plan['post_actions']
+
+def collect_insert(session, job, post_actions) -> int:
+    """Wait for a submitted INSERT and return the rows inserted"""
+    try:
+        result = job.result()
+    finally:
+        run_post_actions(session, post_actions)
+    return int(result[0][0])
+
+def run_post_actions(session, post_actions) -> None:
+    """Drop whatever temp objects a plan staged"""
+    for action in post_actions:
+        session.sql(action).collect()
+
+def append_local(session, df, table_name, columns=None) -> int:
+    """Local backend INSERT: columns are matched by position, like the SQL INSERT"""
+    # Materialize first: plans such as the dimension anti-joins read the table being appended to
+    df = df.cache_result()
+    df = df.to_df(columns or session.table(table_name).columns)
+    rows = int(df.count())
+    df.write.save_as_table(table_name, mode="append")
+    return rows
+
+def pipeline_query_tag(run_id, stage, step=None) -> str:
+    """Query tag JSON attributing a query to a run, stage and step"""
+    return json.dumps({"run_id": run_id, "stage": stage, "step": step})
+
+@contextmanager
+def stage_metrics(session, stage, strict=False, run_id=None):
+    """Time a pipeline stage and collect its row counts; strict mode also records every query issued"""
+    metrics = {"run_id": run_id or PIPELINE_RUN_ID, "stage": stage, "rows": {}, "queries": None, "seconds": 0.0}
+    previous_tag = get_query_tag(session)
+    _QUERY_TAG_CONTEXT[session] = metrics
+    set_query_tag(session, pipeline_query_tag(metrics["run_id"], stage))
+    start = time.perf_counter()
+    try:
+        if strict:
+            with session.query_history() as history:
+                yield metrics
+            metrics["queries"] = len(history.queries)
+        else:
+            yield metrics
+    finally:
+        metrics["seconds"] = time.perf_counter() - start
+        _QUERY_TAG_CONTEXT.pop(session, None)
+        set_query_tag(session, previous_tag)
+        log_stage_metrics(metrics)
+
+@contextmanager
+def query_step(session, step):
+    """Tag the queries issued inside the block with the enclosing stage's run id and this step"""
+    metrics = _QUERY_TAG_CONTEXT.get(session)
+    if metrics is None:
+        yield
+        return
+    set_query_tag(session, pipeline_query_tag(metrics["run_id"], metrics["stage"], step))
+    try:
+        yield
+    finally:
+        set_query_tag(session, pipeline_query_tag(metrics["run_id"], metrics["stage"]))
+
+def record_rows(metrics, step, rows) -> int:
+    """Record a step's row count on the stage metrics and pass it through"""
+    metrics["rows"][step] = rows
+    return rows
+
+def log_stage_metrics(metrics) -> None:
+    """Log stage duration, query count (strict mode) and per-step row counts"""
+    queries = f", {metrics['queries']} queries" if metrics["queries"] is not None else ""
+    logging.info(f"[metrics] {metrics['stage']} (run {metrics['run_id']}): {metrics['seconds']:.2f}s{queries}")
+    for step, rows in metrics["rows"].items():
+        logging.info(f"[metrics]   {step}: {rows} rows")
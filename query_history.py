@@ -0,0 +1,261 @@
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime
+from statistics import mean
+
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.functions import col, sum, min
+from snowflake.snowpark.types import StructType, StructField, StringType, LongType, DoubleType, TimestampType
+from pipeline_metrics import PIPELINE_RUN_ID
+from pipeline_backend import get_snowpark_session, is_local, ensure_table, CLUSTERING_KEYS, clustering_key_sql
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+# One row per tagged query of every reported run
+QUERY_HISTORY_TABLE = "sales_dwh.common.pipeline_query_history"
+QUERY_HISTORY_SCHEMA = StructType([
+    StructField("RUN_ID", StringType()),
+    StructField("STAGE", StringType()),
+    StructField("STEP", StringType()),
+    StructField("QUERY_ID", StringType()),
+    StructField("QUERY_TYPE", StringType()),
+    StructField("START_TIME", TimestampType()),
+    StructField("ELAPSED_MS", LongType()),
+    StructField("COMPILE_MS", LongType()),
+    StructField("BYTES_SCANNED", LongType()),
+    StructField("PARTITIONS_SCANNED", LongType()),
+    StructField("PARTITIONS_TOTAL", LongType()),
+    StructField("BYTES_SPILLED", LongType())
+])
+# Clustering state of every CLUSTERING_KEYS table after each reported run
+CLUSTERING_HISTORY_TABLE = "sales_dwh.common.pipeline_clustering_history"
+CLUSTERING_HISTORY_SCHEMA = StructType([
+    StructField("RUN_ID", StringType()),
+    StructField("TABLE_NAME", StringType()),
+    StructField("CLUSTERING_KEY", StringType()),
+    StructField("TOTAL_PARTITIONS", LongType()),
+    StructField("AVERAGE_OVERLAPS", DoubleType()),
+    StructField("AVERAGE_DEPTH", DoubleType()),
+    StructField("RECORDED_AT", TimestampType())
+])
+# Columns of a recorded history file, as written by --record and read back by --replay
+RECORDED_COLUMNS = ["QUERY_ID", "QUERY_TAG", "QUERY_TYPE", "START_TIME", "ELAPSED_MS", "COMPILE_MS", "BYTES_SCANNED",
+                    "PARTITIONS_SCANNED", "PARTITIONS_TOTAL", "BYTES_SPILLED"]
+
+# INFORMATION_SCHEMA.QUERY_HISTORY only reaches back 7 days and returns at most RESULT_LIMIT rows
+HISTORY_LOOKBACK_HOURS = 24
+HISTORY_RESULT_LIMIT = 10000
+# A step is flagged when its elapsed time exceeds the mean of the previous runs by this fraction and by at least
+# REGRESSION_MIN_MS, so millisecond-scale steps do not raise noise
+BASELINE_RUNS = 5
+REGRESSION_TOLERANCE = 0.5
+REGRESSION_MIN_MS = 1000
+
+def fetch_run_history(session, run_id, lookback_hours=HISTORY_LOOKBACK_HOURS) -> list:
+    """Query history rows whose query tag carries this run id"""
+    rows = session.sql(f"""
+        SELECT query_id, query_tag, query_type, start_time,
+               total_elapsed_time AS elapsed_ms,
+               compilation_time AS compile_ms,
+               bytes_scanned, partitions_scanned, partitions_total,
+               bytes_spilled_to_local_storage + bytes_spilled_to_remote_storage AS bytes_spilled
+        FROM TABLE(sales_dwh.information_schema.query_history(
+            end_time_range_start => DATEADD('hour', -{int(lookback_hours)}, CURRENT_TIMESTAMP()),
+            result_limit => {HISTORY_RESULT_LIMIT}))
+        WHERE TRY_PARSE_JSON(query_tag):run_id::string = '{run_id}'
+        ORDER BY start_time
+    """).collect()
+    return [{c: row[c] for c in RECORDED_COLUMNS} for row in rows]
+
+def load_recorded_history(path, run_id=None) -> list:
+    """Replay a recorded history file, optionally re-tagged as another run (the local stand-in for QUERY_HISTORY)"""
+    with open(path) as f:
+        rows = json.load(f)
+    for row in rows:
+        row["START_TIME"] = datetime.fromisoformat(row["START_TIME"])
+        if run_id:
+            tag = json.loads(row["QUERY_TAG"])
+            tag["run_id"] = run_id
+            row["QUERY_TAG"] = json.dumps(tag)
+    logging.info(f"✓ Replaying {len(rows)} recorded queries from {path}")
+    return rows
+
+def record_history(path, rows) -> None:
+    """Write fetched history rows to a file that --replay can read back"""
+    with open(path, 'w') as f:
+        json.dump([{**row, "START_TIME": row["START_TIME"].isoformat()} for row in rows], f, indent=1)
+    logging.info(f"✓ {len(rows)} queries recorded to {path}")
+
+def history_records(rows) -> list:
+    """Split each row's query tag into run id, stage and step"""
+    records = []
+    for row in rows:
+        tag = json.loads(row["QUERY_TAG"])
+        records.append([tag["run_id"], tag["stage"], tag.get("step") or "(stage)", row["QUERY_ID"], row["QUERY_TYPE"],
+                        row["START_TIME"], *[int(row[c] or 0) for c in RECORDED_COLUMNS[4:]]])
+    return records
+
+def save_history(session, run_id, records) -> None:
+    """Replace the run's rows in the history table, so reporting a run twice does not double it"""
+    ensure_table(session, QUERY_HISTORY_TABLE, QUERY_HISTORY_SCHEMA)
+    session.table(QUERY_HISTORY_TABLE).delete(col("RUN_ID") == run_id)
+    if records:
+        session.create_dataframe(records, schema=QUERY_HISTORY_SCHEMA).write.save_as_table(QUERY_HISTORY_TABLE, mode="append")
+
+def step_report(records) -> dict:
+    """Per (stage, step): query count, elapsed and compile time, bytes scanned, pruning and spill"""
+    report = {}
+    for _, stage, step, _, _, _, elapsed, compiled, scanned, partitions, total, spilled in records:
+        step_stats = report.setdefault((stage, step), {"queries": 0, "elapsed_ms": 0, "compile_ms": 0, "bytes_scanned": 0,
+                                                       "partitions_scanned": 0, "partitions_total": 0, "bytes_spilled": 0})
+        step_stats["queries"] += 1
+        step_stats["elapsed_ms"] += elapsed
+        step_stats["compile_ms"] += compiled
+        step_stats["bytes_scanned"] += scanned
+        step_stats["partitions_scanned"] += partitions
+        step_stats["partitions_total"] += total
+        step_stats["bytes_spilled"] += spilled
+    return report
+
+def baseline_elapsed(session, run_id, runs=BASELINE_RUNS) -> dict:
+    """Mean elapsed milliseconds per (stage, step) over the last `runs` runs before this one"""
+    per_run = session.table(QUERY_HISTORY_TABLE).group_by(col("RUN_ID"), col("STAGE"), col("STEP")) \
+        .agg(sum(col("ELAPSED_MS")).alias("ELAPSED_MS"), min(col("START_TIME")).alias("STARTED")).collect()
+    started = {}
+    for row in per_run:
+        if row["RUN_ID"] not in started or row["STARTED"] < started[row["RUN_ID"]]:
+            started[row["RUN_ID"]] = row["STARTED"]
+    if run_id not in started:
+        return {}
+    previous_runs = {r for _, r in sorted((s, r) for r, s in started.items() if s < started[run_id])[-runs:]}
+
+    totals = {}
+    for row in per_run:
+        if row["RUN_ID"] in previous_runs:
+            totals.setdefault((row["STAGE"], row["STEP"]), []).append(int(row["ELAPSED_MS"]))
+    return {key: mean(values) for key, values in totals.items()}
+
+def flag_regressions(report, baseline, tolerance=REGRESSION_TOLERANCE, min_ms=REGRESSION_MIN_MS) -> list:
+    """Steps markedly slower than their baseline"""
+    regressions = []
+    for key, step_stats in report.items():
+        before = baseline.get(key)
+        after = step_stats["elapsed_ms"]
+        if before is not None and after > before * (1 + tolerance) and after - before >= min_ms:
+            regressions.append(f"{key[0]} / {key[1]}: {before / 1000:.2f}s → {after / 1000:.2f}s")
+    return regressions
+
+def log_report(run_id, report, baseline) -> None:
+    """Log one line per step, slowest first"""
+    logging.info("=" * 60)
+    logging.info(f"Query history for run {run_id}:")
+    logging.info(f"  {'stage / step':<36} {'queries':>7} {'elapsed':>9} {'compile':>8} {'scanned':>10} {'pruned':>7} {'spilled':>9} {'vs base':>8}")
+    for (stage, step), s in sorted(report.items(), key=lambda item: -item[1]["elapsed_ms"]):
+        pruned = f"{1 - s['partitions_scanned'] / s['partitions_total']:.0%}" if s["partitions_total"] else "-"
+        before = baseline.get((stage, step))
+        versus = f"{s['elapsed_ms'] / before:.2f}x" if before else "-"
+        logging.info(f"  {stage + ' / ' + step:<36} {s['queries']:>7} {s['elapsed_ms'] / 1000:>8.2f}s "
+                     f"{s['compile_ms'] / 1000:>7.2f}s {s['bytes_scanned'] / 1024 / 1024:>8.1f}MB {pruned:>7} "
+                     f"{s['bytes_spilled'] / 1024 / 1024:>7.1f}MB {versus:>8}")
+    logging.info("=" * 60)
+
+def clustering_records(session, run_id) -> list:
+    """SYSTEM$CLUSTERING_INFORMATION of every table with a declared clustering key, skipping tables not built yet"""
+    records = []
+    recorded_at = datetime.now()
+    for table_name, keys in CLUSTERING_KEYS.items():
+        try:
+            info = json.loads(session.sql(
+                f"SELECT SYSTEM$CLUSTERING_INFORMATION('{table_name}', '({', '.join(keys)})') AS INFO").collect()[0]["INFO"])
+        except SnowparkSQLException as e:
+            # e.g. the rollup before its first build; the other tables are still reported
+            logging.warning(f"⚠ No clustering information for {table_name}: {' '.join(str(e).split())}")
+            continue
+        records.append([run_id, table_name, clustering_key_sql(keys), int(info["total_partition_count"]),
+                        float(info["average_overlaps"]), float(info["average_depth"]), recorded_at])
+    return records
+
+def previous_clustering(session, run_id) -> dict:
+    """Average depth per table as recorded by the latest earlier run"""
+    rows = session.table(CLUSTERING_HISTORY_TABLE).filter(col("RUN_ID") != run_id) \
+        .select(col("TABLE_NAME"), col("AVERAGE_DEPTH"), col("RECORDED_AT")).collect()
+    depths = {}
+    for row in sorted(rows, key=lambda row: row["RECORDED_AT"]):
+        depths[row["TABLE_NAME"]] = row["AVERAGE_DEPTH"]
+    return depths
+
+def save_clustering(session, run_id, records) -> None:
+    """Replace the run's rows in the clustering history table"""
+    ensure_table(session, CLUSTERING_HISTORY_TABLE, CLUSTERING_HISTORY_SCHEMA)
+    session.table(CLUSTERING_HISTORY_TABLE).delete(col("RUN_ID") == run_id)
+    if records:
+        session.create_dataframe(records, schema=CLUSTERING_HISTORY_SCHEMA).write.save_as_table(
+            CLUSTERING_HISTORY_TABLE, mode="append")
+
+def log_clustering(records, previous) -> None:
+    """Log partitions, overlaps and depth per clustered table; depth near 1 means date filters prune well"""
+    logging.info("Clustering of the declared tables:")
+    logging.info(f"  {'clustered table':<36} {'partitions':>10} {'overlaps':>9} {'depth':>7} {'was':>7}")
+    for _, table_name, _, partitions, overlaps, depth, _ in records:
+        before = previous.get(table_name)
+        was = f"{before:.2f}" if before is not None else "-"
+        logging.info(f"  {table_name:<36} {partitions:>10} {overlaps:>9.2f} {depth:>7.2f} {was:>7}")
+    logging.info("=" * 60)
+
+def main(run_id=None, replay=None, record=None, lookback_hours=HISTORY_LOOKBACK_HOURS, tolerance=REGRESSION_TOLERANCE,
+         session=None):
+    """Pull a run's tagged query history into the history table and report it per step"""
+    run_id = run_id or PIPELINE_RUN_ID
+    owns_session = session is None
+    session = session or get_snowpark_session()
+    try:
+        if replay:
+            rows = load_recorded_history(replay, run_id)
+        elif is_local(session):
+            logging.warning("⚠ The local backend keeps no query history; pass --replay with a recorded history file")
+            return None
+        else:
+            rows = fetch_run_history(session, run_id, lookback_hours)
+        if record:
+            record_history(record, rows)
+
+        records = history_records(rows)
+        save_history(session, run_id, records)
+        report = step_report(records)
+        baseline = baseline_elapsed(session, run_id)
+        log_report(run_id, report, baseline)
+
+        clustering = None
+        if not replay:
+            # Clustering is the tables' state now, so it is only recorded for the run just fetched
+            clustering = clustering_records(session, run_id)
+            save_clustering(session, run_id, clustering)
+            log_clustering(clustering, previous_clustering(session, run_id))
+
+        regressions = flag_regressions(report, baseline, tolerance)
+        for regression in regressions:
+            logging.warning(f"⚠ Slower than the last {BASELINE_RUNS} runs: {regression}")
+        logging.info(f"✓ {len(records)} queries of run {run_id} saved to {QUERY_HISTORY_TABLE}")
+        return {"run_id": run_id, "steps": report, "clustering": clustering, "regressions": regressions}
+    finally:
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report a pipeline run's tagged queries per stage and step")
+    parser.add_argument("--run-id", required=True, help="run id the stages logged (or PIPELINE_RUN_ID they ran with)")
+    parser.add_argument("--replay", default=None, help="read the history from a --record file instead of QUERY_HISTORY")
+    parser.add_argument("--record", default=None, help="also write the fetched history to this file")
+    parser.add_argument("--lookback-hours", type=int, default=HISTORY_LOOKBACK_HOURS,
+                        help="how far back QUERY_HISTORY is searched for the run")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="elapsed-time increase over the previous runs before a step is flagged")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.run_id, args.replay, args.record, args.lookback_hours, args.tolerance)
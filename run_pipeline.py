@@ -0,0 +1,181 @@
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import data_loading
+import upload_exchange_rate
+import stage2source
+import source2curated
+import curated2model
+import query_history
+from pipeline_metrics import PIPELINE_RUN_ID
+from pipeline_backend import LOCAL_DATA_DIR, create_session_pool, pooled_session, close_session_pool
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+# Pipeline stages in run order; --from/--to select a contiguous slice of this list
+PIPELINE_STAGES = ["upload_sales", "upload_exchange_rate", "stage2source", "source2curated", "curated2model"]
+# Upstream stages each stage waits for; the two uploads are independent and run side by side
+STAGE_DEPENDENCIES = {
+    "upload_sales": [],
+    "upload_exchange_rate": [],
+    "stage2source": ["upload_sales"],
+    "source2curated": ["stage2source", "upload_exchange_rate"],
+    "curated2model": ["source2curated"]
+}
+# Stages that PUT local files to the internal stage; the local backend reads the data tree directly
+UPLOAD_STAGES = ("upload_sales", "upload_exchange_rate")
+PIPELINE_MAX_WORKERS = 2
+
+def run_upload_sales(session, options):
+    """PUT new or changed sales files, failing the stage if any file did not upload"""
+    summary = data_loading.main(options["sales_dir"], force=options["force_upload"], to_parquet=options["parquet"],
+                                session=session, split=options["split"])
+    if summary is None:
+        raise FileNotFoundError(f"Sales directory not found: {options['sales_dir']}")
+    if summary["failed"]:
+        raise RuntimeError(f"{len(summary['failed'])} sales files failed to upload")
+    return summary
+
+def run_upload_exchange_rate(session, options):
+    """PUT the exchange rate file"""
+    status = upload_exchange_rate.main(options["exchange_rate_file"], session=session)
+    if status is None:
+        raise FileNotFoundError(f"Exchange rate file not found: {options['exchange_rate_file']}")
+    return status
+
+STAGE_RUNNERS = {
+    "upload_sales": run_upload_sales,
+    "upload_exchange_rate": run_upload_exchange_rate,
+    "stage2source": lambda session, options: stage2source.main(
+        parquet=options["parquet"], concurrent=options["concurrent"], session=session),
+    "source2curated": lambda session, options: source2curated.main(
+        incremental=options["incremental"], session=session),
+    "curated2model": lambda session, options: curated2model.main(
+        concurrent=options["concurrent"], key_strategy=options["key_strategy"], session=session)
+}
+
+def select_stages(from_stage=None, to_stage=None) -> list:
+    """The contiguous slice of PIPELINE_STAGES between from_stage and to_stage, inclusive"""
+    first = PIPELINE_STAGES.index(from_stage) if from_stage else 0
+    last = PIPELINE_STAGES.index(to_stage) if to_stage else len(PIPELINE_STAGES) - 1
+    if first > last:
+        raise ValueError(f"--from {from_stage} comes after --to {to_stage}")
+    return PIPELINE_STAGES[first:last + 1]
+
+def run_stage(pool, stage, options):
+    """Run one stage on a pooled session, returning its result"""
+    with pooled_session(pool) as session:
+        if pool["backend"] == "local" and stage in UPLOAD_STAGES:
+            logging.info(f"[{stage}] skipped: the local backend reads {pool['data_dir']} directly")
+            return None
+        logging.info(f"[{stage}] started")
+        started = time.perf_counter()
+        result = STAGE_RUNNERS[stage](session, options)
+        logging.info(f"[{stage}] ✓ finished in {time.perf_counter() - started:.2f}s")
+        return result
+
+def run_dag(pool, stages, options, max_workers=PIPELINE_MAX_WORKERS) -> tuple:
+    """Run the selected stages, each as soon as its selected upstream stages have succeeded"""
+    results, failed, skipped = {}, {}, []
+    remaining = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while remaining or running:
+            # Stages outside the selection are taken as already done
+            for stage in list(remaining):
+                upstream = [s for s in STAGE_DEPENDENCIES[stage] if s in stages]
+                if any(s in failed or s in skipped for s in upstream):
+                    remaining.remove(stage)
+                    skipped.append(stage)
+                    logging.warning(f"⚠ [{stage}] skipped: an upstream stage failed")
+                elif all(s in results for s in upstream):
+                    remaining.remove(stage)
+                    running[executor.submit(run_stage, pool, stage, options)] = stage
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage] = future.result()
+                except Exception as e:
+                    failed[stage] = e
+                    logging.error(f"❌ [{stage}] failed: {str(e)}")
+    return results, failed, skipped
+
+def main(from_stage=None, to_stage=None, backend=None, data_dir=LOCAL_DATA_DIR, sales_dir=data_loading.SALES_DATA_DIR,
+         exchange_rate_file=upload_exchange_rate.EXCHANGE_RATE_FILE, parquet=False, incremental=False, concurrent=False,
+         key_strategy="sequence", force_upload=False, max_workers=PIPELINE_MAX_WORKERS, query_report=False,
+         replay_history=None, split=False):
+    """Run the pipeline stages as a DAG in one process, sharing pooled sessions between them"""
+    stages = select_stages(from_stage, to_stage)
+    options = {
+        "sales_dir": sales_dir, "exchange_rate_file": exchange_rate_file, "parquet": parquet,
+        "incremental": incremental, "concurrent": concurrent, "key_strategy": key_strategy,
+        "force_upload": force_upload, "split": split
+    }
+    pool = create_session_pool(backend, data_dir)
+    if pool["backend"] == "local":
+        # Every stage shares the one local session, which is not safe to use from two threads
+        max_workers = 1
+
+    logging.info("=" * 60)
+    logging.info(f"Running {' → '.join(stages)} on the {pool['backend']} backend (run {PIPELINE_RUN_ID})")
+    logging.info("=" * 60)
+    started = time.perf_counter()
+    try:
+        results, failed, skipped = run_dag(pool, stages, options, max_workers)
+        if query_report or replay_history:
+            # Every stage ran in this process, so all of their queries carry PIPELINE_RUN_ID
+            with pooled_session(pool) as session:
+                query_history.main(PIPELINE_RUN_ID, replay_history, session=session)
+    finally:
+        close_session_pool(pool)
+
+    logging.info("=" * 60)
+    logging.info(f"Pipeline finished in {time.perf_counter() - started:.2f}s: {len(results)} succeeded, "
+                 f"{len(failed)} failed, {len(skipped)} skipped")
+    logging.info("=" * 60)
+    if failed:
+        raise RuntimeError(f"Pipeline failed at: {', '.join(failed)}")
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run upload → exchange rate → stage2source → source2curated → "
+                                                 "curated2model in one process on pooled sessions")
+    parser.add_argument("--from", dest="from_stage", choices=PIPELINE_STAGES, default=None,
+                        help="first stage to run (earlier stages are taken as done)")
+    parser.add_argument("--to", dest="to_stage", choices=PIPELINE_STAGES, default=None, help="last stage to run")
+    parser.add_argument("--backend", choices=["local", "snowflake"], default=None,
+                        help="execution backend (default: PIPELINE_BACKEND)")
+    parser.add_argument("--data-dir", default=LOCAL_DATA_DIR, help="sample data tree read by the local backend")
+    parser.add_argument("--sales-dir", default=data_loading.SALES_DATA_DIR, help="local sales tree to upload")
+    parser.add_argument("--exchange-rate-file", default=upload_exchange_rate.EXCHANGE_RATE_FILE,
+                        help="exchange rate CSV to upload")
+    parser.add_argument("--parquet", action="store_true", help="upload and load India/France as Parquet")
+    parser.add_argument("--incremental", action="store_true", help="run source2curated in incremental mode")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="run the COPYs in stage2source and the dimension builds in curated2model as async queries")
+    parser.add_argument("--key-strategy", choices=curated2model.KEY_STRATEGIES, default="sequence",
+                        help="curated2model surrogate key strategy")
+    parser.add_argument("--split", action="store_true",
+                        help="cut large CSV/JSON sales files into chunks before upload so the COPYs run in parallel")
+    parser.add_argument("--force-upload", action="store_true", help="ignore the upload manifest and re-upload every file")
+    parser.add_argument("--max-workers", type=int, default=PIPELINE_MAX_WORKERS,
+                        help="stages run at the same time (and most sessions logged in)")
+    parser.add_argument("--query-report", action="store_true",
+                        help="afterwards, report the run's queries per stage and step from QUERY_HISTORY")
+    parser.add_argument("--replay-history", default=None,
+                        help="report from this recorded history file instead (the local backend has no QUERY_HISTORY)")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.from_stage, args.to_stage, args.backend, args.data_dir, args.sales_dir, args.exchange_rate_file,
+         args.parquet, args.incremental, args.concurrent, args.key_strategy, args.force_upload, args.max_workers,
+         args.query_report, args.replay_history, args.split)
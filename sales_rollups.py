@@ -0,0 +1,190 @@
+import sys
+import logging
+import argparse
+from datetime import datetime
+
+from snowflake.snowpark import DataFrame
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.functions import col, lit, sum, count
+from snowflake.snowpark.types import StructType, StructField, LongType, TimestampType
+from pipeline_metrics import stage_metrics, record_rows, query_step
+from pipeline_backend import get_snowpark_session, is_local, ensure_table, truncate_table, ensure_clustering_keys, \
+    clustered_order
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+# Dashboard rollup: sales_fact pre-aggregated to day x country x promo code x payment method
+ROLLUP_TABLE = "sales_dwh.consumption.sales_daily_rollup"
+# FISCAL_YEAR and REGION follow from ORDER_DT and COUNTRY; they are carried for the dashboard filters
+ROLLUP_GRAIN = ["ORDER_DT", "FISCAL_YEAR", "COUNTRY", "REGION", "PROMOTION_CODE", "PAYMENT_METHOD"]
+ROLLUP_MEASURES = ["ORDER_QUANTITY", "LOCAL_TOTAL_ORDER_AMT", "LOCAL_TAX_AMT", "USD_TOTAL_ORDER_AMT", "USD_TAX_AMT"]
+
+# date_dim keys whose rollup days are stale: marked before each fact MERGE, cleared once the days are re-aggregated,
+# so a run that fails in between leaves them for the next one
+ROLLUP_PENDING_TABLE = "sales_dwh.consumption.sales_rollup_pending"
+ROLLUP_PENDING_SCHEMA = StructType([
+    StructField("DATE_ID_FK", LongType()),
+    StructField("MARKED_AT", TimestampType())
+])
+
+# Snowsight tile queries over the rollup; :daterange, :country and :fiscal_year are the dashboard filters
+DASHBOARD_TILES = {
+    "total_revenue": f"""
+        SELECT SUM(usd_total_order_amt) AS total_revenue_usd, SUM(order_count) AS orders
+        FROM {ROLLUP_TABLE}
+        WHERE order_dt = :daterange AND country = :country AND fiscal_year = :fiscal_year""",
+    "revenue_by_country": f"""
+        SELECT country, SUM(usd_total_order_amt) AS revenue_usd
+        FROM {ROLLUP_TABLE}
+        WHERE order_dt = :daterange AND fiscal_year = :fiscal_year
+        GROUP BY country
+        ORDER BY revenue_usd DESC""",
+    "daily_trend": f"""
+        SELECT order_dt, SUM(usd_total_order_amt) AS revenue_usd, SUM(order_count) AS orders
+        FROM {ROLLUP_TABLE}
+        WHERE order_dt = :daterange AND country = :country AND fiscal_year = :fiscal_year
+        GROUP BY order_dt
+        ORDER BY order_dt""",
+    "promo_effectiveness": f"""
+        SELECT order_dt, promotion_code, SUM(order_count) AS orders, SUM(usd_total_order_amt) AS revenue_usd,
+               SUM(usd_total_order_amt) / NULLIF(SUM(order_count), 0) AS avg_order_usd
+        FROM {ROLLUP_TABLE}
+        WHERE order_dt = :daterange AND country = :country AND fiscal_year = :fiscal_year
+        GROUP BY order_dt, promotion_code
+        ORDER BY order_dt, promotion_code""",
+    "payment_method_mix": f"""
+        SELECT payment_method, SUM(order_count) AS orders,
+               SUM(order_count) / SUM(SUM(order_count)) OVER () AS order_share
+        FROM {ROLLUP_TABLE}
+        WHERE order_dt = :daterange AND country = :country AND fiscal_year = :fiscal_year
+        GROUP BY payment_method
+        ORDER BY orders DESC"""
+}
+
+def mark_touched_dates(session, sales_fact_df, target) -> None:
+    """Queue the days a fact MERGE is about to touch: the new rows' dates and the current dates of orders it updates"""
+    ensure_table(session, ROLLUP_PENDING_TABLE, ROLLUP_PENDING_SCHEMA)
+    delta_df = sales_fact_df.select(col("ORDER_CODE").alias("DELTA_CODE"), col("REGION_ID_FK").alias("DELTA_REGION_ID"),
+                                    col("DATE_ID_FK").alias("DELTA_DATE_ID"))
+    # An updated order may move to another day; the day it leaves has to be re-aggregated too. Orders match
+    # on code and region, as in the fact MERGE
+    moved_df = target.join(delta_df, (target["ORDER_CODE"] == delta_df["DELTA_CODE"]) &
+                           (target["REGION_ID_FK"] == delta_df["DELTA_REGION_ID"]), join_type="leftsemi") \
+        .select(col("DATE_ID_FK"))
+    date_ids = {row[0] for row in delta_df.select(col("DELTA_DATE_ID")).distinct().collect()}
+    date_ids |= {row[0] for row in moved_df.distinct().collect()}
+    if date_ids:
+        marked_at = datetime.now()
+        session.create_dataframe([[date_id, marked_at] for date_id in sorted(date_ids)], schema=ROLLUP_PENDING_SCHEMA) \
+            .write.save_as_table(ROLLUP_PENDING_TABLE, mode="append")
+
+def rollup_df(session, date_ids=None) -> DataFrame:
+    """sales_fact joined to the dimensions the tiles filter on and aggregated to the rollup grain"""
+    fact_df = session.table("sales_dwh.consumption.sales_fact")
+    if date_ids is not None:
+        fact_df = fact_df.filter(col("DATE_ID_FK").in_(list(date_ids)))
+    dates_df = session.table("sales_dwh.consumption.date_dim").select(
+        col("DATE_ID_PK").alias("R_DATE_ID"), col("ORDER_DT"), col("FISCAL_YEAR"))
+    regions_df = session.table("sales_dwh.consumption.region_dim").select(
+        col("REGION_ID_PK").alias("R_REGION_ID"), col("COUNTRY"), col("REGION"))
+    promos_df = session.table("sales_dwh.consumption.promo_code_dim").select(
+        col("PROMO_CODE_ID_PK").alias("R_PROMO_CODE_ID"), col("PROMOTION_CODE"))
+    payments_df = session.table("sales_dwh.consumption.payment_dim").select(
+        col("PAYMENT_ID_PK").alias("R_PAYMENT_ID"), col("PAYMENT_METHOD"))
+
+    joined_df = fact_df.join(dates_df, col("DATE_ID_FK") == col("R_DATE_ID")) \
+        .join(regions_df, col("REGION_ID_FK") == col("R_REGION_ID")) \
+        .join(promos_df, col("PROMO_CODE_ID_FK") == col("R_PROMO_CODE_ID")) \
+        .join(payments_df, col("PAYMENT_ID_FK") == col("R_PAYMENT_ID")) \
+        .select(*[col(c) for c in ROLLUP_GRAIN + ROLLUP_MEASURES])
+    return joined_df.group_by(*ROLLUP_GRAIN).agg(
+        count(lit(1)).alias("ORDER_COUNT"),
+        *[sum(col(c)).alias(c) for c in ROLLUP_MEASURES]
+    ).select(*[col(c) for c in ROLLUP_GRAIN], col("ORDER_COUNT"), *[col(c) for c in ROLLUP_MEASURES],
+             lit(datetime.now()).alias("UPDATED_AT"))
+
+def rollup_exists(session) -> bool:
+    """True once the rollup has been built"""
+    try:
+        session.table(ROLLUP_TABLE).count()
+        return True
+    except SnowparkSQLException:
+        return False
+
+def rebuild_rollup(session) -> int:
+    """Re-aggregate the whole fact table into the rollup and clear every pending day"""
+    ensure_table(session, ROLLUP_PENDING_TABLE, ROLLUP_PENDING_SCHEMA)
+    clustered_order(rollup_df(session), ROLLUP_TABLE).write.save_as_table(ROLLUP_TABLE, mode="overwrite")
+    # The overwrite re-creates the table, dropping its clustering key
+    ensure_clustering_keys(session, [ROLLUP_TABLE])
+    truncate_table(session, ROLLUP_PENDING_TABLE)
+    rows = session.table(ROLLUP_TABLE).count()
+    logging.info(f"✓ {ROLLUP_TABLE} rebuilt: {rows} rows")
+    return rows
+
+def refresh_rollup(session, rebuild=False) -> int:
+    """Re-aggregate only the pending days, returning the rollup rows written; builds the rollup on first use"""
+    if rebuild or not rollup_exists(session):
+        return rebuild_rollup(session)
+
+    ensure_table(session, ROLLUP_PENDING_TABLE, ROLLUP_PENDING_SCHEMA)
+    date_ids = sorted({row[0] for row in session.table(ROLLUP_PENDING_TABLE).select(col("DATE_ID_FK")).collect()})
+    if not date_ids:
+        logging.info(f"✓ {ROLLUP_TABLE} is up to date")
+        return 0
+    order_dates = [row[0] for row in session.table("sales_dwh.consumption.date_dim")
+                   .filter(col("DATE_ID_PK").in_(date_ids)).select(col("ORDER_DT")).collect()]
+    # Aggregated before the transaction: materializing is DDL, which would commit it early
+    refreshed_df = clustered_order(rollup_df(session, date_ids), ROLLUP_TABLE).cache_result()
+    rows = refreshed_df.count()
+
+    # The tiles never see a day half replaced; the local engine has no transactions
+    transactional = not is_local(session)
+    if transactional:
+        session.sql("BEGIN").collect()
+    try:
+        session.table(ROLLUP_TABLE).delete(col("ORDER_DT").in_(order_dates))
+        refreshed_df.write.save_as_table(ROLLUP_TABLE, mode="append")
+        session.table(ROLLUP_PENDING_TABLE).delete(col("DATE_ID_FK").in_(date_ids))
+        if transactional:
+            session.sql("COMMIT").collect()
+    except Exception:
+        if transactional:
+            session.sql("ROLLBACK").collect()
+        raise
+    logging.info(f"✓ {ROLLUP_TABLE}: {len(date_ids)} days re-aggregated into {rows} rows")
+    return rows
+
+def main(rebuild=False, print_tiles=False, session=None):
+    """Bring the dashboard rollup up to date with sales_fact"""
+    if print_tiles:
+        for name, query in DASHBOARD_TILES.items():
+            print(f"-- {name}{query};\n")
+        return None
+
+    owns_session = session is None
+    session = session or get_snowpark_session()
+    try:
+        with stage_metrics(session, "sales_rollups") as metrics:
+            with query_step(session, "rollup"):
+                record_rows(metrics, "sales_daily_rollup", refresh_rollup(session, rebuild))
+        return metrics
+    except Exception as e:
+        logging.error(f"❌ Error: {str(e)}")
+        raise
+    finally:
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the dashboard rollup of sales_fact")
+    parser.add_argument("--rebuild", action="store_true", help="re-aggregate the whole fact table instead of the pending days")
+    parser.add_argument("--print-tile-sql", action="store_true",
+                        help="print the Snowsight tile queries that read the rollup and exit")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.rebuild, args.print_tile_sql)
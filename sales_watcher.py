@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import stage2source
+from data_loading import SALES_DATA_DIR, SALES_FILE_EXTENSIONS, VALIDATION_MAX_BAD_RATIO, scan_sales_directory, \
+    select_changed_files, validate_sales_files, upload_files, record_uploads, load_upload_manifest, save_upload_manifest, \
+    default_manifest_path
+from pipeline_metrics import stage_metrics, record_rows
+from pipeline_backend import get_snowpark_session, is_local
+
+# initiate logging at info level
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
+
+STAGE_LOCATION = '@sales_dwh.source.my_internal_stg'
+WATCH_POLL_SECONDS = 5.0
+# A file counts as complete once it has not been modified for this long
+FILE_SETTLE_SECONDS = 10.0
+# A micro-batch ships when it reaches either size limit or its oldest file has waited BATCH_MAX_WAIT_SECONDS
+BATCH_MAX_FILES = 200
+BATCH_MAX_BYTES = 256 * 1024 * 1024
+BATCH_MAX_WAIT_SECONDS = 60.0
+# Backpressure: completed files beyond this many stay on disk until the queue drains
+MAX_QUEUED_FILES = 2000
+# Failed COPYs are retried with exponential backoff; no new batch ships until they succeed
+COPY_RETRY_MAX_SECONDS = 300.0
+
+# partition source code -> COPY region
+SOURCE_REGIONS = {"IN": "India", "US": "USA", "FR": "France"}
+
+def default_checkpoint_path(directory) -> str:
+    """The watch checkpoint lives beside the sales tree, next to the upload manifest"""
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), '.sales_watch_checkpoint.json')
+
+def load_watch_checkpoint(checkpoint_path) -> dict:
+    """Region COPYs that were owed when the watcher last stopped"""
+    if not os.path.exists(checkpoint_path):
+        return {"pending_copy": []}
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+def save_watch_checkpoint(checkpoint_path, checkpoint) -> None:
+    """Write the checkpoint atomically"""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(tmp_path, checkpoint_path)
+
+def partition_copy(partition_dir):
+    """The [region, parquet] COPY that loads a source=XX/format=YY partition, or None outside the layout"""
+    parts = dict(p.split('=', 1) for p in partition_dir.replace('\\', '/').split('/') if '=' in p)
+    region = SOURCE_REGIONS.get(parts.get("source"))
+    if region is None:
+        return None
+    # The USA COPY always reads Parquet; India and France switch partitions on the parquet flag
+    return [region, parts.get("format") == "parquet" and region != "USA"]
+
+def admit_completed_files(directory, manifest, queue, settle_seconds=FILE_SETTLE_SECONDS, max_queued=MAX_QUEUED_FILES,
+                          rejected=None) -> int:
+    """Queue new or changed files that have settled; returns how many completed files had to wait outside the queue"""
+    rejected = rejected if rejected is not None else {}
+    scanned = scan_sales_directory(directory, SALES_FILE_EXTENSIONS, verbose=False)
+    file_names, partition_dirs, local_paths = [], [], []
+    for ext in SALES_FILE_EXTENSIONS:
+        file_names += scanned[ext][0]
+        partition_dirs += scanned[ext][1]
+        local_paths += scanned[ext][2]
+    changed = select_changed_files(manifest, file_names, partition_dirs, local_paths, STAGE_LOCATION, verbose=False)
+
+    queued = {entry["path"] for entry in queue}
+    waiting = 0
+    now = time.time()
+    for file_name, partition_dir, local_path in zip(*changed):
+        if local_path in queued:
+            continue
+        stat = os.stat(local_path)
+        if now - stat.st_mtime < settle_seconds:
+            continue
+        # A file validation rejected waits until it is modified again
+        if rejected.get(local_path) == stat.st_mtime:
+            continue
+        if partition_copy(partition_dir) is None:
+            logging.warning(f"⚠ Skipping {local_path}: not under a source=XX/format=YY partition")
+            continue
+        if len(queue) >= max_queued:
+            waiting += 1
+            continue
+        queue.append({"name": file_name, "partition_dir": partition_dir, "path": local_path, "size": stat.st_size,
+                      "queued_at": time.monotonic()})
+    return waiting
+
+def batch_due(queue, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES, max_wait=BATCH_MAX_WAIT_SECONDS) -> bool:
+    """A batch ships once it is full by count or size, or its oldest file has waited long enough"""
+    if not queue:
+        return False
+    return (len(queue) >= max_files or sum(entry["size"] for entry in queue) >= max_bytes
+            or time.monotonic() - queue[0]["queued_at"] >= max_wait)
+
+def take_batch(queue, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES) -> list:
+    """Pop the oldest files up to the batch limits (always at least one)"""
+    batch, size = [], 0
+    while queue and len(batch) < max_files and (not batch or size + queue[0]["size"] <= max_bytes):
+        entry = queue.pop(0)
+        batch.append(entry)
+        size += entry["size"]
+    return batch
+
+def ship_batch(session, batch, manifest, manifest_path, checkpoint, checkpoint_path, rejected=None,
+               max_bad_ratio=VALIDATION_MAX_BAD_RATIO) -> dict:
+    """Validate one micro-batch, upload its valid files and record the region COPYs it now owes"""
+    rejected = rejected if rejected is not None else {}
+    (_, _, valid_paths), verdicts = validate_sales_files([entry["name"] for entry in batch],
+                                                         [entry["partition_dir"] for entry in batch],
+                                                         [entry["path"] for entry in batch], max_bad_ratio)
+    # Rejected files stay out of the manifest and are not queued again until they change
+    for verdict in verdicts:
+        if not verdict["valid"]:
+            rejected[verdict["path"]] = os.stat(verdict["path"]).st_mtime
+    valid_paths = set(valid_paths)
+    batch = [entry for entry in batch if entry["path"] in valid_paths]
+    if not batch:
+        return {"files": 0, "uploaded": [], "failed": [], "rejected": [verdict["path"] for verdict in verdicts]}
+
+    # The COPYs are owed before the PUT: a crash after it re-runs them, and COPY skips files it already loaded
+    for entry in batch:
+        copy = partition_copy(entry["partition_dir"])
+        if copy not in checkpoint["pending_copy"]:
+            checkpoint["pending_copy"].append(copy)
+    save_watch_checkpoint(checkpoint_path, checkpoint)
+
+    file_names = [entry["name"] for entry in batch]
+    partition_dirs = [entry["partition_dir"] for entry in batch]
+    local_paths = [entry["path"] for entry in batch]
+    summary = upload_files(session, file_names, partition_dirs, local_paths, STAGE_LOCATION, "sales")
+    summary["rejected"] = [verdict["path"] for verdict in verdicts if not verdict["valid"]]
+    # Failed files stay out of the manifest, so the next scan queues them again
+    record_uploads(manifest, summary["uploaded"], file_names, partition_dirs, local_paths, STAGE_LOCATION)
+    save_upload_manifest(manifest_path, manifest)
+    return summary
+
+def copy_pending(session, checkpoint, checkpoint_path) -> dict:
+    """Run the owed region COPYs, clearing each from the checkpoint once it succeeds"""
+    loaded = {}
+    for region, parquet in list(checkpoint["pending_copy"]):
+        rows = stage2source.copy_regions(session, [region], parquet)[region]
+        loaded[region] = loaded.get(region, 0) + rows
+        checkpoint["pending_copy"].remove([region, parquet])
+        save_watch_checkpoint(checkpoint_path, checkpoint)
+    return loaded
+
+def main(directory=SALES_DATA_DIR, manifest_path=None, checkpoint_path=None, poll_seconds=WATCH_POLL_SECONDS,
+         settle_seconds=FILE_SETTLE_SECONDS, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES,
+         max_wait=BATCH_MAX_WAIT_SECONDS, max_queued=MAX_QUEUED_FILES, once=False, max_bad_ratio=VALIDATION_MAX_BAD_RATIO,
+         session=None):
+    """Watch the sales tree and upload + COPY new files in micro-batches until interrupted"""
+    if not os.path.exists(directory):
+        logging.error(f"Directory not found: {directory}")
+        return None
+    manifest_path = manifest_path or default_manifest_path(directory)
+    checkpoint_path = checkpoint_path or default_checkpoint_path(directory)
+
+    owns_session = session is None
+    session = session or get_snowpark_session()
+    try:
+        if is_local(session):
+            logging.error("❌ The watcher uploads to the internal stage and needs the snowflake backend")
+            return None
+
+        manifest = load_upload_manifest(manifest_path)
+        checkpoint = load_watch_checkpoint(checkpoint_path)
+        if checkpoint["pending_copy"]:
+            logging.info(f"Resuming: {len(checkpoint['pending_copy'])} region COPYs owed from the last run")
+        queue = []
+        # path -> mtime of files validation rejected
+        rejected = {}
+        totals = {"batches": 0, "files": 0, "rows": 0}
+        retry_delay = 0.0
+        upload_failed = False
+        logging.info(f"Watching {directory} (batches of up to {max_files} files / {max_bytes / 1024 / 1024:.0f} MB "
+                     f"or {max_wait:.0f}s)")
+        try:
+            while True:
+                if checkpoint["pending_copy"]:
+                    # Backpressure: nothing new is uploaded while COPYs are owed
+                    try:
+                        with stage_metrics(session, "sales_watcher") as metrics:
+                            for region, rows in copy_pending(session, checkpoint, checkpoint_path).items():
+                                totals["rows"] += record_rows(metrics, f"loaded {region}", rows)
+                        retry_delay = 0.0
+                    except Exception as e:
+                        if once:
+                            logging.error(f"❌ COPY failed, it stays owed in {checkpoint_path}: {str(e)}")
+                            raise
+                        retry_delay = min(max(retry_delay * 2, poll_seconds), COPY_RETRY_MAX_SECONDS)
+                        logging.error(f"❌ COPY failed, retrying in {retry_delay:.0f}s: {str(e)}")
+                        time.sleep(retry_delay)
+                        continue
+                if once and upload_failed:
+                    # Failed files would be queued again straight away; leave them for the next run
+                    break
+
+                waiting = admit_completed_files(directory, manifest, queue, settle_seconds, max_queued, rejected)
+                if waiting:
+                    logging.warning(f"⚠ Queue full ({len(queue)} files), {waiting} completed files left for later")
+                if batch_due(queue, max_files, max_bytes, max_wait) or (once and queue):
+                    batch = take_batch(queue, max_files, max_bytes)
+                    logging.info(f"Shipping micro-batch of {len(batch)} files ({len(queue)} still queued)")
+                    summary = ship_batch(session, batch, manifest, manifest_path, checkpoint, checkpoint_path, rejected,
+                                         max_bad_ratio)
+                    totals["batches"] += 1
+                    totals["files"] += len(summary["uploaded"])
+                    upload_failed = bool(summary["failed"])
+                    # The COPYs run at the top of the next iteration
+                    continue
+
+                if once and not queue:
+                    break
+                time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            logging.info("Stopping: the checkpoint and manifest are up to date, a restart resumes from them")
+        finally:
+            logging.info(f"✓ {totals['batches']} batches, {totals['files']} files uploaded, {totals['rows']} rows loaded")
+        return totals
+    finally:
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload and COPY new sales files in micro-batches as they land")
+    parser.add_argument("--directory", default=SALES_DATA_DIR, help="local sales tree (source=XX/format=YY partitions)")
+    parser.add_argument("--manifest", default=None, help="upload manifest path (default: beside the sales tree)")
+    parser.add_argument("--checkpoint", default=None, help="watch checkpoint path (default: beside the sales tree)")
+    parser.add_argument("--poll-seconds", type=float, default=WATCH_POLL_SECONDS, help="seconds between directory scans")
+    parser.add_argument("--settle-seconds", type=float, default=FILE_SETTLE_SECONDS,
+                        help="a file is complete once unmodified for this long")
+    parser.add_argument("--max-files", type=int, default=BATCH_MAX_FILES, help="files per micro-batch")
+    parser.add_argument("--max-mb", type=float, default=BATCH_MAX_BYTES / 1024 / 1024, help="MB per micro-batch")
+    parser.add_argument("--max-wait", type=float, default=BATCH_MAX_WAIT_SECONDS,
+                        help="seconds the oldest queued file waits before a partial batch ships")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_FILES,
+                        help="completed files held in the queue before new ones are left for later")
+    parser.add_argument("--once", action="store_true", help="ship everything settled now, COPY it and exit")
+    parser.add_argument("--max-bad-ratio", type=float, default=VALIDATION_MAX_BAD_RATIO,
+                        help="share of rows a file may have that COPY would reject before the file is held back")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.directory, args.manifest, args.checkpoint, args.poll_seconds, args.settle_seconds, args.max_files,
+         int(args.max_mb * 1024 * 1024), args.max_wait, args.max_queued, args.once, args.max_bad_ratio)
@@ -1,253 +1,402 @@
 import sys
 import logging
+import argparse
 
-from snowflake.snowpark import Session, DataFrame
-from snowflake.snowpark.functions import col, lit, row_number, rank, year, month, quarter
+from snowflake.snowpark import DataFrame
+from snowflake.snowpark.functions import col, lit, row_number, year, month, quarter, when, count, min, max, when_matched, when_not_matched
+from snowflake.snowpark.types import StringType
 from snowflake.snowpark import Window
+from pipeline_metrics import stage_metrics, record_rows, insert_into, query_step
+from pipeline_backend import get_snowpark_session, is_local, truncate_table, merge_into, read_watermarks, save_watermarks, \
+    CLUSTERING_KEYS, ensure_clustering_keys, clustered_order
 
 # Initiate logging at info level
 logging.basicConfig(
-    stream=sys.stdout, 
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s', 
+    stream=sys.stdout,
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
     datefmt='%I:%M:%S'
 )
 
-# Snowpark session
-def get_snowpark_session() -> Session:
-    """Create Snowflake session"""
-    connection_parameters = {
-        "ACCOUNT": "QNNERMQ-RZ07987",
-        "USER": "snowpark_user",
-        "PASSWORD": "Test@12$4",
-        "ROLE": "SYSADMIN",
-        "DATABASE": "sales_dwh",
-        "SCHEMA": "source",
-        "WAREHOUSE": "SNOWPARK_ETL_WH"
+# Per-region differences between the three source tables
+REGION_REGISTRY = {
+    "India": {
+        "source_table": "sales_dwh.source.in_sales_order",
+        "curated_table": "sales_dwh.curated.in_sales_order",
+        "region": "Asia",
+        "currency": "INR",
+        "rate_column": "USD2INR",
+        "contact_column": "MOBILE"
+    },
+    "USA": {
+        "source_table": "sales_dwh.source.us_sales_order",
+        "curated_table": "sales_dwh.curated.us_sales_order",
+        "region": "North America",
+        "currency": "USD",
+        "rate_column": None,
+        "contact_column": "PHONE"
+    },
+    "France": {
+        "source_table": "sales_dwh.source.fr_sales_order",
+        "curated_table": "sales_dwh.curated.fr_sales_order",
+        "region": "Europe",
+        "currency": "EUR",
+        "rate_column": "USD2EU",
+        "contact_column": "PHONE"
     }
-    return Session.builder.configs(connection_parameters).create()   
+}
+
+# Source columns shared by every region, carried through to the curated projection
+SOURCE_COLUMNS = [
+    'SALES_ORDER_KEY', 'ORDER_ID', 'ORDER_DT', 'CUSTOMER_NAME', 'MOBILE_KEY', 'ORDER_QUANTITY',
+    'UNIT_PRICE', 'PROMOTION_CODE', 'FINAL_ORDER_AMOUNT', 'TAX_AMOUNT', 'PAYMENT_STATUS',
+    'SHIPPING_STATUS', 'PAYMENT_METHOD', 'PAYMENT_PROVIDER', 'SHIPPING_ADDRESS', '_METADATA_LAST_MODIFIED'
+]
+
+# Natural order key; the latest _METADATA_LAST_MODIFIED row per key wins
+DEDUP_KEY = 'ORDER_ID'
+
+# Incremental curation: SALES_ORDER_KEY comes from a per-table sequence, so it only grows as rows are loaded
+WATERMARK_TABLE = "sales_dwh.curated.curation_watermark"
+WATERMARK_COLUMN = 'SALES_ORDER_KEY'
+
+# Column order of the curated.*_sales_order tables
+CURATED_COLUMNS = [
+    'SALES_ORDER_KEY', 'ORDER_ID', 'ORDER_DT', 'CUSTOMER_NAME', 'MOBILE_KEY', 'COUNTRY', 'REGION',
+    'ORDER_QUANTITY', 'LOCAL_CURRENCY', 'LOCAL_UNIT_PRICE', 'PROMOTION_CODE', 'LOCAL_TOTAL_ORDER_AMT',
+    'LOCAL_TAX_AMT', 'EXCHANGE_RATE', 'USD_TOTAL_ORDER_AMT', 'USD_TAX_AMT', 'PAYMENT_STATUS',
+    'SHIPPING_STATUS', 'PAYMENT_METHOD', 'PAYMENT_PROVIDER', 'CONTACT_NO', 'SHIPPING_ADDRESS',
+    'ORDER_YEAR', 'ORDER_MONTH', 'ORDER_QUARTER'
+]
 
 def filter_dataset(df, column_name, filter_criterion) -> DataFrame:
     """Filter dataset by column value"""
     return_df = df.filter(col(column_name) == filter_criterion)
     return return_df
 
-def transform_india_sales(session):
-    """Transform India sales from source to curated"""
-    logging.info("=" * 60)
-    logging.info("Starting India sales transformation (SOURCE → CURATED)...")
-    logging.info("=" * 60)
-    
-    try:
-        sales_df = session.sql("SELECT * FROM source.in_sales_order")
-        logging.info(f"Source records loaded: {sales_df.count()}")
+def region_sales_df(session, country, key_range=None) -> DataFrame:
+    """Paid & delivered source orders for one region, tagged with its region/currency descriptor"""
+    spec = REGION_REGISTRY[country]
+    sales_df = session.table(spec['source_table'])
+    if key_range is not None:
+        low, high = key_range
+        sales_df = sales_df.filter((col(WATERMARK_COLUMN) > low) & (col(WATERMARK_COLUMN) <= high))
 
-        paid_sales_df = filter_dataset(sales_df, 'PAYMENT_STATUS', 'Paid')
-        shipped_sales_df = filter_dataset(paid_sales_df, 'SHIPPING_STATUS', 'Delivered')
-        logging.info(f"After filtering (Paid & Delivered): {shipped_sales_df.count()}")
+    paid_sales_df = filter_dataset(sales_df, 'PAYMENT_STATUS', 'Paid')
+    shipped_sales_df = filter_dataset(paid_sales_df, 'SHIPPING_STATUS', 'Delivered')
 
-        country_sales_df = shipped_sales_df.with_column('Country', lit('India')).with_column('Region', lit('Asia'))
+    return shipped_sales_df.select(
+        *[col(c) for c in SOURCE_COLUMNS],
+        col(spec['contact_column']).alias('CONTACT_NO'),
+        lit(country).alias('COUNTRY'),
+        lit(spec['region']).alias('REGION'),
+        lit(spec['currency']).alias('LOCAL_CURRENCY'),
+        lit(spec['rate_column']).cast(StringType()).alias('RATE_COLUMN')
+    )
 
-        # Join with exchange rate using USD2INR column
-        forex_df = session.sql("SELECT DATE as EXCHANGE_DATE, USD2INR as EXCHANGE_RATE FROM sales_dwh.common.exchange_rate")
-        sales_with_forex_df = country_sales_df.join(
-            forex_df,
-            country_sales_df['ORDER_DT'] == forex_df['EXCHANGE_DATE'],
-            join_type='left'
+def exchange_rate_df(session, rate_columns) -> DataFrame:
+    """Exchange rates unpivoted to one row per (date, rate column) so every currency joins in one pass"""
+    # UNION ALL of one projection per rate column: same result as UNPIVOT on the small rate table,
+    # and the local backend can run it
+    rates_df = session.table("sales_dwh.common.exchange_rate")
+    forex_df = None
+    for rate_column in rate_columns:
+        rate_df = rates_df.select(
+            col('DATE').alias('EXCHANGE_DATE'),
+            lit(rate_column).alias('FX_RATE_COLUMN'),
+            col(rate_column).alias('FX_RATE')
         )
+        forex_df = rate_df if forex_df is None else forex_df.union_all(rate_df)
+    return forex_df
 
-        # De-duplication
-        unique_orders = sales_with_forex_df.with_column(
-            'order_rank',
-            rank().over(
-                Window.partitionBy(col("ORDER_DT")).order_by(col('_METADATA_LAST_MODIFIED').desc())
-            )
-        ).filter(col("order_rank") == 1).select(
-            col('SALES_ORDER_KEY').alias('unique_sales_order_key')
-        )
-        
-        final_sales_df = unique_orders.join(
-            sales_with_forex_df,
-            unique_orders['unique_sales_order_key'] == sales_with_forex_df['SALES_ORDER_KEY'],
-            join_type='inner'
-        )
-        
-        # Select and transform columns
-        final_sales_df = final_sales_df.select(
-            col('SALES_ORDER_KEY'),
-            col('ORDER_ID'),
-            col('ORDER_DT'),
-            col('CUSTOMER_NAME'),
-            col('MOBILE_KEY'),
-            col('Country'),
-            col('Region'),
-            col('ORDER_QUANTITY'),
-            lit('INR').alias('LOCAL_CURRENCY'),
-            col('UNIT_PRICE').alias('LOCAL_UNIT_PRICE'),
-            col('PROMOTION_CODE'),
-            col('FINAL_ORDER_AMOUNT').alias('LOCAL_TOTAL_ORDER_AMT'),
-            col('TAX_AMOUNT').alias('LOCAL_TAX_AMT'),
-            col('EXCHANGE_RATE'),
-            (col('FINAL_ORDER_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TOTAL_ORDER_AMT'),
-            (col('TAX_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TAX_AMT'),
-            col('PAYMENT_STATUS'),
-            col('SHIPPING_STATUS'),
-            col('PAYMENT_METHOD'),
-            col('PAYMENT_PROVIDER'),
-            col('MOBILE').alias('CONTACT_NO'),
-            col('SHIPPING_ADDRESS'),
-            year(col('ORDER_DT')).alias('ORDER_YEAR'),
-            month(col('ORDER_DT')).alias('ORDER_MONTH'),
-            quarter(col('ORDER_DT')).alias('ORDER_QUARTER')
-        )
+def with_exchange_rate(sales_df, forex_df) -> DataFrame:
+    """Attach EXCHANGE_RATE; regions without a rate column are already in USD"""
+    if forex_df is None:
+        return sales_df.with_column('EXCHANGE_RATE', lit(1.0000000))
+
+    joined_df = sales_df.join(
+        forex_df,
+        (sales_df['ORDER_DT'] == forex_df['EXCHANGE_DATE']) & (sales_df['RATE_COLUMN'] == forex_df['FX_RATE_COLUMN']),
+        join_type='left'
+    )
+    return joined_df.with_column(
+        'EXCHANGE_RATE',
+        when(col('RATE_COLUMN').is_null(), lit(1.0000000)).otherwise(col('FX_RATE'))
+    )
+
+def deduplicate(sales_df, key=DEDUP_KEY) -> DataFrame:
+    """Keep the latest-loaded row per natural order key with a single window + filter (no join-back)"""
+    window = Window.partition_by(col('COUNTRY'), col(key)).order_by(
+        col('_METADATA_LAST_MODIFIED').desc(), col('SALES_ORDER_KEY').desc()
+    )
+    # Rows without an order id have no natural key to collapse on, so they are kept as-is
+    # (row-number test first: the local backend lines OR results up on the left operand)
+    return sales_df.with_column('DEDUP_ROW_NUMBER', row_number().over(window)) \
+                   .filter((col('DEDUP_ROW_NUMBER') == 1) | col(key).is_null()) \
+                   .drop('DEDUP_ROW_NUMBER')
+
+def log_duplicates_removed(country, rows_before, rows_after) -> None:
+    """Log the rows de-duplication removed, from the row counts before it and the rows written after it"""
+    logging.info(f"De-duplication on {DEDUP_KEY}: {rows_before - rows_after} duplicate {country} rows removed")
+
+def curated_projection(sales_df) -> DataFrame:
+    """Select and transform columns into the curated layout"""
+    return sales_df.select(
+        col('SALES_ORDER_KEY'),
+        col('ORDER_ID'),
+        col('ORDER_DT'),
+        col('CUSTOMER_NAME'),
+        col('MOBILE_KEY'),
+        col('COUNTRY'),
+        col('REGION'),
+        col('ORDER_QUANTITY'),
+        col('LOCAL_CURRENCY'),
+        col('UNIT_PRICE').alias('LOCAL_UNIT_PRICE'),
+        col('PROMOTION_CODE'),
+        col('FINAL_ORDER_AMOUNT').alias('LOCAL_TOTAL_ORDER_AMT'),
+        col('TAX_AMOUNT').alias('LOCAL_TAX_AMT'),
+        col('EXCHANGE_RATE'),
+        (col('FINAL_ORDER_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TOTAL_ORDER_AMT'),
+        (col('TAX_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TAX_AMT'),
+        col('PAYMENT_STATUS'),
+        col('SHIPPING_STATUS'),
+        col('PAYMENT_METHOD'),
+        col('PAYMENT_PROVIDER'),
+        col('CONTACT_NO'),
+        col('SHIPPING_ADDRESS'),
+        year(col('ORDER_DT')).alias('ORDER_YEAR'),
+        month(col('ORDER_DT')).alias('ORDER_MONTH'),
+        quarter(col('ORDER_DT')).alias('ORDER_QUARTER')
+    )
+
+def transform_region_sales(session, country) -> int:
+    """Transform one region's sales from source to curated, returning the rows written"""
+    spec = REGION_REGISTRY[country]
+    logging.info(f"Starting {country} sales transformation (SOURCE → CURATED)...")
+
+    try:
+        with query_step(session, f"curated {country}"):
+            sales_df = region_sales_df(session, country)
+            # A plain COUNT of the filtered source; the exchange-rate left join keeps one row per order
+            source_count = sales_df.count()
+            forex_df = exchange_rate_df(session, [spec['rate_column']]) if spec['rate_column'] else None
+            final_sales_df = curated_projection(deduplicate(with_exchange_rate(sales_df, forex_df)))
+
+            truncate_table(session, spec['curated_table'])
+            final_sales_df = clustered_order(final_sales_df, spec['curated_table'])
+            final_count = insert_into(session, final_sales_df, spec['curated_table'], CURATED_COLUMNS)
+            log_duplicates_removed(country, source_count, final_count)
+            logging.info(f"✓ {country} sales transformed: {final_count} rows")
+            return final_count
 
-        session.sql("TRUNCATE TABLE sales_dwh.curated.in_sales_order").collect()
-        final_sales_df.write.save_as_table("sales_dwh.curated.in_sales_order", mode="append")
-        
-        final_count = session.sql("SELECT COUNT(*) as cnt FROM sales_dwh.curated.in_sales_order").collect()[0]['CNT']
-        logging.info(f"✓ India sales transformed successfully: {final_count} rows")
-        
     except Exception as e:
-        logging.error(f"❌ Error transforming India sales: {str(e)}")
+        logging.error(f"❌ Error transforming {country} sales: {str(e)}")
         raise
 
-def transform_usa_sales(session):
+def transform_india_sales(session) -> int:
+    """Transform India sales from source to curated"""
+    return transform_region_sales(session, "India")
+
+def transform_usa_sales(session) -> int:
     """Transform USA sales from source to curated"""
-    logging.info("Starting USA sales transformation...")
-    
+    return transform_region_sales(session, "USA")
+
+def transform_france_sales(session) -> int:
+    """Transform France sales from source to curated"""
+    return transform_region_sales(session, "France")
+
+def all_regions_source_df(session) -> DataFrame:
+    """Every region's filtered source sales unioned into one relation"""
+    sales_df = None
+    for country in REGION_REGISTRY:
+        region_df = region_sales_df(session, country)
+        sales_df = region_df if sales_df is None else sales_df.union_all_by_name(region_df)
+    return sales_df
+
+def all_regions_sales_df(session, sales_df=None) -> DataFrame:
+    """Every region's sales unioned and joined to the unpivoted exchange rates once"""
+    sales_df = sales_df if sales_df is not None else all_regions_source_df(session)
+    rate_columns = [spec['rate_column'] for spec in REGION_REGISTRY.values() if spec['rate_column']]
+    return with_exchange_rate(sales_df, exchange_rate_df(session, rate_columns))
+
+def transform_all_sales_single_pass(session) -> dict:
+    """Write every curated table from a single compiled plan with one multi-table INSERT OVERWRITE"""
+    logging.info("=" * 60)
+    logging.info("Starting single-pass sales transformation (SOURCE → CURATED)...")
+    logging.info("=" * 60)
+
     try:
-        sales_df = session.sql("SELECT * FROM source.us_sales_order")
-        
-        paid_sales_df = filter_dataset(sales_df, 'PAYMENT_STATUS', 'Paid')
-        shipped_sales_df = filter_dataset(paid_sales_df, 'SHIPPING_STATUS', 'Delivered')
-        
-        country_sales_df = shipped_sales_df.with_column('Country', lit('USA')).with_column('Region', lit('North America'))
-        
-        final_sales_df = country_sales_df.select(
-            col('SALES_ORDER_KEY'),
-            col('ORDER_ID'),
-            col('ORDER_DT'),
-            col('CUSTOMER_NAME'),
-            col('MOBILE_KEY'),
-            col('Country'),
-            col('Region'),
-            col('ORDER_QUANTITY'),
-            lit('USD').alias('LOCAL_CURRENCY'),
-            col('UNIT_PRICE').alias('LOCAL_UNIT_PRICE'),
-            col('PROMOTION_CODE'),
-            col('FINAL_ORDER_AMOUNT').alias('LOCAL_TOTAL_ORDER_AMT'),
-            col('TAX_AMOUNT').alias('LOCAL_TAX_AMT'),
-            lit(1.0000000).alias('EXCHANGE_RATE'),
-            col('FINAL_ORDER_AMOUNT').alias('USD_TOTAL_ORDER_AMT'),
-            col('TAX_AMOUNT').alias('USD_TAX_AMT'),
-            col('PAYMENT_STATUS'),
-            col('SHIPPING_STATUS'),
-            col('PAYMENT_METHOD'),
-            col('PAYMENT_PROVIDER'),
-            col('PHONE').alias('CONTACT_NO'),
-            col('SHIPPING_ADDRESS'),
-            year(col('ORDER_DT')).alias('ORDER_YEAR'),
-            month(col('ORDER_DT')).alias('ORDER_MONTH'),
-            quarter(col('ORDER_DT')).alias('ORDER_QUARTER')
-        )
-        
-        session.sql("TRUNCATE TABLE sales_dwh.curated.us_sales_order").collect()
-        final_sales_df.write.save_as_table("sales_dwh.curated.us_sales_order", mode="append")
-        
-        final_count = session.sql("SELECT COUNT(*) as cnt FROM sales_dwh.curated.us_sales_order").collect()[0]['CNT']
-        logging.info(f"✓ USA sales transformed: {final_count} rows")
-        
+        with query_step(session, "curated all regions"):
+            source_df = all_regions_source_df(session)
+            source_counts = {row['COUNTRY']: row['SOURCE_ROWS']
+                             for row in source_df.group_by(col('COUNTRY')).agg(count(lit(1)).alias('SOURCE_ROWS')).collect()}
+            sales_df = all_regions_sales_df(session, source_df)
+
+            plan_sql = curated_projection(deduplicate(sales_df)).queries['queries'][-1]
+            column_list = ', '.join(CURATED_COLUMNS)
+            # Every curated table shares one clustering key; an outer ORDER BY writes them already clustered
+            cluster_list = ', '.join(CLUSTERING_KEYS[REGION_REGISTRY['India']['curated_table']])
+            into_clauses = '\n'.join(
+                f"WHEN COUNTRY = '{country}' THEN INTO {spec['curated_table']} ({column_list}) VALUES ({column_list})"
+                for country, spec in REGION_REGISTRY.items()
+            )
+            result = session.sql(f"""
+                INSERT OVERWRITE ALL
+                {into_clauses}
+                SELECT * FROM ({plan_sql}) ORDER BY {cluster_list}
+            """).collect()[0]
+
+            # The multi-table INSERT reports rows inserted per target, in WHEN order
+            inserted = dict(zip(REGION_REGISTRY, [int(v) for v in result]))
+            for country, cnt in inserted.items():
+                log_duplicates_removed(country, source_counts.get(country, 0), cnt)
+                logging.info(f"✓ {country} sales transformed: {cnt} rows")
+            return inserted
+
     except Exception as e:
-        logging.error(f"❌ Error transforming USA sales: {str(e)}")
+        logging.error(f"❌ Error in single-pass transformation: {str(e)}")
         raise
 
-def transform_france_sales(session):
-    """Transform France sales from source to curated"""
-    logging.info("Starting France sales transformation...")
-    
+def source_high_water_marks(session) -> dict:
+    """Current max SALES_ORDER_KEY of every source table in one query"""
+    hwm_df = None
+    for country, spec in REGION_REGISTRY.items():
+        region_df = session.table(spec['source_table']).agg(max(col(WATERMARK_COLUMN)).alias('HWM')) \
+                           .select(lit(country).alias('REGION'), col('HWM'))
+        hwm_df = region_df if hwm_df is None else hwm_df.union_all(region_df)
+    return {row['REGION']: int(row['HWM'] or 0) for row in hwm_df.collect()}
+
+def order_date_range(df) -> tuple:
+    """Earliest and latest ORDER_DT of a DataFrame, (None, None) when it is empty"""
+    row = df.agg(min(col('ORDER_DT')).alias('FIRST_DT'), max(col('ORDER_DT')).alias('LAST_DT')).collect()[0]
+    return row['FIRST_DT'], row['LAST_DT']
+
+def merge_region_sales(session, country, low, high, date_pruned=False) -> int:
+    """Curate source rows in (low, high] and MERGE them into the curated table on ORDER_ID"""
+    spec = REGION_REGISTRY[country]
+    logging.info(f"Merging {country} source rows with {WATERMARK_COLUMN} in ({low}, {high}]...")
+
     try:
-        sales_df = session.sql("SELECT * FROM source.fr_sales_order")
-        
-        paid_sales_df = filter_dataset(sales_df, 'PAYMENT_STATUS', 'Paid')
-        shipped_sales_df = filter_dataset(paid_sales_df, 'SHIPPING_STATUS', 'Delivered')
-        
-        country_sales_df = shipped_sales_df.with_column('Country', lit('France')).with_column('Region', lit('Europe'))
-        
-        # Join with exchange rate using USD2EU column
-        forex_df = session.sql("SELECT DATE as EXCHANGE_DATE, USD2EU as EXCHANGE_RATE FROM sales_dwh.common.exchange_rate")
-        sales_with_forex_df = country_sales_df.join(
-            forex_df,
-            country_sales_df['ORDER_DT'] == forex_df['EXCHANGE_DATE'],
-            join_type='left'
-        )
-        
-        final_sales_df = sales_with_forex_df.select(
-            col('SALES_ORDER_KEY'),
-            col('ORDER_ID'),
-            col('ORDER_DT'),
-            col('CUSTOMER_NAME'),
-            col('MOBILE_KEY'),
-            col('Country'),
-            col('Region'),
-            col('ORDER_QUANTITY'),
-            lit('EUR').alias('LOCAL_CURRENCY'),
-            col('UNIT_PRICE').alias('LOCAL_UNIT_PRICE'),
-            col('PROMOTION_CODE'),
-            col('FINAL_ORDER_AMOUNT').alias('LOCAL_TOTAL_ORDER_AMT'),
-            col('TAX_AMOUNT').alias('LOCAL_TAX_AMT'),
-            col('EXCHANGE_RATE'),
-            (col('FINAL_ORDER_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TOTAL_ORDER_AMT'),
-            (col('TAX_AMOUNT') / col('EXCHANGE_RATE')).alias('USD_TAX_AMT'),
-            col('PAYMENT_STATUS'),
-            col('SHIPPING_STATUS'),
-            col('PAYMENT_METHOD'),
-            col('PAYMENT_PROVIDER'),
-            col('PHONE').alias('CONTACT_NO'),
-            col('SHIPPING_ADDRESS'),
-            year(col('ORDER_DT')).alias('ORDER_YEAR'),
-            month(col('ORDER_DT')).alias('ORDER_MONTH'),
-            quarter(col('ORDER_DT')).alias('ORDER_QUARTER')
-        )
-        
-        session.sql("TRUNCATE TABLE sales_dwh.curated.fr_sales_order").collect()
-        final_sales_df.write.save_as_table("sales_dwh.curated.fr_sales_order", mode="append")
-        
-        final_count = session.sql("SELECT COUNT(*) as cnt FROM sales_dwh.curated.fr_sales_order").collect()[0]['CNT']
-        logging.info(f"✓ France sales transformed: {final_count} rows")
-        
+        with query_step(session, f"curated {country}"):
+            sales_df = region_sales_df(session, country, (low, high))
+            source_count = sales_df.count()
+            forex_df = exchange_rate_df(session, [spec['rate_column']]) if spec['rate_column'] else None
+            delta_df = curated_projection(deduplicate(with_exchange_rate(sales_df, forex_df)))
+
+            target = session.table(spec['curated_table'])
+            if date_pruned:
+                delta_df = delta_df.cache_result()
+            join_expr = (target[DEDUP_KEY] == delta_df[DEDUP_KEY]) & (target['COUNTRY'] == delta_df['COUNTRY'])
+            if date_pruned:
+                # A target-side ORDER_DT range lets the MERGE prune the date-clustered curated table; the window
+                # spans the delta's dates and those of the curated rows it re-sends, so an order whose ORDER_DT
+                # moved is still matched rather than inserted twice
+                if not delta_df.limit(1).collect():
+                    logging.info(f"✓ {country} has no new curated rows")
+                    return 0
+                delta_keys = delta_df.select(col(DEDUP_KEY).alias('DELTA_KEY'), col('COUNTRY').alias('DELTA_COUNTRY'))
+                matched_dates = target.join(delta_keys, (target[DEDUP_KEY] == delta_keys['DELTA_KEY'])
+                                            & (target['COUNTRY'] == delta_keys['DELTA_COUNTRY'])) \
+                                      .select(target['ORDER_DT'].alias('ORDER_DT'))
+                first_dt, last_dt = order_date_range(delta_df.select('ORDER_DT').union_all(matched_dates))
+                logging.info(f"Pruning the {country} MERGE to ORDER_DT {first_dt} .. {last_dt}")
+                join_expr = join_expr & (target['ORDER_DT'] >= lit(first_dt)) & (target['ORDER_DT'] <= lit(last_dt))
+            assignments = {c: delta_df[c] for c in CURATED_COLUMNS}
+            merge_result = merge_into(
+                session,
+                target,
+                delta_df,
+                join_expr,
+                [when_matched().update(assignments), when_not_matched().insert(assignments)]
+            )
+            log_duplicates_removed(country, source_count, merge_result.rows_inserted + merge_result.rows_updated)
+            logging.info(f"✓ {country} sales merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated")
+            return merge_result.rows_inserted + merge_result.rows_updated
+
     except Exception as e:
-        logging.error(f"❌ Error transforming France sales: {str(e)}")
+        logging.error(f"❌ Error merging {country} sales: {str(e)}")
         raise
 
-def main():
-    session = get_snowpark_session()
-    
+def transform_all_sales_incremental(session, high_water_marks, date_pruned=False) -> dict:
+    """Curate only source rows newer than each region's watermark; regions without one are rebuilt"""
+    logging.info("=" * 60)
+    logging.info("Starting incremental sales transformation (SOURCE → CURATED)...")
+    logging.info("=" * 60)
+
+    watermarks = read_watermarks(session, WATERMARK_TABLE)
+    counts = {}
+    for country in REGION_REGISTRY:
+        high = high_water_marks.get(country, 0)
+        if country not in watermarks:
+            logging.info(f"No watermark for {country}, falling back to a full refresh")
+            counts[country] = transform_region_sales(session, country)
+        elif high <= watermarks[country]:
+            logging.info(f"✓ {country} is up to date (watermark {watermarks[country]})")
+            counts[country] = 0
+        else:
+            counts[country] = merge_region_sales(session, country, watermarks[country], high, date_pruned)
+    return counts
+
+def main(single_pass=False, strict_metrics=False, incremental=False, full_refresh=False, date_pruned=False,
+         session=None):
+    # A session passed in (e.g. the local pipeline runner's) is left open for the next stage
+    owns_session = session is None
+    session = session or get_snowpark_session(schema="source")
+    if single_pass and is_local(session):
+        logging.warning("⚠ Multi-table INSERT is not available on the local backend, curating region by region")
+        single_pass = False
+
     try:
-        transform_india_sales(session)
-        transform_usa_sales(session)
-        transform_france_sales(session)
-        
-        counts = session.sql("""
-            SELECT 'India' as region, COUNT(*) as cnt FROM curated.in_sales_order
-            UNION ALL
-            SELECT 'USA', COUNT(*) FROM curated.us_sales_order
-            UNION ALL
-            SELECT 'France', COUNT(*) FROM curated.fr_sales_order
-        """).collect()
-        
+        with stage_metrics(session, "source2curated", strict_metrics) as metrics:
+            # Capture the high-water marks first so rows loaded mid-run are left for the next run
+            high_water_marks = source_high_water_marks(session)
+            ensure_clustering_keys(session, [spec['curated_table'] for spec in REGION_REGISTRY.values()])
+            if incremental and not full_refresh:
+                counts = transform_all_sales_incremental(session, high_water_marks, date_pruned)
+            elif single_pass:
+                counts = transform_all_sales_single_pass(session)
+            else:
+                counts = {
+                    "India": transform_india_sales(session),
+                    "USA": transform_usa_sales(session),
+                    "France": transform_france_sales(session)
+                }
+            for country, cnt in counts.items():
+                record_rows(metrics, f"curated {country}", cnt)
+            save_watermarks(session, WATERMARK_TABLE, high_water_marks)
+
+        # Row counts come from the INSERT/MERGE results, no extra COUNT(*) per table
         logging.info("=" * 60)
         logging.info("✓ Transformation complete! Curated layer summary:")
-        for row in counts:
-            logging.info(f"  {row['REGION']}: {row['CNT']} rows")
+        for country, cnt in counts.items():
+            logging.info(f"  {country}: {cnt} rows")
         logging.info("=" * 60)
-        
+        return metrics
+
     except Exception as e:
         logging.error(f"❌ Error: {str(e)}")
         raise
-        
+
     finally:
-        session.close()
-        logging.info("Session closed")
-    
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Transform SOURCE sales into the CURATED schema")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="curate all regions from one plan and write them with a single multi-table INSERT")
+    parser.add_argument("--strict-metrics", action="store_true",
+                        help="record how many queries the stage issued")
+    parser.add_argument("--incremental", action="store_true",
+                        help="curate only source rows past each region's watermark and MERGE them on ORDER_ID")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="force a TRUNCATE-and-rebuild of every region and reset the watermarks")
+    parser.add_argument("--date-pruned-merge", action="store_true",
+                        help="with --incremental, limit each MERGE to an ORDER_DT window covering the delta and "
+                             "the curated rows it re-sends")
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.single_pass, args.strict_metrics, args.incremental, args.full_refresh, args.date_pruned_merge)
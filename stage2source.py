@@ -1,6 +1,11 @@
+import os
 import sys
+import time
 import logging
-from snowflake.snowpark import Session
+import argparse
+from snowflake.snowpark.types import StructType, StructField, StringType, LongType
+from pipeline_metrics import stage_metrics, record_rows, query_step
+from pipeline_backend import get_snowpark_session, is_local, load_local_source_tables
 
 logging.basicConfig(
     stream=sys.stdout, 
@@ -9,72 +14,177 @@ logging.basicConfig(
     datefmt='%I:%M:%S'
 )
 
-def get_snowpark_session() -> Session:
-    """Create Snowflake session"""
-    connection_parameters = {
-        "ACCOUNT": "QNNERMQ-RZ07987",
-        "USER": "snowpark_user",
-        "PASSWORD": os.getenv("SNOWFLAKE_PASSWORD", "YOUR_PASSWORD_HERE"),
-        "ROLE": "SYSADMIN",
-        "DATABASE": "sales_dwh",
-        "WAREHOUSE": "SNOWPARK_ETL_WH"
-    }
-    return Session.builder.configs(connection_parameters).create()
-
-def ingest_in_sales(session) -> None:
-    """Load India sales data from CSV files"""
-    logging.info("Loading India sales data (CSV)...")
+# seconds between status checks on async COPY jobs
+COPY_POLL_SECONDS = 0.5
+
+# COPY telemetry and rejected-row quarantine
+COPY_TARGET_TABLES = {"India": "IN_SALES_ORDER", "USA": "US_SALES_ORDER", "France": "FR_SALES_ORDER"}
+LOAD_HISTORY_TABLE = "sales_dwh.source.copy_load_history"
+QUARANTINE_TABLE = "sales_dwh.source.copy_rejected_rows"
+LOAD_HISTORY_SCHEMA = StructType([
+    StructField("QUERY_ID", StringType()),
+    StructField("REGION", StringType()),
+    StructField("TARGET_TABLE", StringType()),
+    StructField("FILE_NAME", StringType()),
+    StructField("STATUS", StringType()),
+    StructField("ROWS_PARSED", LongType()),
+    StructField("ROWS_LOADED", LongType()),
+    StructField("ERRORS_SEEN", LongType()),
+    StructField("FIRST_ERROR", StringType()),
+    StructField("FIRST_ERROR_LINE", LongType()),
+    StructField("FIRST_ERROR_COLUMN", StringType())
+])
+# Casts the COPYs apply, as (column, raw value, TRY_ form): a row is rejected when a non-NULL value fails one
+CSV_CAST_CHECKS = [
+    ("QUANTITY", "t.$4", "TRY_TO_NUMBER(t.$4)"),
+    ("PRICE", "t.$5", "TRY_TO_NUMBER(t.$5)"),
+    ("AMOUNT", "t.$6", "TRY_TO_NUMBER(t.$6, 10, 2)"),
+    ("TOTAL_ORDER_AMOUNT", "t.$8", "TRY_TO_NUMBER(t.$8, 10, 2)"),
+    ("TAX", "t.$9", "TRY_TO_NUMBER(t.$9, 10, 2)"),
+    ("ORDER_DT", "t.$10", "TRY_TO_DATE(t.$10)")
+]
+SEMI_STRUCTURED_CAST_CHECKS = [
+    ("QUANTITY", 't.$1:"Quantity"', 'TRY_TO_NUMBER(t.$1:"Quantity"::text)'),
+    ("PRICE", 't.$1:"Price per Unit"', 'TRY_TO_NUMBER(t.$1:"Price per Unit"::text)'),
+    ("AMOUNT", 't.$1:"Total Price"', 'TRY_TO_NUMBER(t.$1:"Total Price"::text, 10, 2)'),
+    ("TOTAL_ORDER_AMOUNT", 't.$1:"Order Amount"', 'TRY_TO_NUMBER(t.$1:"Order Amount"::text, 10, 2)'),
+    ("TAX", 't.$1:"Tax"', 'TRY_TO_NUMBER(t.$1:"Tax"::text, 10, 2)'),
+    ("ORDER_DT", 't.$1:"Order Date"', 'TRY_TO_DATE(t.$1:"Order Date"::text)')
+]
+STAGE_FILE_FORMATS = {
+    "csv": "SALES_DWH.COMMON.MY_CSV_FORMAT",
+    "parquet": "SALES_DWH.COMMON.MY_PARQUET_FORMAT",
+    "json": "SALES_DWH.COMMON.MY_JSON_FORMAT"
+}
+
+def run_copy(session, region, copy_sql, block=True):
+    """Run a COPY statement, or submit it asynchronously and return the AsyncJob"""
+    started = time.perf_counter()
+    with query_step(session, f"loaded {region}"):
+        job = session.sql(copy_sql).collect_nowait()
+    if not block:
+        return job
     
-    result = session.sql("""
-        COPY INTO IN_SALES_ORDER 
-        FROM (
-            SELECT
-                IN_SALES_ORDER_SEQ.NEXTVAL,
-                t.$1::text,
-                t.$2::text,
-                t.$3::text,
-                t.$4::number,
-                t.$5::number,
-                t.$6::number,
-                t.$7::text,
-                t.$8::number(10,2),
-                t.$9::number(10,2),
-                t.$10::date,
-                t.$11::text,
-                t.$12::text,
-                t.$13::text,
-                t.$14::text,
-                t.$15::text,
-                t.$16::text,
-                metadata$filename,
-                metadata$file_row_number,
-                metadata$file_last_modified
-            FROM @MY_INTERNAL_STG/sales/source=IN/format=csv/
-            (file_format => 'SALES_DWH.COMMON.MY_CSV_FORMAT') t
-        ) 
-        ON_ERROR = 'CONTINUE'
+    # Waiting on the job (rather than collect()) keeps the query id for the load telemetry
+    result = job.result()
+    logging.info(f"✓ {region} sales loaded: {len(result)} result rows")
+    return {"result": result, "seconds": time.perf_counter() - started, "query_id": job.query_id}
+
+def parse_copy_result(region, query_id, result) -> list:
+    """Turn raw COPY result rows into one structured record per file"""
+    records = []
+    for row in result:
+        fields = {k.lower(): v for k, v in row.as_dict().items()}
+        # "Copy executed with 0 files processed." has no per-file columns
+        if fields.get("file") is None:
+            continue
+        records.append({
+            "QUERY_ID": query_id,
+            "REGION": region,
+            "TARGET_TABLE": COPY_TARGET_TABLES[region],
+            "FILE_NAME": fields["file"],
+            "STATUS": fields.get("status"),
+            "ROWS_PARSED": fields.get("rows_parsed") or 0,
+            "ROWS_LOADED": fields.get("rows_loaded") or 0,
+            "ERRORS_SEEN": fields.get("errors_seen") or 0,
+            "FIRST_ERROR": fields.get("first_error"),
+            "FIRST_ERROR_LINE": fields.get("first_error_line"),
+            "FIRST_ERROR_COLUMN": fields.get("first_error_column_name")
+        })
+    return records
+
+def save_load_history(session, records) -> None:
+    """Append per-file COPY records to the load-history table"""
+    if not records:
+        return
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_HISTORY_TABLE} (
+            query_id text, region text, target_table text, file_name text, status text,
+            rows_parsed number, rows_loaded number, errors_seen number,
+            first_error text, first_error_line number, first_error_column text,
+            recorded_at timestamp_ltz default current_timestamp()
+        )
+    """).collect()
+    history_df = session.create_dataframe(records, schema=LOAD_HISTORY_SCHEMA)
+    history_df.write.save_as_table(LOAD_HISTORY_TABLE, mode="append", column_order="name")
+
+def rejected_rows_sql(region, query_id, file_names) -> str:
+    """INSERT of every row in the given staged files whose value casts fail, re-read straight from the stage"""
+    # All of the files a COPY rejected rows from share its stage directory, e.g. .../source=IN/format=csv/
+    stage_dir = file_names[0][:file_names[0].rindex("/") + 1]
+    source_format = stage_dir.rstrip("/").split("format=")[-1]
+    source = stage_dir.split("source=")[-1].split("/")[0]
+    checks = CSV_CAST_CHECKS if source_format == "csv" else SEMI_STRUCTURED_CAST_CHECKS
+    record = ("ARRAY_CONSTRUCT(" + ", ".join(f"t.${i}" for i in range(1, 17)) + ")::text") if source_format == "csv" else "t.$1::text"
+    failed = [(column, f"{raw} IS NOT NULL AND {cast} IS NULL", raw) for column, raw, cast in checks]
+    column_case = " ".join(f"WHEN {condition} THEN '{column}'" for column, condition, _ in failed)
+    error_case = " ".join(f"WHEN {condition} THEN 'cannot convert ' || {raw}::text || ' for {column}'" for column, condition, raw in failed)
+    base_names = ", ".join(f"'{name.rsplit('/', 1)[-1]}'" for name in file_names)
+    return f"""
+        INSERT INTO {QUARANTINE_TABLE} (query_id, region, target_table, file_name, line, column_name, error, rejected_record)
+        SELECT '{query_id}', '{region}', '{COPY_TARGET_TABLES[region]}', metadata$filename, metadata$file_row_number,
+               CASE {column_case} END, CASE {error_case} END, {record}
+        FROM @MY_INTERNAL_STG/sales/source={source}/format={source_format}/
+        (file_format => '{STAGE_FILE_FORMATS[source_format]}') t
+        WHERE SPLIT_PART(metadata$filename, '/', -1) IN ({base_names})
+          AND ({" OR ".join(f"({condition})" for _, condition, _ in failed)})
+    """
+
+def quarantine_rejected_rows(session, region, query_id, records) -> int:
+    """Copy every rejected row of a COPY job into the quarantine table"""
+    bad_files = [r for r in records if r["ERRORS_SEEN"]]
+    if not bad_files:
+        return 0
+    
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {QUARANTINE_TABLE} (
+            query_id text, region text, target_table text, file_name text, line number,
+            column_name text, error text, rejected_record text,
+            quarantined_at timestamp_ltz default current_timestamp()
+        )
     """).collect()
     
-    logging.info(f"✓ India sales loaded: {result}")
+    # VALIDATE(JOB_ID => ...) rejects COPYs that transform data, which all of ours do, so the failing files
+    # are re-read from the stage and the rows whose casts fail are selected instead
+    inserted = session.sql(rejected_rows_sql(region, query_id, [r["FILE_NAME"] for r in bad_files])).collect()[0][0]
+    errors = sum(r["ERRORS_SEEN"] for r in bad_files)
+    logging.warning(f"⚠ {region}: {len(bad_files)} files with rejected rows, {inserted} quarantine rows written")
+    if inserted < errors:
+        # Rows the file format cannot parse at all never reach the casts; their first error is in the load history
+        logging.warning(f"⚠ {region}: {errors - inserted} of {errors} rejected rows failed to parse, see {LOAD_HISTORY_TABLE}")
+    return inserted
 
-def ingest_us_sales(session) -> None:
-    """Load USA sales data from Parquet files"""
-    logging.info("Loading USA sales data (Parquet)...")
+def record_load_telemetry(session, copy_results) -> list:
+    """Persist structured per-file load records and quarantine rejected rows for every region"""
+    all_records = []
+    for region, copy_result in copy_results.items():
+        records = parse_copy_result(region, copy_result["query_id"], copy_result["result"])
+        parsed = sum(r["ROWS_PARSED"] for r in records)
+        loaded = sum(r["ROWS_LOADED"] for r in records)
+        errors = sum(r["ERRORS_SEEN"] for r in records)
+        logging.info(f"  {region}: {len(records)} files, {parsed} rows parsed, {loaded} loaded, {errors} errors")
+        quarantine_rejected_rows(session, region, copy_result["query_id"], records)
+        all_records.extend(records)
     
-    result = session.sql("""
-        COPY INTO US_SALES_ORDER
+    save_load_history(session, all_records)
+    return all_records
+
+def semi_structured_copy_sql(table, sequence, source, file_format_dir, file_format) -> str:
+    """COPY statement for Parquet/JSON sales files keyed by column name"""
+    return f"""
+        COPY INTO {table}
         FROM (
             SELECT
-                US_SALES_ORDER_SEQ.NEXTVAL,
+                {sequence}.NEXTVAL,
                 $1:"Order ID"::text,
                 $1:"Customer Name"::text,
                 $1:"Mobile Model"::text,
                 TO_NUMBER($1:"Quantity"),
                 TO_NUMBER($1:"Price per Unit"),
-                TO_DECIMAL($1:"Total Price"),
+                $1:"Total Price"::number(10,2),
                 $1:"Promotion Code"::text,
                 $1:"Order Amount"::number(10,2),
-                TO_DECIMAL($1:"Tax"),
+                $1:"Tax"::number(10,2),
                 $1:"Order Date"::date,
                 $1:"Payment Status"::text,
                 $1:"Shipping Status"::text,
@@ -85,98 +195,186 @@ def ingest_us_sales(session) -> None:
                 metadata$filename,
                 metadata$file_row_number,
                 metadata$file_last_modified
-            FROM @MY_INTERNAL_STG/sales/source=US/format=parquet/
-            (file_format => SALES_DWH.COMMON.MY_PARQUET_FORMAT)
+            FROM @MY_INTERNAL_STG/sales/source={source}/format={file_format_dir}/
+            (file_format => {file_format})
         ) 
         ON_ERROR = 'CONTINUE'
-    """).collect()
-    
-    logging.info(f"✓ USA sales loaded: {result}")
+    """
 
-def ingest_fr_sales(session) -> None:
-    """Load France sales data from JSON files"""
-    logging.info("Loading France sales data (JSON)...")
+def ingest_in_sales(session, source_format='csv', block=True):
+    """Load India sales data from CSV files (or their local Parquet conversion)"""
+    logging.info(f"Loading India sales data ({source_format.upper()})...")
+    
+    if source_format == 'parquet':
+        return run_copy(session, "India", semi_structured_copy_sql(
+            "IN_SALES_ORDER", "IN_SALES_ORDER_SEQ", "IN", "parquet", "SALES_DWH.COMMON.MY_PARQUET_FORMAT"
+        ), block)
     
-    result = session.sql("""
-        COPY INTO FR_SALES_ORDER
+    return run_copy(session, "India", """
+        COPY INTO IN_SALES_ORDER 
         FROM (
             SELECT
-                FR_SALES_ORDER_SEQ.NEXTVAL,
-                $1:"Order ID"::text,
-                $1:"Customer Name"::text,
-                $1:"Mobile Model"::text,
-                TO_NUMBER($1:"Quantity"),
-                TO_NUMBER($1:"Price per Unit"),
-                TO_DECIMAL($1:"Total Price"),
-                $1:"Promotion Code"::text,
-                $1:"Order Amount"::number(10,2),
-                TO_DECIMAL($1:"Tax"),
-                $1:"Order Date"::date,
-                $1:"Payment Status"::text,
-                $1:"Shipping Status"::text,
-                $1:"Payment Method"::text,
-                $1:"Payment Provider"::text,
-                $1:"Phone"::text,
-                $1:"Delivery Address"::text,
+                IN_SALES_ORDER_SEQ.NEXTVAL,
+                t.$1::text,
+                t.$2::text,
+                t.$3::text,
+                t.$4::number,
+                t.$5::number,
+                t.$6::number(10,2),
+                t.$7::text,
+                t.$8::number(10,2),
+                t.$9::number(10,2),
+                t.$10::date,
+                t.$11::text,
+                t.$12::text,
+                t.$13::text,
+                t.$14::text,
+                t.$15::text,
+                t.$16::text,
                 metadata$filename,
                 metadata$file_row_number,
                 metadata$file_last_modified
-            FROM @MY_INTERNAL_STG/sales/source=FR/format=json/
-            (file_format => SALES_DWH.COMMON.MY_JSON_FORMAT)
+            FROM @MY_INTERNAL_STG/sales/source=IN/format=csv/
+            (file_format => 'SALES_DWH.COMMON.MY_CSV_FORMAT') t
         ) 
         ON_ERROR = 'CONTINUE'
-    """).collect()
+    """, block)
+
+def ingest_us_sales(session, block=True):
+    """Load USA sales data from Parquet files"""
+    logging.info("Loading USA sales data (Parquet)...")
+    
+    return run_copy(session, "USA", semi_structured_copy_sql(
+        "US_SALES_ORDER", "US_SALES_ORDER_SEQ", "US", "parquet", "SALES_DWH.COMMON.MY_PARQUET_FORMAT"
+    ), block)
+
+def ingest_fr_sales(session, source_format='json', block=True):
+    """Load France sales data from JSON files (or their local Parquet conversion)"""
+    logging.info(f"Loading France sales data ({source_format.upper()})...")
+    
+    file_format = "SALES_DWH.COMMON.MY_PARQUET_FORMAT" if source_format == 'parquet' else "SALES_DWH.COMMON.MY_JSON_FORMAT"
+    return run_copy(session, "France", semi_structured_copy_sql(
+        "FR_SALES_ORDER", "FR_SALES_ORDER_SEQ", "FR", source_format, file_format
+    ), block)
+
+# Region -> its COPY; parquet selects the format=parquet partitions written by data_loading.py --to-parquet
+REGION_COPIES = {
+    "India": lambda session, parquet=False, block=True: ingest_in_sales(session, 'parquet' if parquet else 'csv', block),
+    "USA": lambda session, parquet=False, block=True: ingest_us_sales(session, block),
+    "France": lambda session, parquet=False, block=True: ingest_fr_sales(session, 'parquet' if parquet else 'json', block)
+}
+
+def ingest_all_concurrently(session, parquet=False, poll_interval=COPY_POLL_SECONDS) -> dict:
+    """Submit every region's COPY as an async query and wait on them together"""
+    pending = {}
+    for region, copy in REGION_COPIES.items():
+        pending[region] = (copy(session, parquet, block=False), time.perf_counter())
+        logging.info(f"Submitted {region} COPY (query id {pending[region][0].query_id})")
+    
+    results = {}
+    while pending:
+        for region in list(pending):
+            job, started = pending[region]
+            if not job.is_done():
+                continue
+            del pending[region]
+            try:
+                rows = job.result()
+            except Exception:
+                # Fail fast: nothing else from this run should keep loading
+                for other_region, (other_job, _) in pending.items():
+                    logging.warning(f"⚠ Cancelling {other_region} COPY after {region} failed")
+                    other_job.cancel()
+                raise
+            results[region] = {"result": rows, "seconds": time.perf_counter() - started, "query_id": job.query_id}
+            logging.info(f"✓ {region} sales loaded in {results[region]['seconds']:.2f}s")
+        if pending:
+            time.sleep(poll_interval)
     
-    logging.info(f"✓ France sales loaded: {result}")
+    return results
 
-def main():
+def copy_from_stage(session, parquet=False, concurrent=False) -> dict:
+    """COPY every region from the internal stage and return rows loaded per region"""
+    if concurrent:
+        results = ingest_all_concurrently(session, parquet)
+        for region, result in results.items():
+            logging.info(f"  {region} COPY: {result['seconds']:.2f}s")
+    else:
+        results = {region: copy(session, parquet) for region, copy in REGION_COPIES.items()}
+    return rows_loaded(session, results)
+
+def copy_regions(session, regions, parquet=False) -> dict:
+    """COPY only the given regions, e.g. those a micro-batch just staged files for"""
+    return rows_loaded(session, {region: REGION_COPIES[region](session, parquet) for region in regions})
+
+def rows_loaded(session, results) -> dict:
+    """Record per-file telemetry for finished COPYs and return rows loaded per region"""
+    # Per-file telemetry and rejected-row quarantine
+    with query_step(session, "load telemetry"):
+        records = record_load_telemetry(session, results)
+    
+    # Rows loaded come from the COPY results, no COUNT(*) over the source tables
+    return {region: sum(r["ROWS_LOADED"] for r in records if r["REGION"] == region) for region in results}
+
+def main(parquet=False, concurrent=False, strict_metrics=False, session=None):
     logging.info("=" * 60)
     logging.info("Starting sales data ingestion process...")
     logging.info("=" * 60)
     
-    session = get_snowpark_session()
+    # A session passed in (e.g. the local pipeline runner's) is left open for the next stage
+    owns_session = session is None
+    session = session or get_snowpark_session()
     
     try:
-        # Verify context
-        context = session.sql("SELECT CURRENT_ROLE(), CURRENT_DATABASE(), CURRENT_SCHEMA(), CURRENT_WAREHOUSE()").collect()
-        logging.info(f"Session context: {context[0]}")
-        
-        # Verify tables exist
-        tables = session.sql("SHOW TABLES IN SCHEMA SOURCE").collect()
-        logging.info(f"Tables found: {len(tables)}")
-        for table in tables:
-            logging.info(f"  - {table['name']}")
-        
-        if len(tables) == 0:
-            raise Exception("No tables found! Check permissions.")
+        if not is_local(session):
+            # Verify context
+            context = session.sql("SELECT CURRENT_ROLE(), CURRENT_DATABASE(), CURRENT_SCHEMA(), CURRENT_WAREHOUSE()").collect()
+            logging.info(f"Session context: {context[0]}")
+            
+            # Verify tables exist
+            tables = session.sql("SHOW TABLES IN SCHEMA SOURCE").collect()
+            logging.info(f"Tables found: {len(tables)}")
+            for table in tables:
+                logging.info(f"  - {table['name']}")
+            
+            if len(tables) == 0:
+                raise Exception("No tables found! Check permissions.")
         
-        # Load all regions
-        ingest_in_sales(session)
-        ingest_us_sales(session)
-        ingest_fr_sales(session)
-        
-        # Verify data loaded
-        counts = session.sql("""
-            SELECT 'India' as region, COUNT(*) as cnt FROM IN_SALES_ORDER
-            UNION ALL
-            SELECT 'USA', COUNT(*) FROM US_SALES_ORDER
-            UNION ALL
-            SELECT 'France', COUNT(*) FROM FR_SALES_ORDER
-        """).collect()
+        with stage_metrics(session, "stage2source", strict_metrics) as metrics:
+            if is_local(session):
+                # No stage or COPY locally: the sample data tree is parsed straight into the source tables
+                loaded = load_local_source_tables(session, parquet)
+            else:
+                loaded = copy_from_stage(session, parquet, concurrent)
+            for region, rows in loaded.items():
+                record_rows(metrics, f"loaded {region}", rows)
         
         logging.info("=" * 60)
         logging.info("✓ Data load summary:")
-        for row in counts:
-            logging.info(f"  {row['REGION']}: {row['CNT']} rows")
+        for region, rows in loaded.items():
+            logging.info(f"  {region}: {rows} rows loaded")
         logging.info("=" * 60)
+        return metrics
         
     except Exception as e:
         logging.error(f"❌ Error: {str(e)}")
         raise
         
     finally:
-        session.close()
-        logging.info("Session closed")
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="COPY staged sales files into the SOURCE schema")
+    parser.add_argument("--parquet", action="store_true",
+                        help="load India and France from the format=parquet partitions written by data_loading.py --to-parquet")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="submit the three region COPYs as async queries and wait on them together")
+    parser.add_argument("--strict-metrics", action="store_true",
+                        help="record how many queries the stage issued")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.parquet, args.concurrent, args.strict_metrics)
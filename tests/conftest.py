@@ -0,0 +1,40 @@
+import os
+import csv
+import sys
+
+import pytest
+
+# The pipeline modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loading import SALES_PARQUET_COLUMNS
+
+SALES_COLUMNS = [name for name, _ in SALES_PARQUET_COLUMNS]
+
+@pytest.fixture
+def sales_record():
+    """Build one valid sales record (as the generator writes it), with any fields overridden"""
+    def build(order_id="IN-0000000001", **overrides):
+        record = {
+            "Order ID": order_id, "Customer Name": "Chloe Sharma", "Mobile Model": "Apple/iPhone 12/Black/256GB",
+            "Quantity": 3, "Price per Unit": 36675, "Total Price": 110025, "Promotion Code": None,
+            "Order Amount": 110025.0, "Tax": 19804.5, "Order Date": "2020-08-06", "Payment Status": "Paid",
+            "Shipping Status": "Delivered", "Payment Method": "Wallet", "Payment Provider": "PayPal",
+            "Phone": "+91 1000023757", "Delivery Address": "94 Rue de Rivoli, Mumbai"
+        }
+        record.update({name.replace('_', ' '): value for name, value in overrides.items()})
+        return record
+    return build
+
+@pytest.fixture
+def write_sales_csv(tmp_path):
+    """Write records as a headed CSV file, the way the IN partition is delivered"""
+    def write(records, name="orders.csv"):
+        path = tmp_path / name
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(SALES_COLUMNS)
+            for record in records:
+                writer.writerow(['' if record[c] is None else record[c] for c in SALES_COLUMNS])
+        return str(path)
+    return write
@@ -0,0 +1,76 @@
+import json
+import datetime
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from data_loading import SALES_PARQUET_COLUMNS, SALES_PARQUET_SCHEMA, to_sales_table, convert_file_to_parquet
+
+SALES_COLUMNS = [name for name, _ in SALES_PARQUET_COLUMNS]
+
+
+def sales_frame(records):
+    """Records as the string-typed frame iter_sales_frames yields for a CSV file"""
+    return pd.DataFrame([[None if r[c] is None else str(r[c]) for c in SALES_COLUMNS] for r in records],
+                        columns=SALES_COLUMNS)
+
+
+def test_to_sales_table_applies_the_copy_types(sales_record):
+    table, invalid = to_sales_table(sales_frame([sales_record()]))
+
+    assert invalid == 0
+    assert table.schema == SALES_PARQUET_SCHEMA
+    row = table.to_pylist()[0]
+    assert row["Quantity"] == 3
+    assert row["Order Date"] == datetime.date(2020, 8, 6)
+    assert row["Promotion Code"] is None
+
+
+def test_to_sales_table_keeps_two_decimals(sales_record):
+    table, _ = to_sales_table(sales_frame([sales_record(Order_Amount="1234.56", Tax="19804.5")]))
+
+    row = table.to_pylist()[0]
+    assert row["Order Amount"] == Decimal("1234.56")
+    assert row["Tax"] == Decimal("19804.50")
+
+
+def test_to_sales_table_drops_rows_that_would_fail_their_cast(sales_record):
+    records = [
+        sales_record("IN-1"),
+        sales_record("IN-2", Quantity="three"),
+        sales_record("IN-3", Order_Date="not a date"),
+        # NUMBER(10,2) holds at most 8 integer digits
+        sales_record("IN-4", Order_Amount="123456789.00"),
+    ]
+    table, invalid = to_sales_table(sales_frame(records))
+
+    assert invalid == 3
+    assert table.column("Order ID").to_pylist() == ["IN-1"]
+
+
+def test_convert_csv_to_parquet(tmp_path, sales_record, write_sales_csv):
+    # 'NA' is a real provider value, only empty fields are NULL
+    source = write_sales_csv([sales_record("IN-1", Payment_Provider="NA"), sales_record("IN-2", Quantity="x")])
+    output = str(tmp_path / "out" / "orders.parquet")
+
+    result = convert_file_to_parquet(source, output, "csv", chunk_rows=1)
+
+    assert result["rows"] == 1
+    assert result["dropped"] == 1
+    table = pq.read_table(output)
+    assert table.schema.equals(SALES_PARQUET_SCHEMA)
+    assert table.column("Payment Provider").to_pylist() == ["NA"]
+    assert not (tmp_path / "out" / "orders.parquet.tmp").exists()
+
+
+def test_convert_json_array_to_parquet(tmp_path, sales_record):
+    source = tmp_path / "orders.json"
+    source.write_text(json.dumps([sales_record(f"FR-{i}") for i in range(5)]))
+    output = str(tmp_path / "orders.parquet")
+
+    result = convert_file_to_parquet(str(source), output, "json", chunk_rows=2)
+
+    assert result["rows"] == 5
+    assert result["dropped"] == 0
+    assert pq.read_table(output).column("Order ID").to_pylist() == [f"FR-{i}" for i in range(5)]
@@ -0,0 +1,75 @@
+import os
+import csv
+import json
+
+from data_loading import SPLIT_INDEX_SUFFIX, split_file, load_chunk_index
+
+
+def read_chunks(output_dir, chunks):
+    return [open(os.path.join(output_dir, name), 'rb').read() for name in chunks]
+
+
+def test_csv_chunks_carry_the_header_and_keep_every_record(tmp_path, sales_record, write_sales_csv):
+    source = write_sales_csv([sales_record(f"IN-{i:04d}") for i in range(200)])
+    output_dir = str(tmp_path / "chunks")
+    size = os.path.getsize(source)
+
+    result = split_file(source, output_dir, "orders.csv", "csv", chunk_bytes=size // 3)
+
+    assert result["chunks"] == ["orders.part0001.csv", "orders.part0002.csv", "orders.part0003.csv", "orders.part0004.csv"]
+    lines = open(source, 'rb').read().splitlines(keepends=True)
+    header, records = lines[0], lines[1:]
+    contents = read_chunks(output_dir, result["chunks"])
+    assert all(content.startswith(header) for content in contents)
+    assert b''.join(content[len(header):] for content in contents) == b''.join(records)
+    # Near-equal shares: no chunk is a small remainder, and none passes chunk_bytes
+    sizes = [len(content) for content in contents]
+    assert max(sizes) <= size // 3
+    assert min(sizes) > 0.8 * max(sizes)
+
+
+def test_csv_quoted_line_breaks_stay_in_one_chunk(tmp_path, sales_record, write_sales_csv):
+    records = [sales_record(f"IN-{i:04d}", Delivery_Address=f"{i} Main St\nMumbai") for i in range(50)]
+    source = write_sales_csv(records)
+    output_dir = str(tmp_path / "chunks")
+
+    result = split_file(source, output_dir, "orders.csv", "csv", chunk_bytes=os.path.getsize(source) // 4)
+
+    order_ids = []
+    for name in result["chunks"]:
+        with open(os.path.join(output_dir, name), newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        assert all(row["Delivery Address"].endswith("Main St\nMumbai") for row in rows)
+        order_ids += [row["Order ID"] for row in rows]
+    assert order_ids == [f"IN-{i:04d}" for i in range(50)]
+
+
+def test_json_array_becomes_newline_delimited_chunks(tmp_path, sales_record):
+    records = [sales_record(f"FR-{i:04d}") for i in range(120)]
+    source = tmp_path / "orders.json"
+    source.write_text(json.dumps(records, indent=1))
+    output_dir = str(tmp_path / "chunks")
+
+    result = split_file(str(source), output_dir, "orders.json", "json", chunk_bytes=os.path.getsize(source) // 2)
+
+    assert len(result["chunks"]) == 2
+    split_records = [json.loads(line) for content in read_chunks(output_dir, result["chunks"])
+                     for line in content.decode('utf-8').splitlines()]
+    assert split_records == records
+
+
+def test_resplit_replaces_stale_chunks_and_index(tmp_path, sales_record, write_sales_csv):
+    source = write_sales_csv([sales_record(f"IN-{i:04d}") for i in range(100)])
+    output_dir = str(tmp_path / "chunks")
+    size = os.path.getsize(source)
+    index_path = os.path.join(output_dir, f"orders.csv{SPLIT_INDEX_SUFFIX}")
+
+    first = split_file(source, output_dir, "orders.csv", "csv", chunk_bytes=size // 4)
+    assert load_chunk_index(index_path, source, size // 4) == first["chunks"]
+
+    second = split_file(source, output_dir, "orders.csv", "csv", chunk_bytes=size)
+
+    assert second["chunks"] == ["orders.part0001.csv"]
+    assert sorted(name for name in os.listdir(output_dir) if not name.endswith(SPLIT_INDEX_SUFFIX)) == second["chunks"]
+    assert load_chunk_index(index_path, source, size // 4) is None
+    assert load_chunk_index(index_path, source, size) == second["chunks"]
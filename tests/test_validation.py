@@ -0,0 +1,105 @@
+import json
+
+import pytest
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loading import partition_problem, validate_sales_file, validate_sales_files
+
+
+@pytest.mark.parametrize("partition_dir, source_format", [
+    ("source=IN/format=csv", "csv"),
+    ("source=US/format=parquet", "parquet"),
+    ("source=FR/format=json", "json"),
+    ("source=FR/format=parquet", "parquet"),
+])
+def test_partition_problem_accepts_what_a_copy_reads(partition_dir, source_format):
+    assert partition_problem(partition_dir, source_format) is None
+
+
+@pytest.mark.parametrize("partition_dir, source_format, problem", [
+    ("source=IN", "csv", "is not source=XX/format=YY"),
+    ("extra/source=IN/format=csv", "csv", "is not source=XX/format=YY"),
+    ("source=DE/format=csv", "csv", "unknown source 'DE'"),
+    ("source=IN/format=json", "csv", "a .csv file under format=json"),
+    ("source=US/format=csv", "csv", "no COPY reads csv for source=US"),
+])
+def test_partition_problem_names_what_is_wrong(partition_dir, source_format, problem):
+    assert problem in partition_problem(partition_dir, source_format)
+
+
+def test_valid_csv_file(sales_record, write_sales_csv):
+    path = write_sales_csv([sales_record(f"IN-{i}") for i in range(3)])
+
+    verdict = validate_sales_file(path, "source=IN/format=csv")
+
+    assert verdict["valid"]
+    assert verdict["rows"] == 3
+    assert verdict["bad_rows"] == 0
+
+
+def test_csv_examples_report_physical_lines(sales_record, write_sales_csv):
+    records = [
+        sales_record("IN-1", Delivery_Address="1 Main St\nMumbai"),
+        sales_record("IN-2", Quantity="three"),
+        sales_record("IN-3", Customer_Name=None),
+    ]
+    path = write_sales_csv(records)
+
+    verdict = validate_sales_file(path, "source=IN/format=csv")
+
+    # The header is line 1 and the first record spans lines 2-3
+    assert not verdict["valid"]
+    assert verdict["bad_rows"] == 2
+    assert "line 4: Quantity 'three' does not cast" in verdict["examples"]
+    assert "line 5: Customer Name is empty" in verdict["examples"]
+
+
+def test_csv_with_reordered_columns_is_rejected(tmp_path, sales_record):
+    record = sales_record()
+    columns = list(record)[::-1]
+    path = tmp_path / "orders.csv"
+    path.write_text(",".join(columns) + "\n" + ",".join(str(record[c] or '') for c in columns) + "\n")
+
+    verdict = validate_sales_file(str(path), "source=IN/format=csv")
+
+    assert not verdict["valid"]
+    assert verdict["errors"][0].startswith("columns out of order")
+
+
+def test_json_examples_report_record_numbers(tmp_path, sales_record):
+    path = tmp_path / "orders.json"
+    path.write_text(json.dumps([sales_record("FR-1"), sales_record("FR-2", Order_Date="someday")]))
+
+    verdict = validate_sales_file(str(path), "source=FR/format=json")
+
+    assert verdict["examples"] == ["record 2: Order Date 'someday' does not cast"]
+
+
+def test_parquet_missing_columns_is_rejected(tmp_path):
+    path = tmp_path / "orders.parquet"
+    pq.write_table(pa.table({"Order ID": ["US-1"]}), str(path))
+
+    verdict = validate_sales_file(str(path), "source=US/format=parquet")
+
+    assert not verdict["valid"]
+    assert verdict["errors"][0].startswith("missing columns")
+
+
+def test_bad_ratio_tolerates_a_share_of_bad_rows(sales_record, write_sales_csv):
+    path = write_sales_csv([sales_record("IN-1"), sales_record("IN-2"), sales_record("IN-3", Quantity="x"),
+                            sales_record("IN-4")])
+
+    assert not validate_sales_file(path, "source=IN/format=csv")["valid"]
+    assert validate_sales_file(path, "source=IN/format=csv", max_bad_ratio=0.25)["valid"]
+
+
+def test_validate_sales_files_keeps_only_valid_files(sales_record, write_sales_csv):
+    good = write_sales_csv([sales_record("IN-1")], name="good.csv")
+    bad = write_sales_csv([sales_record("IN-2", Order_ID=None)], name="bad.csv")
+
+    (names, dirs, paths), verdicts = validate_sales_files(
+        ["good.csv", "bad.csv"], ["source=IN/format=csv"] * 2, [good, bad], max_workers=1)
+
+    assert (names, dirs, paths) == (["good.csv"], ["source=IN/format=csv"], [good])
+    assert [verdict["valid"] for verdict in verdicts] == [True, False]
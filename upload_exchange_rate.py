@@ -1,29 +1,20 @@
-from snowflake.snowpark import Session
+from pipeline_backend import get_snowpark_session
 import logging
 import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%I:%M:%S')
 
-def get_snowpark_session() -> Session:
-    connection_parameters = {
-        "ACCOUNT": "QNNERMQ-RZ07987",
-        "USER": "snowpark_user",
-        "PASSWORD": os.getenv("SNOWFLAKE_PASSWORD", "YOUR_PASSWORD_HERE"),
-        "ROLE": "SYSADMIN",
-        "DATABASE": "sales_dwh",
-        "WAREHOUSE": "SNOWPARK_ETL_WH"
-    }
-    return Session.builder.configs(connection_parameters).create()
+EXCHANGE_RATE_FILE = '/Users/kshitijkharche/Desktop/snowpark-e2e/end2end-sample-data/exchange-rate-data.csv'
 
-def main():
-    local_file = '/Users/kshitijkharche/Desktop/snowpark-e2e/end2end-sample-data/exchange-rate-data.csv'
-    
+def main(local_file=EXCHANGE_RATE_FILE, session=None):
     if not os.path.exists(local_file):
         logging.error(f"File not found: {local_file}")
-        return
-    
-    session = get_snowpark_session()
-    
+        return None
+
+    # A session passed in (e.g. the orchestrator's) is left open for the next stage
+    owns_session = session is None
+    session = session or get_snowpark_session()
+
     try:
         logging.info("Uploading exchange rate file to Snowflake stage...")
         put_result = session.file.put(
@@ -35,11 +26,14 @@ def main():
         )
         logging.info(f"✓ Upload status: {put_result[0].status}")
         logging.info("✓ Exchange rate file uploaded successfully!")
+        return put_result[0].status
     except Exception as e:
         logging.error(f"❌ Error: {str(e)}")
+        raise
     finally:
-        session.close()
-        logging.info("Session closed")
+        if owns_session:
+            session.close()
+            logging.info("Session closed")
 
 if __name__ == '__main__':
     main()